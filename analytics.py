@@ -0,0 +1,148 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+# --- 結果タブ用の集計 (サマリー / 勝ちパターン / ギャップ / VWAP / 時間) ---
+# res_df 全体に対して一度だけ、ギャップ幅・VWAP乖離・時間帯などの区分を配列で求め、
+# (銘柄, 区分) ごとの トレード数・勝率・平均損益 を groupby 1回ずつで集計する。
+# 各タブはこの結果を銘柄ごとに取り出して表示するだけ (UI 側では frame_fingerprint をキーにキャッシュ)。
+# 区分は従来の pd.cut と同じ (銘柄ごとの最小/最大から作る右閉区間で、下端ちょうどの値は対象外)。
+
+GAP_STEP = 0.5           # ギャップ幅の区切り (%)
+VWAP_STEP = 0.2          # VWAP乖離の区切り (%)
+GAP_DEFAULT = (-3.0, 1.0)
+VWAP_DEFAULT = (-1.0, 1.0)
+
+
+def frame_fingerprint(df):
+    """DataFrame の中身 (列名・インデックス・値) のハッシュ。"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\x1f".join(map(str, df.columns)).encode())
+    if len(df): h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+# pd.cut の区間ラベルと同じ丸め (有効桁 precision=3)
+def _round_frac(x, precision=3):
+    if not np.isfinite(x) or x == 0: return x
+    frac, whole = np.modf(x)
+    digits = -int(np.floor(np.log10(abs(frac)))) - 1 + precision if whole == 0 else precision
+    return np.around(x, digits)
+
+
+def _bins(codes, x, step, edges_fn, default):
+    """銘柄ごとに区切りを作り、各行の区間番号 (対象外は -1) と左端・右端を返す。"""
+    b = np.full(len(x), -1); left = np.full(len(x), np.nan); right = np.full(len(x), np.nan)
+    for k in np.unique(codes):
+        m = np.flatnonzero(codes == k); xs = x[m]
+        fin = xs[~np.isnan(xs)]
+        lo, hi = edges_fn(fin.min(), fin.max()) if fin.size else default
+        if not (np.isfinite(lo) and np.isfinite(hi)): continue   # inf を含む場合は区分なし
+        edges = np.arange(lo, hi + step, step)
+        ids = np.searchsorted(edges, xs, side='left')
+        ok = ~np.isnan(xs) & (ids > 0) & (ids < len(edges))
+        lab = np.array([_round_frac(e) for e in edges])
+        b[m[ok]] = ids[ok] - 1; left[m[ok]] = lab[ids[ok] - 1]; right[m[ok]] = lab[ids[ok]]
+    return b, left, right
+
+
+def _bucket_stats(df, key, extra=()):
+    """(銘柄, key) ごとの トレード数 (PnL の非NaN数)・勝率 (NaN も分母)・平均損益。"""
+    df = df[df[key] != -1] if df[key].dtype.kind in 'if' else df
+    agg = {'Count': ('PnL', 'count'), 'WinRate': ('Win', 'mean'), 'AvgPnL': ('PnL', 'mean')}
+    agg.update({c: (c, 'first') for c in extra})
+    return df.groupby(['Ticker', key], observed=True, sort=True).agg(**agg).reset_index()
+
+
+def _split(tbl):
+    """(銘柄, 区分) 順に並んだ表を銘柄ごとの表に分ける (行の切り出しだけで再集計はしない)。"""
+    tk = tbl['Ticker'].to_numpy()
+    if not len(tk): return {}
+    cut = np.flatnonzero(tk[1:] != tk[:-1]) + 1
+    return {tk[a]: tbl.iloc[a:b].reset_index(drop=True) for a, b in zip(np.r_[0, cut], np.r_[cut, len(tk)])}
+
+
+# 銘柄ごとに勝率が最も高い区分の行 (同率なら先頭) → {銘柄: 行番号}
+def _argmax_by_ticker(tbl):
+    valid = tbl[(tbl['Count'] >= 1) & tbl['WinRate'].notna()]
+    if valid.empty: return {}
+    return valid.groupby('Ticker', observed=True, sort=False)['WinRate'].idxmax().to_dict()
+
+
+def _ticker_summary(work):
+    """銘柄ごとの 回数・勝率・利益平均・損失平均・PF (損失なしは inf)・期待値。"""
+    g = work.groupby('Ticker', observed=True, sort=False)
+    s = g.agg(回数=('PnL', 'size'), 勝数=('Win', 'sum'), 利益平均=('WinPnL', 'mean'), 損失平均=('LossPnL', 'mean'),
+              総利益=('WinPnL', 'sum'), 総損失=('LossPnL', 'sum'), 損失数=('LossPnL', 'count'), 期待値=('PnL', 'mean'))
+    s['勝率'] = s['勝数'] / s['回数']
+    s['利益平均'] = s['利益平均'].fillna(0); s['損失平均'] = s['損失平均'].fillna(0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s['PF'] = np.where((s['損失数'] > 0) & (s['総損失'] != 0), s['総利益'] / s['総損失'].abs(), np.inf)
+    return s[['回数', '勝率', '利益平均', '損失平均', 'PF', '期待値']]
+
+
+def compute_analytics(res_df):
+    """
+    res_df (トレード一覧) から全タブの集計を作る。
+    戻り値: {'tickers': 登場順の銘柄, 'overall': 全体の指標, 'summary': 銘柄ごとの集計 (DataFrame),
+             'by_ticker': {銘柄: {'pattern', 'gap_dir', 'gap_range', 'vwap_range', 'time' (各 DataFrame), 'best' (dict or None)}}}
+    区分の表は Label (表示用の区分名) / Count / WinRate / AvgPnL 列を持つ。
+    """
+    if res_df.empty or 'Ticker' not in res_df.columns:
+        return {'tickers': [], 'overall': None, 'summary': pd.DataFrame(), 'by_ticker': {}}
+    pnl = res_df['PnL'].to_numpy(dtype=np.float64)
+    win = pnl > 0
+    work = pd.DataFrame({'Ticker': res_df['Ticker'].to_numpy(), 'PnL': pnl, 'Win': win,
+                         'WinPnL': np.where(win, pnl, np.nan), 'LossPnL': np.where(pnl <= 0, pnl, np.nan)})
+    tickers = list(pd.unique(work['Ticker']))
+    codes = pd.factorize(work['Ticker'])[0]
+
+    # 全体の指標 (サマリータブ)
+    gross_win = pnl[win].sum(); gross_loss = abs(pnl[pnl <= 0].sum())
+    overall = {'count': len(pnl), 'win_rate': win.mean(), 'pf': gross_win / gross_loss if gross_loss > 0 else float('inf'),
+               'expectancy': res_df['PnL'].mean()}
+
+    # 区分
+    gap = res_df['Gap(%)'].to_numpy(dtype=np.float64)
+    work['Pattern'] = res_df['Pattern'].to_numpy()
+    work['GapDir'] = np.where(gap > 0, 'ギャップアップ', np.where(gap < 0, 'ギャップダウン', 'フラット'))
+    work['GapBin'], work['GapL'], work['GapR'] = _bins(codes, gap, GAP_STEP, lambda lo, hi: (np.floor(lo), np.ceil(hi)), GAP_DEFAULT)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dev = (res_df['In'].to_numpy(dtype=np.float64) - res_df['EntryVWAP'].to_numpy(dtype=np.float64)) / res_df['EntryVWAP'].to_numpy(dtype=np.float64) * 100
+    work['VwapBin'], work['VwapL'], work['VwapR'] = _bins(codes, dev, VWAP_STEP, lambda lo, hi: (np.floor(lo * 2) / 2, np.ceil(hi * 2) / 2), VWAP_DEFAULT)
+    entry = res_df['Entry']
+    work['Minute'] = (entry.dt.hour * 60 + entry.dt.minute).to_numpy()
+
+    pattern = _bucket_stats(work, 'Pattern').rename(columns={'Pattern': 'Label'})
+    gap_dir = _bucket_stats(work, 'GapDir').rename(columns={'GapDir': 'Label'})
+    gap_range = _bucket_stats(work, 'GapBin', ('GapL', 'GapR')).rename(columns={'GapL': 'Left', 'GapR': 'Right'})
+    vwap_range = _bucket_stats(work, 'VwapBin', ('VwapL', 'VwapR')).rename(columns={'VwapL': 'Left', 'VwapR': 'Right'})
+    time_tbl = _bucket_stats(work, 'Minute')
+    for tbl in (gap_range, vwap_range):
+        tbl['Label'] = [f"{l:.1f}% ～ {r:.1f}%" for l, r in zip(tbl['Left'], tbl['Right'])]
+    time_tbl['Label'] = [f"{m // 60:02d}:{m % 60:02d}～{(m + 5) // 60 % 24:02d}:{(m + 5) % 60:02d}" for m in time_tbl['Minute']]
+
+    tables = {'pattern': _split(pattern), 'gap_dir': _split(gap_dir), 'gap_range': _split(gap_range),
+              'vwap_range': _split(vwap_range), 'time': _split(time_tbl)}
+    empty = pd.DataFrame(columns=['Label', 'Count', 'WinRate', 'AvgPnL'])
+    by_ticker = {t: {name: tb.get(t, empty) for name, tb in tables.items()} for t in tickers}
+
+    # 勝ちパターンタブ: ギャップ幅・VWAP乖離・時間帯のそれぞれで勝率が最も高い区分
+    g_best, v_best, t_best = _argmax_by_ticker(gap_range), _argmax_by_ticker(vwap_range), _argmax_by_ticker(time_tbl)
+    for t in tickers:
+        if t not in g_best or t not in v_best or t not in t_best: by_ticker[t]['best'] = None; continue
+        g, v, tm = gap_range.loc[g_best[t]], vwap_range.loc[v_best[t]], time_tbl.loc[t_best[t]]
+        by_ticker[t]['best'] = {'gap_left': g['Left'], 'gap_right': g['Right'], 'gap_win': g['WinRate'],
+                                'vwap_left': v['Left'], 'vwap_right': v['Right'], 'vwap_win': v['WinRate'],
+                                'time': tm['Label'], 'time_win': tm['WinRate']}
+    return {'tickers': tickers, 'overall': overall, 'summary': _ticker_summary(work), 'by_ticker': by_ticker}
+
+
+def display_table(tbl, label_name):
+    """区分の表を表示用の文字列の表にする (区分名 / トレード数 / 勝率 / 平均損益)。"""
+    return pd.DataFrame({
+        label_name: tbl['Label'].astype(str).to_numpy(),
+        'トレード数': tbl['Count'].astype(str).to_numpy(),
+        '勝率': [f"{x:.1%}" for x in tbl['WinRate']],
+        '平均損益': [f"{x:+.2%}" for x in tbl['AvgPnL']],
+    })
@@ -1,69 +1,30 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import numpy as np
-from ta.trend import EMAIndicator, MACD
-from ta.momentum import RSIIndicator
 from datetime import datetime, timedelta, time
+from time import monotonic
+import os
+import json
+import threading
+from contextlib import contextmanager
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import market_data
+from universe import TICKER_NAME_MAP, get_ticker_name
+from ranking import run_backtest, scan_ranking, load_bars, rank_frame, TopK
+from report import build_summary_report, log_order, filter_trades, iter_trade_log
+from trade_export import downloads
+from fetch_pipeline import summarize_timings
+from analytics import compute_analytics, display_table
+from sweep import run_sweep, parse_grid, parse_time_grid, flags_to_mask, ALL_MASKS
+from walk_forward import run_walk_forward
+from exit_surface import record_paths, exit_surface, surface_slice, EXIT_KEYS
+from robustness import bootstrap_trades, display_ci, DEFAULT_RESAMPLES
+import diagnostics
+from result_store import SessionResults, CompactFrame, SWEEP_FLOAT32_COLS, TRADE_FLOAT32_COLS
 
 # --- ページ設定 ---
 st.set_page_config(page_title="BACK TESTER", page_icon="image_10.png", layout="wide")
 st.logo("image_11.png", icon_image="image_10.png")
 
-# --- 銘柄名マッピング (日経225 + 追加6銘柄 = 全231銘柄) ---
-TICKER_NAME_MAP = {
-    # 水産・食品
-    "1332.T": "ニッスイ", "2002.T": "日清粉G", "2269.T": "明治HD", "2282.T": "日本ハム", "2501.T": "サッポロHD",
-    "2502.T": "アサヒG", "2503.T": "キリンHD", "2801.T": "キッコーマン", "2802.T": "味の素", "2871.T": "ニチレイ", "2914.T": "JT",
-    # 繊維・化学
-    "3101.T": "東洋紡", "3103.T": "ユニチカ", "3401.T": "帝人", "3402.T": "東レ", "3405.T": "クラレ", "3407.T": "旭化成", "3861.T": "王子HD", "3863.T": "日本製紙",
-    "4004.T": "レゾナック", "4005.T": "住友化学", "4021.T": "日産化学", "4042.T": "東ソー", "4043.T": "トクヤマ",
-    "4061.T": "デンカ", "4063.T": "信越化学", "4151.T": "協和キリン", "4183.T": "三井化学", "4188.T": "三菱ケミＧ",
-    "4208.T": "ＵＢＥ", "4452.T": "花王", "4901.T": "富士フイルム", "4911.T": "資生堂",
-    "4502.T": "武田薬品", "4503.T": "アステラス製薬", "4506.T": "住友ファーマ", "4507.T": "塩野義製薬", "4519.T": "中外製薬",
-    "4523.T": "エーザイ", "4543.T": "テルモ", "4568.T": "第一三共", "4578.T": "大塚ＨＤ",
-    # 石油・ゴム・金属
-    "1605.T": "ＩＮＰＥＸ", "5019.T": "出光興産", "5020.T": "ＥＮＥＯＳ", "5101.T": "横浜ゴム", "5108.T": "ブリヂストン",
-    "5201.T": "ＡＧＣ", "5202.T": "日本板硝子", "5214.T": "日電硝", "5232.T": "住友大阪セメント", "5233.T": "太平洋セメント", "5301.T": "東海カーボン",
-    "5332.T": "ＴＯＴＯ", "5333.T": "日本碍子", "5401.T": "日本製鉄", "5406.T": "神戸製鋼所", "5411.T": "ＪＦＥ",
-    "5541.T": "大平洋金属", "5631.T": "日本製鋼所", "5706.T": "三井金属", "5711.T": "三菱マテリアル", "5713.T": "住友金属鉱山",
-    "5714.T": "ＤＯＷＡ", "5801.T": "古河電気工業", "5802.T": "住友電気工業", "5803.T": "フジクラ", "5947.T": "リンナイ",
-    # 機械・電機
-    "6098.T": "リクルート", "6103.T": "オークマ", "6113.T": "アマダ", "6146.T": "ディスコ", "6273.T": "ＳＭＣ",
-    "6301.T": "小松製作所", "6302.T": "住友重機械", "6305.T": "日立建機", "6326.T": "クボタ", "6361.T": "荏原製作所",
-    "6367.T": "ダイキン工業", "6471.T": "日本精工", "6472.T": "ＮＴＮ", "6473.T": "ジェイテクト", "6479.T": "ミネベアミツミ",
-    "6501.T": "日立", "6503.T": "三菱電機", "6504.T": "富士電機", "6506.T": "安川電機", "6526.T": "ソシオネクスト", "6594.T": "ニデック",
-    "6645.T": "オムロン", "6701.T": "日本電気", "6702.T": "富士通", "6723.T": "ルネサス", "6724.T": "セイコーエプソン",
-    "6752.T": "パナソニック", "6753.T": "シャープ", "6758.T": "ソニーグループ", "6762.T": "ＴＤＫ", "6770.T": "アルプスアルパイン",
-    "6841.T": "横河電機", "6857.T": "アドバンテスト", "6861.T": "キーエンス", "6902.T": "デンソー", "6920.T": "レーザーテック", "6952.T": "カシオ",
-    "6954.T": "ファナック", "6971.T": "京セラ", "6976.T": "太陽誘電", "6981.T": "村田製作所", "6988.T": "日東電工", "7735.T": "SCREEN",
-    # 輸送・精密
-    "4902.T": "コニカミノル", "7011.T": "三菱重工業", "7012.T": "川崎重工業", "7013.T": "ＩＨＩ", "7186.T": "横浜ＦＧ", "7201.T": "日産自動車",
-    "7202.T": "いすゞ自動車", "7203.T": "トヨタ自動車", "7205.T": "日野自動車", "7211.T": "三菱自動車工業", "7261.T": "マツダ",
-    "7267.T": "本田技研工業", "7269.T": "スズキ", "7270.T": "ＳＵＢＡＲＵ", "7272.T": "ヤマハ発動機",
-    "7731.T": "ニコン", "7733.T": "オリンパス", "7741.T": "ＨＯＹＡ", "7751.T": "キヤノン", "7752.T": "リコー", "7762.T": "シチズン時計",
-    # 商社・金融・不動産・サービス・通信
-    "1721.T": "コムシスHD", "1801.T": "大成建設", "1802.T": "大林組", "1803.T": "清水建設", "1808.T": "長谷工", "1812.T": "鹿島建設",
-    "1925.T": "大和ハウス", "1928.T": "積水ハウス", "1963.T": "日揮HD", "3064.T": "モノタロウ", "3086.T": "Ｊフロント", "3092.T": "ＺＯＺＯ", 
-    "3099.T": "三越伊勢丹", "3289.T": "東急不動産", "3382.T": "セブン＆アイ", "3659.T": "ネクソン", "4385.T": "メルカリ", "6178.T": "日本郵政", 
-    "7974.T": "任天堂", "8001.T": "伊藤忠", "8002.T": "丸紅", "8015.T": "豊田通商",
-    "8031.T": "三井物産", "8035.T": "東京エレクトロン", "8053.T": "住友商事", "8058.T": "三菱商事", "8233.T": "高島屋", "8252.T": "丸井グループ",
-    "8253.T": "クレディセゾン", "8267.T": "イオン", "8304.T": "あおぞら銀行", "8306.T": "三菱ＵＦＪ", "8308.T": "りそなＨＤ",
-    "8309.T": "三井住友トラスト", "8316.T": "三井住友ＦＧ", "8331.T": "千葉銀行", "8354.T": "ふくおかＦＧ", "8411.T": "みずほＦＧ",
-    "8591.T": "オリックス", "8601.T": "大和証券Ｇ", "8604.T": "野村ＨＤ", "8630.T": "ＳＯＭＰＯ", "8725.T": "ＭＳ＆ＡＤ",
-    "8750.T": "第一生命ＨＤ", "8766.T": "東京海上", "8795.T": "Ｔ＆Ｄ", "8801.T": "三井不動産", "8802.T": "三菱地所", "8804.T": "東京建物",
-    "8830.T": "住友不動産", "2413.T": "エムスリー", "2432.T": "ディーエヌエー", "4307.T": "野村総研", "4324.T": "電通グループ",
-    "4661.T": "ＯＬＣ", "4689.T": "ラインヤフー", "4704.T": "トレンド", "4751.T": "サイバーエージェント", "4755.T": "楽天グループ",
-    "9001.T": "東武鉄道", "9005.T": "東急", "9007.T": "小田急電鉄", "9008.T": "京王電鉄", "9009.T": "京成電鉄", "9020.T": "ＪＲ東日本",
-    "9021.T": "ＪＲ西日本", "9022.T": "ＪＲ東海", "9101.T": "日本郵船", "9104.T": "商船三井", "9107.T": "川崎汽船", "9201.T": "日本航空",
-    "9202.T": "ＡＮＡ", "9301.T": "三菱倉庫", "9432.T": "ＮＴＴ", "9433.T": "ＫＤＤＩ", "9434.T": "ソフトバンク", "9501.T": "東電ＨＤ",
-    "9502.T": "中部電力", "9503.T": "関西電力", "9531.T": "東京瓦斯", "9532.T": "大阪瓦斯", "9602.T": "東宝", "9735.T": "セコム",
-    "9766.T": "コナミＧ", "9843.T": "ニトリＨＤ", "9983.T": "ファーストリテイリング", "9984.T": "ソフトバンクグループ", "4062.T": "イビデン",
-    "3697.T": "ＳＨＩＦＴ", "6532.T": "ベイカレント", "9613.T": "ＮＴＴデータ", "6963.T": "ローム", "2768.T": "双日", "5831.T": "しずおかＦＧ",
-    # 追加銘柄 (日経225外の銘柄を含む、ユーザー指定の6銘柄)
-    "4403.T": "日油", "6315.T": "TOWA", "3436.T": "SUMCO", "7003.T": "三井E&S", "1570.T": "日経レバ", "7453.T": "良品計画",
-}
-
 # CSS (左揃え・テーブル調整)
 st.markdown("""
     <style>
@@ -137,104 +98,62 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# --- 基本関数 ---
-def get_trade_pattern(row, gap_pct):
-    check_vwap = row['VWAP'] if pd.notna(row['VWAP']) else row['Close']
-    if (gap_pct <= -0.004) and (row['Close'] > check_vwap): return "A：反転狙い"
-    elif (-0.003 <= gap_pct < 0.003) and (row['Close'] > row['EMA5']): return "D：上昇継続"
-    elif (gap_pct >= 0.005) and (row.get('RSI14', 50) >= 65): return "C：ブレイク"
-    elif (gap_pct >= 0.003) and (row['Close'] > row['EMA5']): return "B：押目上昇"
-    return "E：他タイプ"
-
-# データ取得（5分足）
-@st.cache_data(ttl=600)
-def fetch_intraday(ticker, start, end):
-    try:
-        df = yf.download(ticker, start=start, end=datetime.now(), interval="5m", progress=False, multi_level_index=False, auto_adjust=False)
-        return df
-    except: return pd.DataFrame()
-
-# ATR算出ロジックを含む関数
-@st.cache_data(ttl=3600)
-def fetch_daily_stats_maps(ticker, start):
-    p_map, o_map, a_map = {}, {}, {}
-    try:
-        d_start = start - timedelta(days=60)
-        df = yf.download(ticker, start=d_start, end=datetime.now(), interval="1d", progress=False, multi_level_index=False, auto_adjust=False)
-        if df.empty: return p_map, o_map, a_map
-        if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-        df.index = df.index.tz_localize('UTC').tz_convert('Asia/Tokyo') if df.index.tzinfo is None else df.index.tz_convert('Asia/Tokyo')
-        tr = pd.concat([df['High']-df['Low'], abs(df['High']-df['Close'].shift(1)), abs(df['Low']-df['Close'].shift(1))], axis=1).max(axis=1)
-        atr_prev = tr.rolling(window=14).mean().shift(1)
-        p_map = {d.strftime('%Y-%m-%d'): c for d, c in zip(df.index, df['Close'].shift(1)) if pd.notna(c)}
-        o_map = {d.strftime('%Y-%m-%d'): o for d, o in zip(df.index, df['Open']) if pd.notna(o)}
-        a_map = {d.strftime('%Y-%m-%d'): a for d, a in zip(df.index, atr_prev) if pd.notna(a)}
-        return p_map, o_map, a_map
-    except: return p_map, o_map, a_map
+# --- データ取得 (market_data の関数を Streamlit のキャッシュで包む。診断モードではヒット / ミスを数える) ---
+fetch_intraday = diagnostics.counted_cache("fetch_intraday", st.cache_data(ttl=600), market_data.fetch_intraday)
+fetch_daily_stats_maps = diagnostics.counted_cache("fetch_daily_stats_maps", st.cache_data(ttl=3600), market_data.fetch_daily_stats_maps)
+fetch_daily_bars = diagnostics.counted_cache("fetch_daily_bars", st.cache_data(ttl=3600), market_data.fetch_daily_bars)
 
 # 銘柄名取得（辞書優先）
-@st.cache_data(ttl=86400)
-def get_ticker_name(ticker):
-    return TICKER_NAME_MAP.get(ticker, ticker)
-
-# --- シミュレーション・コアロジック (個別・ランキング共通) ---
-def run_ticker_simulation(ticker, df, pc_map, co_map, a_map, params):
-    trades = []
-    if df.empty: return trades
-    if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-    df = df[['Open', 'High', 'Low', 'Close', 'Volume']].copy()
-    df.index = df.index.tz_localize('UTC').tz_convert('Asia/Tokyo') if df.index.tzinfo is None else df.index.tz_convert('Asia/Tokyo')
-    
-    df['EMA5'] = EMAIndicator(close=df['Close'], window=5).ema_indicator()
-    df['RSI14'] = RSIIndicator(close=df['Close'], window=14).rsi()
-    df['RSI14_P'] = df['RSI14'].shift(1)
-    macd = MACD(close=df['Close'])
-    df['MH'] = macd.macd_diff(); df['MH_P'] = df['MH'].shift(1)
-    
-    unique_dates = np.unique(df.index.date)
-    for d in unique_dates:
-        day = df[df.index.date == d].copy().between_time('09:00', '15:00')
-        if day.empty: continue
-        day['VWAP'] = (day['Close'] * day['Volume']).cumsum() / day['Volume'].cumsum().replace(0, np.nan)
-        date_str = d.strftime('%Y-%m-%d')
-        pc = pc_map.get(date_str); do = co_map.get(date_str)
-        if pc is None or do is None: continue
-        gap_v = (do - pc) / pc
-        
-        in_pos = False; entry_p = 0; stop_p = 0; t_high = 0; t_active = False; sl_rec = 0
-        for ts, row in day.iterrows():
-            if not in_pos:
-                if params['start_t'] <= ts.time() <= params['end_t'] and params['g_min'] <= gap_v <= params['g_max']:
-                    c_vwap = (row['Close'] > row['VWAP']) if params['u_vwap'] else True
-                    c_ema = (row['Close'] > row['EMA5']) if params['u_ema'] else True
-                    c_rsi = (row['RSI14'] > 45 and row['RSI14'] > row['RSI14_P']) if params['u_rsi'] else True
-                    c_macd = (row['MH'] > row['MH_P']) if params['u_macd'] else True
-                    
-                    if c_vwap and c_ema and c_rsi and c_macd:
-                        entry_p = row['Close'] * 1.0003; in_pos = True; entry_t = ts; entry_vwap = row['VWAP']
-                        # ATR損切り計算
-                        if params['u_atr']:
-                            av = a_map.get(date_str)
-                            sl_rec = max(params['atr_min'], (av/entry_p)*params['atr_mul']) if av and entry_p>0 else abs(params['sl_fix'])
-                        else: sl_rec = abs(params['sl_fix'])
-                        stop_p = entry_p * (1 - sl_rec); t_high = row['High']; t_active = False
-            else:
-                t_high = max(t_high, row['High'])
-                if not t_active and t_high >= entry_p * (1 + params['ts_start']): t_active = True
-                ex_p = None; rsn = ""
-                if t_active and row['Low'] <= t_high * (1 - params['ts_width']):
-                    ex_p = t_high * (1 - params['ts_width']) * 0.9997; rsn = "トレーリング"
-                elif row['Low'] <= stop_p: ex_p = stop_p * 0.9997; rsn = "損切り"
-                elif ts.time() >= time(14, 55): ex_p = row['Close'] * 0.9997; rsn = "時間切れ"
-                
-                if ex_p:
-                    trades.append({'Ticker': ticker, 'Entry': entry_t, 'Exit': ts, 'PnL': (ex_p - entry_p)/entry_p, 'In': entry_p, 'Out': ex_p, 'Reason': rsn, 'Pattern': get_trade_pattern(row, gap_v), 'Gap(%)': gap_v*100, 'EntryVWAP': entry_vwap, 'PrevClose': pc, 'DayOpen': do, 'SL設定(%)': sl_rec*100})
-                    in_pos = False; break
-    return trades
+get_ticker_name = diagnostics.counted_cache("get_ticker_name", st.cache_data(ttl=86400), get_ticker_name)
+
+# 並行取得のスレッドにもこのセッションのコンテキストを引き継ぐ (スレッド内の st.cache_data 用)
+_script_ctx = get_script_run_ctx()
+def _attach_script_ctx(): add_script_run_ctx(threading.current_thread(), _script_ctx)
+
+# 結果タブの集計 (結果セットの中身のハッシュをキーにキャッシュ。タブ切替などの再実行では再計算しない)
+# _res は保存済みの結果セット (CompactFrame)。DataFrame に戻すのはキャッシュにない場合だけ
+def get_analytics(fingerprint, _res):
+    return compute_analytics(_res.frame())
+get_analytics = diagnostics.counted_cache("get_analytics", st.cache_data(max_entries=8, show_spinner=False), get_analytics)
+
+def get_robustness(fingerprint, _res):
+    return bootstrap_trades(_res.frame())
+get_robustness = diagnostics.counted_cache("get_robustness", st.cache_data(max_entries=8, show_spinner=False), get_robustness)
+
+# テキストレポート (サマリー / 詳細ログのコピー用。トレードが多いと組み立てに時間がかかるので結果ごとに1回だけ)
+def get_summary_report(fingerprint, _summary, ticker_names, s_date, e_date):
+    return build_summary_report(_summary, ticker_names, s_date, e_date)
+get_summary_report = diagnostics.counted_cache("get_summary_report", st.cache_data(max_entries=8, show_spinner=False), get_summary_report)
+
+# 詳細ログ: 絞り込みの選択肢と、条件に合う行の位置 (ログの並び順)。表示するページの行だけを結果セットから戻して整形する
+LOG_KEY_COLS = ['Ticker', 'Entry', 'Reason']
+def get_log_options(fingerprint, _res):
+    keys = _res.frame(columns=LOG_KEY_COLS)
+    day = keys['Entry'].dt.date
+    return list(keys['Ticker'].unique()), day.min(), day.max(), list(keys['Reason'].unique())
+get_log_options = diagnostics.counted_cache("get_log_options", st.cache_data(max_entries=8, show_spinner=False), get_log_options)
+
+def get_log_rows(fingerprint, _res, tickers, date_range, reasons):
+    keys = _res.frame(columns=LOG_KEY_COLS)
+    order = log_order(keys)
+    return order[filter_trades(keys, tickers, date_range, reasons)[order]]
+get_log_rows = diagnostics.counted_cache("get_log_rows", st.cache_data(max_entries=16, show_spinner=False), get_log_rows)
+LOG_PAGE_SIZES = [50, 100, 200, 500]
+# 決済ルールの応答曲面 (記録したエントリー後の値動きのキー + 決済パラメータの格子でキャッシュ)
+def get_exit_surface(recorded, grid_items, _paths, u_atr):
+    return exit_surface(_paths, dict(grid_items), u_atr)
+get_exit_surface = diagnostics.counted_cache("get_exit_surface", st.cache_data(max_entries=16, show_spinner=False), get_exit_surface)
+
+# このセッションの結果セット (省メモリ形式。同じ中身の結果は他のセッションと共有し、上限を超えたら古いものから破棄)
+results = st.session_state.setdefault('results', SessionResults())
+
+# 結果表示タブ (key="result_tab" の値はタブ名)
+RESULT_TABS = ["📊 サマリー", "🏅 勝ちパターン", "📉 ギャップ分析", "🧐 VWAP分析", "🕒 時間分析", "📝 詳細ログ", "🏆 ランキング"]
+RANK_TAB = RESULT_TABS[6]
 
 # --- UI サイドバー ---
 st.sidebar.header("⚙️ パラメーター設定")
-days_back = st.sidebar.slider("過去何日分を取得", 10, 59, 59)
+days_back = st.sidebar.slider("過去何日分を取得", 10, 365, 59, help="60日より前の5分足は、保存済みデータ (過去に取得した分) がある範囲のみ使用されます")
 st.sidebar.subheader("⏰ 時間設定")
 s_t = st.sidebar.time_input("開始時間", time(9, 0), step=300)
 e_t = st.sidebar.time_input("終了時間", time(9, 15), step=300)
@@ -265,10 +184,28 @@ st.sidebar.divider()
 st.sidebar.subheader("🔍 ランキング検索条件")
 p_range = st.sidebar.slider("株価範囲 (円)", 0, 20000, (500, 5000), 500)
 p_min, p_max = p_range
+rank_workers = st.sidebar.number_input("並列ワーカー数 (1 = 逐次)", 1, os.cpu_count() or 1, 1, 1,
+                                       help="2 以上でプロセス並列 (初回はワーカーの起動に時間がかかるので、銘柄数の多いスキャン向け。ワーカーは次のスキャンでも使い回し、計算済みの日を再利用します)")
+rank_panel = st.sidebar.checkbox("パネルで一括計算", value=False, help="全銘柄の取得後に 銘柄 × 日 × 時間枠 の配列でまとめて判定します (ワーカー数は使いません。結果は同じ)")
+fetch_conc = st.sidebar.number_input("同時取得数", 1, 16, 4, 1, help="データ取得を同時にいくつまで実行するか (取得待ちの間に、届いた銘柄の計算を進めます)")
+
+# --- 🩺 診断モード (段階ごとの処理時間・キャッシュのヒット数を『🩺 診断』タブと .diagnostics/ の JSON Lines に記録) ---
+diag_on = st.sidebar.checkbox("🩺 診断モード", value=False, key="diag_on", help="取得・インジケーター・日分割・シミュレーション・表示などの段階ごとの時間を記録します")
+diag_prof = st.sidebar.checkbox("サンプリングプロファイルも採取", value=False, key="diag_prof", disabled=not diag_on,
+                                help="全スレッドのスタックを 5ms ごとに採取し、folded 形式 (flamegraph.pl / speedscope 用) で保存します")
+# 表示の時間は直近の実行の記録に加算する (再実行のたび)
+diagnostics.bind(st.session_state.get('diag') if diag_on else None)
+
+@contextmanager
+def _diagnosed(label):
+    if not diag_on: yield; return
+    with diagnostics.diagnosed(label, profile=diag_prof) as rec: yield
+    st.session_state['diag'] = rec; diagnostics.bind(rec)
 
 # ★サイドバーのボタン
 if st.sidebar.button("ランキング生成", type="primary", use_container_width=True, key="side_rank_btn"):
     st.session_state['trigger_rank_scan'] = True
+    st.session_state['result_tab'] = RANK_TAB   # スキャンはランキングタブの中で実行する
     st.rerun()
 
 # パラメータ辞書の更新 (株価フィルター用の値を追加)
@@ -282,551 +219,566 @@ params = {
 ticker_input = st.text_input("銘柄コード (カンマ区切り)", "8267.T")
 tickers = [t.strip() for t in ticker_input.split(",") if t.strip()]
 if st.button("バックテスト実行", type="primary", key="main_btn"):
-    end_date = datetime.now(); start_date = end_date - timedelta(days=days_back); all_trades = []
-    pb = st.progress(0); st_text = st.empty(); t_names = {}
-    for i, t in enumerate(tickers):
-        st_text.text(f"Testing {t}..."); pb.progress((i+1)/len(tickers))
-        df = fetch_intraday(t, start_date, end_date)
-        p_map, o_map, a_map = fetch_daily_stats_maps(t, start_date)
-        all_trades.extend(run_ticker_simulation(t, df, p_map, o_map, a_map, params))
-        t_names[t] = get_ticker_name(t)
+    end_date = datetime.now(); start_date = end_date - timedelta(days=days_back)
+    pb = st.progress(0); st_text = st.empty()
+    def _progress(label, frac): st_text.text(label); pb.progress(frac)
+    timings = []; errors = []; memo = {}
+    with _diagnosed("backtest"):
+        res_df = run_backtest(tickers, start_date, end_date, params, fetch_intraday, fetch_daily_stats_maps, progress=_progress,
+                              concurrency=fetch_conc, thread_initializer=_attach_script_ctx, timings_out=timings, errors_out=errors, memo_out=memo)
     pb.empty(); st_text.empty()
-    st.session_state['res_df'] = pd.DataFrame(all_trades)
+    st.session_state['fetch_timings'] = {**summarize_timings(timings), **memo}
+    st.session_state['fetch_errors'] = [(e.ticker, e.message) for e in errors]
+    results.put('res_df', res_df, TRADE_FLOAT32_COLS)
     st.session_state['start_date'] = start_date
     st.session_state['end_date'] = end_date # ★修正：end_dateを保存
-    st.session_state['t_names'] = t_names
+    st.session_state['t_names'] = {t: get_ticker_name(t) for t in tickers}
+    st.session_state['result_tab'] = RESULT_TABS[0]
+
+# 直近の取得・計算の所要時間 (銘柄ごとの合計。取得待ち = 計算側がデータの到着を待った時間) と日ごとの結果の再利用数
+if 'fetch_timings' in st.session_state:
+    ft = st.session_state['fetch_timings']
+    st.caption(f"⏱ {ft['items']} 銘柄｜取得 {ft['fetch']:.1f} 秒 (並行) / 取得待ち {ft['wait']:.1f} 秒 / 計算 {ft['compute']:.1f} 秒"
+               f"｜日ごとの結果: 再利用 {ft.get('reused', 0)} / 計算 {ft.get('computed', 0)} 日")
+# セッションのメモリ上限で破棄した結果セット
+if results.evicted:
+    st.caption(f"🧹 メモリ上限 ({results.max_bytes / 1024**2:.0f} MB) を超えたため、古い結果を破棄しました: {', '.join(results.evicted)}")
+    results.evicted.clear()
+# 取得に失敗した銘柄 (データなしとは区別して表示。失敗はキャッシュされないので再実行で取り直す)
+def _show_fetch_errors(errors=None):
+    if errors is not None: st.session_state['fetch_errors'] = [(e.ticker, e.message) for e in errors]
+    errs = st.session_state.get('fetch_errors')
+    if errs: st.warning(f"⚠️ {len(errs)} 銘柄のデータ取得に失敗しました (結果から除外しています)\n\n" + "\n".join(f"- {t}: {msg}" for t, msg in errs[:20]))
+_show_fetch_errors()
+
+# --- 🧪 パラメータ探索 (グリッドサーチ) ---
+with st.expander("🧪 パラメータ探索 (グリッドサーチ)"):
+    st.caption("カンマ区切りで値を列挙 (例: 0.3, 0.5) するか、開始:終了:刻み (例: 0.3:1.0:0.1) で範囲を指定します。時間は 09:00-09:30/5 のように指定できます。対象は上の入力欄の銘柄です。")
+    c1, c2 = st.columns(2)
+    sw_start = c1.text_input("開始時間", s_t.strftime('%H:%M'), key="sw_start")
+    sw_end = c2.text_input("終了時間", e_t.strftime('%H:%M'), key="sw_end")
+    sw_masks = st.checkbox("エントリー条件 (VWAP / EMA / RSI / MACD) の on/off 全16通りを試す", value=True, key="sw_masks")
+    c3, c4 = st.columns(2)
+    sw_gmin = c3.text_input("寄付ダウン下限 (%)", f"{g_min*100:g}", key="sw_gmin")
+    sw_gmax = c4.text_input("寄付アップ上限 (%)", f"{g_max*100:g}", key="sw_gmax")
+    c5, c6, c7 = st.columns(3)
+    sw_ts_s = c5.text_input("トレイリング開始 (%)", f"{ts_s*100:g}", key="sw_ts_s")
+    sw_ts_w = c6.text_input("下がったら成行注文 (%)", f"{ts_w*100:g}", key="sw_ts_w")
+    sw_sl = c7.text_input("損切り (%)", f"{sl_f*100:g}", key="sw_sl")
+    c8, c9 = st.columns(2)
+    sw_amul = c8.text_input("ATR倍率", f"{a_mul:g}", key="sw_amul", disabled=not u_atr)
+    sw_amin = c9.text_input("最低損切り (%)", f"{a_min*100:g}", key="sw_amin", disabled=not u_atr)
+
+    # 探索範囲 (書式が正しくなければ None)
+    def _sweep_grid():
+        try:
+            return {
+                'masks': ALL_MASKS if sw_masks else [flags_to_mask(params)],
+                'start_t': parse_time_grid(sw_start), 'end_t': parse_time_grid(sw_end),
+                'g_min': parse_grid(sw_gmin, 0.01), 'g_max': parse_grid(sw_gmax, 0.01),
+                'ts_start': parse_grid(sw_ts_s, 0.01), 'ts_width': parse_grid(sw_ts_w, 0.01), 'sl_fix': parse_grid(sw_sl, 0.01),
+                'atr_mul': parse_grid(sw_amul), 'atr_min': parse_grid(sw_amin, 0.01),
+            }
+        except ValueError:
+            st.error("探索範囲の書式が正しくありません。"); return None
+
+    if st.button("探索実行", key="sweep_btn"):
+        grid = _sweep_grid()
+        if grid:
+            end_date = datetime.now(); start_date = end_date - timedelta(days=days_back); errors = []
+            with _diagnosed("sweep"):
+                with st.spinner("データ取得中..."):
+                    data = load_bars(tickers, start_date, end_date, fetch_intraday, fetch_daily_stats_maps,
+                                     concurrency=fetch_conc, thread_initializer=_attach_script_ctx, errors_out=errors)
+                _show_fetch_errors(errors)
+                with st.spinner("探索中..."), diagnostics.stage("sweep"):
+                    sdf = run_sweep(data, grid, params)
+                    results.put('sweep_df', sdf, SWEEP_FLOAT32_COLS)
+
+    if 'sweep_df' in results:
+        sdf = results.frame('sweep_df')
+        st.caption(f"{len(sdf):,} 通り (期待値順・上位100件)")
+        st.dataframe(
+            sdf.head(100).style.format({
+                'g_min': '{:+.2%}', 'g_max': '{:+.2%}', 'ts_start': '{:.2%}', 'ts_width': '{:.2%}', 'sl_fix': '{:.2%}', 'atr_min': '{:.2%}',
+                '勝率': '{:.1%}', 'PF': '{:.2f}', '期待値': '{:+.3%}'
+            }),
+            use_container_width=True, hide_index=True
+        )
+
+    # --- 決済ルールの応答曲面 (エントリー後の値動きを1回記録し、決済パラメータの格子をまとめて評価) ---
+    st.markdown("##### 🗺 決済ルールの応答曲面")
+    st.caption("エントリー条件はサイドバーの値で固定し、上の トレイリング開始・幅・損切り・ATR倍率・最低損切り の全組み合わせを、"
+               "記録したエントリー後の値動きから一括で評価します。決済の範囲を変えただけなら記録し直す必要はありません。")
+    surf_key = (tuple(tickers), days_back, datetime.now().strftime('%Y-%m-%d'),
+                tuple(params[k] for k in ('start_t', 'end_t', 'u_vwap', 'u_ema', 'u_rsi', 'u_macd', 'g_min', 'g_max')))
+    if st.button("エントリー後の値動きを記録", key="surf_btn"):
+        end_date = datetime.now(); start_date = end_date - timedelta(days=days_back); errors = []
+        with _diagnosed("surface"):
+            with st.spinner("データ取得中..."):
+                data = load_bars(tickers, start_date, end_date, fetch_intraday, fetch_daily_stats_maps,
+                                 concurrency=fetch_conc, thread_initializer=_attach_script_ctx, errors_out=errors)
+            _show_fetch_errors(errors)
+            with st.spinner("記録中..."), diagnostics.stage("record_paths"):
+                paths, off_grid = record_paths(data, params)
+                st.session_state['exit_paths'] = {'key': surf_key, 'paths': paths, 'off_grid': off_grid, 'recorded': datetime.now().isoformat()}
+
+    rec_paths = st.session_state.get('exit_paths')
+    if rec_paths is not None and rec_paths['key'] != surf_key:
+        st.info("銘柄・期間・エントリー条件が記録時と異なります。もう一度記録してください。")
+    elif rec_paths is not None:
+        grid = _sweep_grid()
+        if grid:
+            paths = rec_paths['paths']
+            surf = get_exit_surface(rec_paths['recorded'], tuple((k, tuple(grid[k])) for k in EXIT_KEYS), paths, u_atr)
+            labels = {'ts_start': "トレイリング開始", 'ts_width': "下がったら成行注文", 'sl_fix': "損切り", 'atr_mul': "ATR倍率", 'atr_min': "最低損切り"}
+            fmt = lambda k, v: f"{v:g}" if k == 'atr_mul' else f"{v:.2%}"
+            keys = [k for k in EXIT_KEYS if surf[k].nunique() > 1]
+            keys += [k for k in ('ts_start', 'ts_width') if k not in keys][:max(0, 2 - len(keys))]   # 軸は2つ以上
+            h1, h2, h3 = st.columns(3)
+            x_key = h1.selectbox("横軸", keys, format_func=labels.get, key="surf_x")
+            y_key = h2.selectbox("縦軸", [k for k in keys if k != x_key], format_func=labels.get, key="surf_y")
+            metric = h3.radio("指標", ['期待値', 'PF', '勝率', '回数'], horizontal=True, key="surf_metric")
+            # 残りのパラメータは値を1つ選んで断面を表示
+            rest = [k for k in keys if k not in (x_key, y_key)]
+            fixed = {k: st.select_slider(labels[k], sorted(surf[k].unique()), format_func=lambda v, k=k: fmt(k, v), key=f"surf_fix_{k}") for k in rest}
+            view = surface_slice(surf, fixed).copy()
+            view['x'] = [fmt(x_key, v) for v in view[x_key]]; view['y'] = [fmt(y_key, v) for v in view[y_key]]
+            n_entries = 0 if paths is None else len(paths['e'])
+            st.caption(f"{n_entries:,} エントリー × {len(surf):,} 通り" + (f"｜時間枠に乗らない {len(rec_paths['off_grid'])} 銘柄は除外" if rec_paths['off_grid'] else ""))
+            st.vega_lite_chart(view[['x', 'y', metric, '回数']], {
+                'mark': {'type': 'rect', 'tooltip': True},
+                'encoding': {
+                    'x': {'field': 'x', 'type': 'ordinal', 'title': labels[x_key], 'sort': None},
+                    'y': {'field': 'y', 'type': 'ordinal', 'title': labels[y_key], 'sort': None},
+                    'color': {'field': metric, 'type': 'quantitative', 'scale': {'scheme': 'redyellowgreen', **({'domainMid': 0} if metric == '期待値' else {'domainMid': 1} if metric == 'PF' else {})}},
+                },
+            }, use_container_width=True)
+            best = surf[surf['回数'] > 0].sort_values('期待値', ascending=False).head(5)
+            st.dataframe(best.style.format({'ts_start': '{:.2%}', 'ts_width': '{:.2%}', 'sl_fix': '{:.2%}', 'atr_min': '{:.2%}',
+                                            '勝率': '{:.1%}', 'PF': '{:.2f}', '期待値': '{:+.3%}'}), use_container_width=True, hide_index=True)
+
+    # --- ウォークフォワード検証 (学習期間で最良の組み合わせを選び、直後の検証期間で評価) ---
+    st.markdown("##### 🚶 ウォークフォワード検証")
+    st.caption("上の探索範囲を使い、学習期間で期待値が最も高い組み合わせを選んで直後の検証期間 (サンプル外) の成績を求めます。窓は検証日数ずつずらします。並列数はサイドバーの並列ワーカー数です。")
+    w1, w2, w3 = st.columns(3)
+    wf_train = w1.number_input("学習日数", 5, 250, 20, 1, key="wf_train")
+    wf_test = w2.number_input("検証日数", 1, 60, 5, 1, key="wf_test")
+    wf_min = w3.number_input("学習期間の最低トレード数", 1, 1000, 10, 1, key="wf_min")
+    if st.button("ウォークフォワード実行", key="wf_btn"):
+        grid = _sweep_grid()
+        if grid:
+            end_date = datetime.now(); start_date = end_date - timedelta(days=days_back); errors = []
+            with _diagnosed("walkforward"):
+                with st.spinner("データ取得中..."):
+                    data = load_bars(tickers, start_date, end_date, fetch_intraday, fetch_daily_stats_maps,
+                                     concurrency=fetch_conc, thread_initializer=_attach_script_ctx, errors_out=errors)
+                _show_fetch_errors(errors)
+                with st.spinner("検証中..."), diagnostics.stage("walk_forward"):
+                    try: st.session_state['wf_result'] = run_walk_forward(data, grid, params, wf_train, wf_test, min_trades=wf_min, workers=rank_workers)
+                    except ValueError as e: st.error(str(e))
+
+    if 'wf_result' in st.session_state:
+        wf_df, wf_sum = st.session_state['wf_result']
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("検証トレード数", f"{wf_sum['回数']:,}", help=f"{wf_sum['folds']} fold / {wf_sum['sessions']} 日")
+        c2.metric("検証PF", f"{wf_sum['PF']:.2f}")
+        c3.metric("検証期待値", f"{wf_sum['期待値']:+.3%}")
+        c4.metric("学習期待値 (平均)", f"{wf_sum['学習期待値']:+.3%}")
+        st.dataframe(
+            wf_df.style.format({
+                'g_min': '{:+.2%}', 'g_max': '{:+.2%}', 'ts_start': '{:.2%}', 'ts_width': '{:.2%}', 'sl_fix': '{:.2%}', 'atr_min': '{:.2%}',
+                '学習PF': '{:.2f}', '学習期待値': '{:+.3%}', '検証勝率': '{:.1%}', '検証PF': '{:.2f}', '検証期待値': '{:+.3%}'
+            }, na_rep='-'),
+            use_container_width=True, hide_index=True
+        )
 
     # --- 結果表示タブ ---
 # 個別テスト結果がある、またはランキング結果がある、またはスキャンが指示された場合に表示
-if 'res_df' in st.session_state or 'last_rank_df' in st.session_state or st.session_state.get('trigger_rank_scan', False):
-    # res_df がない場合は空の DataFrame を作成してエラーを回避
-    res_df = st.session_state.get('res_df', pd.DataFrame())
+if 'res_df' in results or 'last_rank_df' in results or 'rank_partial' in st.session_state or st.session_state.get('trigger_rank_scan', False) or (diag_on and 'diag' in st.session_state):
+    # res_df がない場合は空の結果セットを使ってエラーを回避
+    res = results.get('res_df') or CompactFrame(pd.DataFrame())
     start_date = st.session_state.get('start_date', datetime.now() - timedelta(days=days_back))
     end_date = st.session_state.get('end_date', datetime.now())
     ticker_names = st.session_state.get('t_names', {})
-
-    # タブの定義 (v5.9の5つ + ランキング)
-    tab1, tab2, tab3, tab4, tab5, tab6, tab_rank = st.tabs(["📊 サマリー", "🏅 勝ちパターン", "📉 ギャップ分析", "🧐 VWAP分析", "🕒 時間分析", "📝 詳細ログ", "🏆 ランキング"])
-
-    with tab1: # サマリー
-        if not res_df.empty and 'PnL' in res_df.columns:
+    res_fp = res.key
+
+    # タブの定義 (v5.9の5つ + ランキング、診断モードでは + 診断)
+    # 選択中のタブだけ中身を作る (タブの切り替えで再実行。集計・レポートは結果ごとにキャッシュ)
+    tabs = st.tabs(RESULT_TABS + (["🩺 診断"] if diag_on else []), key="result_tab", on_change="rerun")
+    tab1, tab2, tab3, tab4, tab5, tab6, tab_rank = tabs[:7]
+    if any(t.open for t in tabs[:5]):
+        with diagnostics.stage("analytics"): ana = get_analytics(res_fp, res)
+
+    with tab1, diagnostics.stage("render.summary"): # サマリー
+        if tab1.open:
+            if ana['overall'] is not None:
             
-            # 1. 全体集計
-            count_all = len(res_df)
-            wins_all = res_df[res_df['PnL'] > 0]
-            losses_all = res_df[res_df['PnL'] <= 0]
-            win_rate_all = len(wins_all) / count_all if count_all > 0 else 0
-            
-            gross_win = wins_all['PnL'].sum()
-            gross_loss = abs(losses_all['PnL'].sum())
-            pf_all = gross_win / gross_loss if gross_loss > 0 else float('inf')
-            expectancy_all = res_df['PnL'].mean()
-
-            # 2. メトリクス表示
-            st.markdown(f"""
-            <style>
-            .metric-container {{ display: grid; grid-template-columns: 1fr 1fr 1fr 1fr; gap: 10px; margin-bottom: 10px; }}
-            @media (max-width: 640px) {{ .metric-container {{ grid-template-columns: 1fr 1fr; }} }}
-            .metric-box {{ background-color: #262730; padding: 15px; border-radius: 8px; text-align: center; }}
-            .metric-label {{ font-size: 12px; color: #aaaaaa; }}
-            .metric-value {{ font-size: 24px; font-weight: bold; color: #ffffff; }}
-            </style>
-            <div class="metric-container">
-                <div class="metric-box"><div class="metric-label">総トレード数</div><div class="metric-value">{count_all}回</div></div>
-                <div class="metric-box"><div class="metric-label">勝率</div><div class="metric-value">{win_rate_all:.1%}</div></div>
-                <div class="metric-box"><div class="metric-label">PF（総利益 ÷ 総損失）</div><div class="metric-value">{pf_all:.2f}</div></div>
-                <div class="metric-box"><div class="metric-label">期待値</div><div class="metric-value">{expectancy_all:.2%}</div></div>
-            </div>
-            """, unsafe_allow_html=True)
-            st.divider()
+                # 1. 全体集計
+                ov = ana['overall']
+                count_all, win_rate_all, pf_all, expectancy_all = ov['count'], ov['win_rate'], ov['pf'], ov['expectancy']
+
+                # 2. メトリクス表示
+                st.markdown(f"""
+                <style>
+                .metric-container {{ display: grid; grid-template-columns: 1fr 1fr 1fr 1fr; gap: 10px; margin-bottom: 10px; }}
+                @media (max-width: 640px) {{ .metric-container {{ grid-template-columns: 1fr 1fr; }} }}
+                .metric-box {{ background-color: #262730; padding: 15px; border-radius: 8px; text-align: center; }}
+                .metric-label {{ font-size: 12px; color: #aaaaaa; }}
+                .metric-value {{ font-size: 24px; font-weight: bold; color: #ffffff; }}
+                </style>
+                <div class="metric-container">
+                    <div class="metric-box"><div class="metric-label">総トレード数</div><div class="metric-value">{count_all}回</div></div>
+                    <div class="metric-box"><div class="metric-label">勝率</div><div class="metric-value">{win_rate_all:.1%}</div></div>
+                    <div class="metric-box"><div class="metric-label">PF（総利益 ÷ 総損失）</div><div class="metric-value">{pf_all:.2f}</div></div>
+                    <div class="metric-box"><div class="metric-label">期待値</div><div class="metric-value">{expectancy_all:.2%}</div></div>
+                </div>
+                """, unsafe_allow_html=True)
+
+                # 信頼区間 (トレードの損益をブートストラップで再抽出。銘柄ごとと全銘柄合算)
+                with st.expander(f"📐 信頼区間 (95%・ブートストラップ {DEFAULT_RESAMPLES:,} 回)"):
+                    st.caption("点推定 [下限 ～ 上限]。最大DDは損益 (%) を順に足した累積損益の最大下落幅です。")
+                    st.dataframe(display_ci(get_robustness(res_fp, res), ticker_names), use_container_width=True, hide_index=True)
+                st.divider()
         
-            # 3. テキストレポート生成（修正箇所）
-            report = []
-            report.append("=================\n BACKTEST REPORT \n=================")
-            # セッション状態から日付を取得、なければデフォルトを表示
-            s_date = st.session_state.get('start_date', datetime.now() - timedelta(days=days_back))
-            e_date = st.session_state.get('end_date', datetime.now())
-            report.append(f"\nPeriod: {s_date.strftime('%Y-%m-%d')} - {e_date.strftime('%Y-%m-%d')}\n")
-            
-            if 'Ticker' in res_df.columns:
-                for t in res_df['Ticker'].unique():
-                    tdf = res_df[res_df['Ticker'] == t]
-                    if tdf.empty: continue
-                    
-                    # 各項目の算出
-                    t_wins = tdf[tdf['PnL'] > 0]
-                    t_losses = tdf[tdf['PnL'] <= 0]
-                    t_cnt = len(tdf)
-                    t_wr = len(t_wins) / t_cnt if t_cnt > 0 else 0
-                    
-                    # 利益平均・損失平均の算出
-                    avg_win = t_wins['PnL'].mean() if not t_wins.empty else 0
-                    avg_loss = t_losses['PnL'].mean() if not t_losses.empty else 0
-                    
-                    # PFの算出
-                    t_pf = t_wins['PnL'].sum() / abs(t_losses['PnL'].sum()) if not t_losses.empty and t_losses['PnL'].sum() != 0 else float('inf')
-                    
-                    # 期待値の算出
-                    t_exp = tdf['PnL'].mean()
-                    
-                    t_name = ticker_names.get(t, t)
-                    report.append(f">>> TICKER: {t} | {t_name}")
-                    # 指定された順番でフォーマット
-                    report.append(f"トレード数: {t_cnt} | 勝率: {t_wr:.1%} | 利益平均: {avg_win:+.2%} | 損失平均: {avg_loss:+.2%} | PF: {t_pf:.2f} | 期待値: {t_exp:+.2%}\n")
-            
-            st.caption("右上のコピーボタンで全文コピーできます↓")
-            st.code("\n".join(report), language="text")
-
-            # ★追加：リセットボタン
-            if st.button("♻️ バックテスト結果をクリア", key="reset_t1"):
-                st.session_state['res_df'] = pd.DataFrame()
-                st.rerun()
+                # 3. テキストレポート生成
+                # セッション状態から日付を取得、なければデフォルトを表示
+                s_date = st.session_state.get('start_date', datetime.now() - timedelta(days=days_back))
+                e_date = st.session_state.get('end_date', datetime.now())
+                report = get_summary_report(res_fp, ana['summary'], ticker_names, s_date, e_date)
+
+                st.caption("右上のコピーボタンで全文コピーできます↓")
+                st.code(report, language="text")
+
+                # ★追加：リセットボタン
+                if st.button("♻️ バックテスト結果をクリア", key="reset_t1"): 
+                    results.put('res_df', pd.DataFrame())
+                    st.rerun()
                 
-        else:
-            st.info("""
-            **💡 個別バックテストの結果はありません。**
+            else:
+                st.info("""
+                **💡 個別バックテストの結果はありません。**
 
-            以下の手順で操作してください：
-            1. 画面上部の入力欄に銘柄コードを入れる
-            2. バックテスト実行ボタンを押す
+                以下の手順で操作してください：
+                1. 画面上部の入力欄に銘柄コードを入れる
+                2. バックテスト実行ボタンを押す
             
-            ランキング結果トップ20は『🏆 ランキング』から確認できます
-            """)
+                ランキング結果トップ20は『🏆 ランキング』から確認できます
+                """)
             
-    with tab2: # 🏅 勝ちパターン
-        st.markdown("### 🏅 勝ちパターン分析")
-        st.caption("チャートパターン別の成績分析と、ベストなエントリー条件を言語化して勝ちパターンを抽出します。")
+    with tab2, diagnostics.stage("render.patterns"): # 🏅 勝ちパターン
+        if tab2.open:
+            st.markdown("### 🏅 勝ちパターン分析")
+            st.caption("チャートパターン別の成績分析と、ベストなエントリー条件を言語化して勝ちパターンを抽出します。")
         
-        # --- データの存在チェック ---
-        # res_dfにデータがあり、かつ 'Ticker' 列が存在する場合のみ実行
-        if not res_df.empty and 'Ticker' in res_df.columns:
-            # 安全のため、実際に結果が存在する銘柄コードのみを抽出してループ
-            unique_res_tickers = res_df['Ticker'].unique()
-
-            for t in unique_res_tickers:
-                tdf = res_df[res_df['Ticker'] == t].copy()
-                if tdf.empty: continue
-                
-                t_name = ticker_names.get(t, t)
-                st.markdown(f"#### [{t}] {t_name}")
+            # --- データの存在チェック ---
+            if ana['tickers']:
+                for t in ana['tickers']:
+                    a_t = ana['by_ticker'][t]
+                    t_name = ticker_names.get(t, t)
+                    st.markdown(f"#### [{t}] {t_name}")
                 
-                # パターン別統計
-                pat_stats = tdf.groupby('Pattern', observed=True)['PnL'].agg(['count', lambda x: (x>0).mean(), 'mean']).reset_index()
-                pat_stats.columns = ['パターン', 'トレード数', '勝率', '平均損益']
-                pat_stats['勝率'] = pat_stats['勝率'].apply(lambda x: f"{x:.1%}")
-                pat_stats['平均損益'] = pat_stats['平均損益'].apply(lambda x: f"{x:+.2%}")
-                pat_stats['トレード数'] = pat_stats['トレード数'].astype(str)
-                st.dataframe(pat_stats.style.set_properties(**{'text-align': 'left'}), hide_index=True, use_container_width=True)
+                    # パターン別統計
+                    st.dataframe(display_table(a_t['pattern'], 'パターン').style.set_properties(**{'text-align': 'left'}), hide_index=True, use_container_width=True)
                 
-                # ベストパターンの抽出 (try文で予期せぬ計算エラーを保護)
-                try:
-                    # 1. ギャップ分析
-                    min_g = np.floor(tdf['Gap(%)'].min()); max_g = np.ceil(tdf['Gap(%)'].max())
-                    if np.isnan(min_g): min_g=-3.0; max_g=1.0
-                    bins_g = np.arange(min_g, max_g+0.5, 0.5)
-                    tdf['GapRange'] = pd.cut(tdf['Gap(%)'], bins=bins_g)
-                    gap_stats = tdf.groupby('GapRange', observed=True)['PnL'].agg(['count', lambda x: (x>0).mean()]).reset_index()
-                    gap_valid = gap_stats[gap_stats['count']>=1] # 閾値を1以上に緩和
-                    best_g = gap_valid.loc[gap_valid['<lambda_0>'].idxmax()]
-                    
-                    # 2. VWAP分析
-                    tdf['VWAP_Diff'] = ((tdf['In'] - tdf['EntryVWAP']) / tdf['EntryVWAP']) * 100
-                    min_v = np.floor(tdf['VWAP_Diff'].min()*2)/2; max_v = np.ceil(tdf['VWAP_Diff'].max()*2)/2
-                    if np.isnan(min_v): min_v=-1.0; max_v=1.0
-                    bins_v = np.arange(min_v, max_v+0.2, 0.2)
-                    tdf['VwapRange'] = pd.cut(tdf['VWAP_Diff'], bins=bins_v)
-                    vwap_stats = tdf.groupby('VwapRange', observed=True)['PnL'].agg(['count', lambda x: (x>0).mean()]).reset_index()
-                    vwap_valid = vwap_stats[vwap_stats['count']>=1]
-                    best_v = vwap_valid.loc[vwap_valid['<lambda_0>'].idxmax()]
-                    
-                    # 3. 時間分析
-                    def get_time_range(dt): return f"{dt.strftime('%H:%M')}～{(dt + timedelta(minutes=5)).strftime('%H:%M')}"
-                    tdf['TimeRange'] = tdf['Entry'].apply(get_time_range)
-                    time_stats = tdf.groupby('TimeRange')['PnL'].agg(['count', lambda x: (x>0).mean()]).reset_index()
-                    time_valid = time_stats[time_stats['count']>=1]
-                    best_t = time_valid.loc[time_valid['<lambda_0>'].idxmax()]
-                    
-                    gap_txt = "ギャップアップ" if best_g['GapRange'].left >= 0 else "ギャップダウン"
-                    st.info(f"**🏆 最高勝率パターン**\n\n"
-                            f"最も勝率が高かったのは、**{gap_txt} ({best_g['GapRange'].left:.1f}% ～ {best_g['GapRange'].right:.1f}%)** スタートで、"
-                            f"VWAPから **{best_v['VwapRange'].left:.1f}% ～ {best_v['VwapRange'].right:.1f}%** の位置にある時、"
-                            f"**{best_t['TimeRange']}** にエントリーするパターンです。\n\n"
-                            f"(GAP勝率: {best_g['<lambda_0>']:.1%} / VWAP勝率: {best_v['<lambda_0>']:.1%} / 時間勝率: {best_t['<lambda_0>']:.1%})")
-                except Exception:
-                    st.warning(f"[{t}] パターン分析を生成するためのデータが不足しています。")
+                    # ベストパターン (ギャップ幅・VWAP乖離・時間帯それぞれで勝率が最も高い区分)
+                    best = a_t['best']
+                    if best is not None:
+                        gap_txt = "ギャップアップ" if best['gap_left'] >= 0 else "ギャップダウン"
+                        st.info(f"**🏆 最高勝率パターン**\n\n"
+                                f"最も勝率が高かったのは、**{gap_txt} ({best['gap_left']:.1f}% ～ {best['gap_right']:.1f}%)** スタートで、"
+                                f"VWAPから **{best['vwap_left']:.1f}% ～ {best['vwap_right']:.1f}%** の位置にある時、"
+                                f"**{best['time']}** にエントリーするパターンです。\n\n"
+                                f"(GAP勝率: {best['gap_win']:.1%} / VWAP勝率: {best['vwap_win']:.1%} / 時間勝率: {best['time_win']:.1%})")
+                    else:
+                        st.warning(f"[{t}] パターン分析を生成するためのデータが不足しています。")
                 
-                st.divider()
+                    st.divider()
 
-            # ★追加：リセットボタン
-            if st.button("♻️ バックテスト結果をクリア", key="reset_t2"): 
-                st.session_state['res_df'] = pd.DataFrame()
-                st.rerun()
+                # ★追加：リセットボタン
+                if st.button("♻️ バックテスト結果をクリア", key="reset_t2"): 
+                    results.put('res_df', pd.DataFrame())
+                    st.rerun()
                 
-        else:
-            st.info("""
-            **💡 個別バックテストの結果はありません。**
+            else:
+                st.info("""
+                **💡 個別バックテストの結果はありません。**
 
-            以下の手順で操作してください：
-            1. 画面上部の入力欄に銘柄コードを入れる
-            2. バックテスト実行ボタンを押す
+                以下の手順で操作してください：
+                1. 画面上部の入力欄に銘柄コードを入れる
+                2. バックテスト実行ボタンを押す
             
-            ランキング結果トップ20は『🏆 ランキング』から確認できます
-            """)
+                ランキング結果トップ20は『🏆 ランキング』から確認できます
+                """)
             
-    with tab3: # 📉 ギャップ分析
-        # --- データの存在チェック ---
-        # res_dfにデータがあり、かつ 'Ticker' 列が存在する場合のみ実行
-        if not res_df.empty and 'Ticker' in res_df.columns:
-            # 安全のため、実際に結果が存在する銘柄コードのみを抽出してループ
-            unique_res_tickers = res_df['Ticker'].unique()
-
-            for t in unique_res_tickers:
-                tdf = res_df[res_df['Ticker'] == t].copy()
-                if tdf.empty: continue
-                
-                t_name = ticker_names.get(t, t)
-                st.markdown(f"### [{t}] {t_name}")
-                
-                # --- 1. 始値ギャップ方向の分析 ---
-                st.markdown("##### 始値ギャップ方向と成績")
-                tdf['GapDir'] = tdf['Gap(%)'].apply(lambda x: 'ギャップアップ' if x > 0 else ('ギャップダウン' if x < 0 else 'フラット'))
-                
-                # 統計集計
-                gap_dir_stats = tdf.groupby('GapDir', observed=True).agg(
-                    Count=('PnL', 'count'), 
-                    WinRate=('PnL', lambda x: (x > 0).mean()), 
-                    AvgPnL=('PnL', 'mean')
-                ).reset_index()
-                
-                # 表示用に整形
-                gap_dir_disp = gap_dir_stats.copy()
-                gap_dir_disp['WinRate'] = gap_dir_disp['WinRate'].apply(lambda x: f"{x:.1%}")
-                gap_dir_disp['AvgPnL'] = gap_dir_disp['AvgPnL'].apply(lambda x: f"{x:+.2%}")
-                gap_dir_disp['Count'] = gap_dir_disp['Count'].astype(str)
-                gap_dir_disp.columns = ['方向', 'トレード数', '勝率', '平均損益']
+    with tab3, diagnostics.stage("render.gap"): # 📉 ギャップ分析
+        if tab3.open:
+            # --- データの存在チェック ---
+            if ana['tickers']:
+                for t in ana['tickers']:
+                    a_t = ana['by_ticker'][t]
+                    t_name = ticker_names.get(t, t)
+                    st.markdown(f"### [{t}] {t_name}")
                 
-                # 表を表示
-                st.dataframe(gap_dir_disp.style.set_properties(**{'text-align': 'left'}), hide_index=True, use_container_width=True)
-
-                # --- 2. ギャップ幅ごとの分析 ---
-                st.markdown("##### ギャップ幅ごとの勝率")
-                try:
-                    min_g = np.floor(tdf['Gap(%)'].min()); max_g = np.ceil(tdf['Gap(%)'].max())
-                    if np.isnan(min_g): min_g = -3.0; max_g = 1.0
-                    bins_g = np.arange(min_g, max_g + 0.5, 0.5)
-                    tdf['GapRange'] = pd.cut(tdf['Gap(%)'], bins=bins_g)
-                    
-                    gap_range_stats = tdf.groupby('GapRange', observed=True).agg(
-                        Count=('PnL', 'count'), 
-                        WinRate=('PnL', lambda x: (x > 0).mean()), 
-                        AvgPnL=('PnL', 'mean')
-                    ).reset_index()
-                    
-                    def format_interval(i): return f"{i.left:.1f}% ～ {i.right:.1f}%"
-                    gap_range_stats['RangeLabel'] = gap_range_stats['GapRange'].apply(format_interval)
-                    
-                    disp_gap = gap_range_stats[['RangeLabel', 'Count', 'WinRate', 'AvgPnL']].copy()
-                    disp_gap['WinRate'] = disp_gap['WinRate'].apply(lambda x: f"{x:.1%}")
-                    disp_gap['AvgPnL'] = disp_gap['AvgPnL'].apply(lambda x: f"{x:+.2%}")
-                    disp_gap['Count'] = disp_gap['Count'].astype(str)
-                    disp_gap.columns = ['ギャップ幅', 'トレード数', '勝率', '平均損益']
-                    
-                    st.dataframe(disp_gap.style.set_properties(**{'text-align': 'left'}), hide_index=True, use_container_width=True)
-                except Exception:
-                    st.warning(f"[{t}] ギャップ幅の分析を生成するためのデータが不足しています。")
+                    # --- 1. 始値ギャップ方向の分析 ---
+                    st.markdown("##### 始値ギャップ方向と成績")
+                    st.dataframe(display_table(a_t['gap_dir'], '方向').style.set_properties(**{'text-align': 'left'}), hide_index=True, use_container_width=True)
+
+                    # --- 2. ギャップ幅ごとの分析 ---
+                    st.markdown("##### ギャップ幅ごとの勝率")
+                    if not a_t['gap_range'].empty:
+                        st.dataframe(display_table(a_t['gap_range'], 'ギャップ幅').style.set_properties(**{'text-align': 'left'}), hide_index=True, use_container_width=True)
+                    else:
+                        st.warning(f"[{t}] ギャップ幅の分析を生成するためのデータが不足しています。")
                 
-                st.divider()
+                    st.divider()
 
-            # ★追加：リセットボタン
-            if st.button("♻️ バックテスト結果をクリア", key="reset_t3"): 
-                st.session_state['res_df'] = pd.DataFrame()
-                st.rerun()
+                # ★追加：リセットボタン
+                if st.button("♻️ バックテスト結果をクリア", key="reset_t3"): 
+                    results.put('res_df', pd.DataFrame())
+                    st.rerun()
                 
-        else:
-            st.info("""
-            **💡 個別バックテストの結果はありません。**
+            else:
+                st.info("""
+                **💡 個別バックテストの結果はありません。**
 
-            以下の手順で操作してください：
-            1. 画面上部の入力欄に銘柄コードを入れる
-            2. バックテスト実行ボタンを押す
-            
-            ランキング結果トップ20は『🏆 ランキング』から確認できます
-            """)
-                
-    with tab4: # 🧐 VWAP分析
-        # --- データの存在チェック ---
-        # res_dfにデータがあり、かつ 'Ticker' 列が存在する場合のみ実行
-        if not res_df.empty and 'Ticker' in res_df.columns:
-            # 安全のため、実際に結果が存在する銘柄コードのみを抽出してループ
-            unique_res_tickers = res_df['Ticker'].unique()
+                以下の手順で操作してください：
+                1. 画面上部の入力欄に銘柄コードを入れる
+                2. バックテスト実行ボタンを押す
             
-            for t in unique_res_tickers:
-                tdf = res_df[res_df['Ticker'] == t].copy()
-                if tdf.empty: continue
+                ランキング結果トップ20は『🏆 ランキング』から確認できます
+                """)
                 
-                t_name = ticker_names.get(t, t)
-                st.markdown(f"### [{t}] {t_name}")
-                st.markdown("##### エントリー時のVWAPと勝率")
-                
-                # --- VWAP乖離の計算 ---
-                # EntryVWAPが0やNaNでないことを確認して計算
-                tdf['VWAP乖離(%)'] = ((tdf['In'] - tdf['EntryVWAP']) / tdf['EntryVWAP']) * 100
-                
-                try:
-                    # レンジ（bin）の作成
-                    min_dev = np.floor(tdf['VWAP乖離(%)'].min() * 2) / 2
-                    max_dev = np.ceil(tdf['VWAP乖離(%)'].max() * 2) / 2
-                    if np.isnan(min_dev): min_dev = -1.0; max_dev = 1.0
-                    
-                    bins = np.arange(min_dev, max_dev + 0.2, 0.2)
-                    tdf['Range'] = pd.cut(tdf['VWAP乖離(%)'], bins=bins)
-                    
-                    # 統計集計（Named Aggregation形式）
-                    vwap_stats = tdf.groupby('Range', observed=True).agg(
-                        Count=('PnL', 'count'), 
-                        WinRate=('PnL', lambda x: (x > 0).mean()), 
-                        AvgPnL=('PnL', 'mean')
-                    ).reset_index()
-                    
-                    # ラベルの整形
-                    def format_vwap_interval(i): return f"{i.left:.1f}% ～ {i.right:.1f}%"
-                    vwap_stats['RangeLabel'] = vwap_stats['Range'].apply(format_vwap_interval)
-                    
-                    # 表示用データフレームの構築
-                    display_stats = vwap_stats[['RangeLabel', 'Count', 'WinRate', 'AvgPnL']].copy()
-                    display_stats['WinRate'] = display_stats['WinRate'].apply(lambda x: f"{x:.1%}")
-                    display_stats['AvgPnL'] = display_stats['AvgPnL'].apply(lambda x: f"{x:+.2%}")
-                    display_stats['Count'] = display_stats['Count'].astype(str)
-                    display_stats.columns = ['乖離率レンジ', 'トレード数', '勝率', '平均損益']
-                    
-                    # 表の表示
-                    st.dataframe(display_stats.style.set_properties(**{'text-align': 'left'}), hide_index=True, use_container_width=True)
+    with tab4, diagnostics.stage("render.vwap"): # 🧐 VWAP分析
+        if tab4.open:
+            # --- データの存在チェック ---
+            if ana['tickers']:
+                for t in ana['tickers']:
+                    a_t = ana['by_ticker'][t]
+                    t_name = ticker_names.get(t, t)
+                    st.markdown(f"### [{t}] {t_name}")
+                    st.markdown("##### エントリー時のVWAPと勝率")
                 
-                except Exception:
-                    st.warning(f"[{t}] VWAP乖離分析を生成するためのデータが不足しています。")
+                    # VWAP乖離 ((買値 - エントリー時VWAP) / VWAP) のレンジごとの成績
+                    if not a_t['vwap_range'].empty:
+                        st.dataframe(display_table(a_t['vwap_range'], '乖離率レンジ').style.set_properties(**{'text-align': 'left'}), hide_index=True, use_container_width=True)
+                    else:
+                        st.warning(f"[{t}] VWAP乖離分析を生成するためのデータが不足しています。")
                 
-                st.divider()
+                    st.divider()
      
-            # ★追加：リセットボタン
-            if st.button("♻️ バックテスト結果をクリア", key="reset_t4"): 
-                st.session_state['res_df'] = pd.DataFrame()
-                st.rerun()        
+                # ★追加：リセットボタン
+                if st.button("♻️ バックテスト結果をクリア", key="reset_t4"): 
+                    results.put('res_df', pd.DataFrame())
+                    st.rerun()
         
-        else:
-            st.info("""
-            **💡 個別バックテストの結果はありません。**
+            else:
+                st.info("""
+                **💡 個別バックテストの結果はありません。**
 
-            以下の手順で操作してください：
-            1. 画面上部の入力欄に銘柄コードを入れる
-            2. バックテスト実行ボタンを押す
+                以下の手順で操作してください：
+                1. 画面上部の入力欄に銘柄コードを入れる
+                2. バックテスト実行ボタンを押す
             
-            ランキング結果トップ20は『🏆 ランキング』から確認できます
-            """)
-                
-    with tab5: # 🕒 時間分析
-        # --- データの存在チェック ---
-        # res_dfにデータがあり、かつ 'Ticker' 列が存在する場合のみ実行
-        if not res_df.empty and 'Ticker' in res_df.columns:
-            # 安全のため、実際に結果が存在する銘柄コードのみを抽出してループ
-            unique_res_tickers = res_df['Ticker'].unique()
-
-            for t in unique_res_tickers:
-                tdf = res_df[res_df['Ticker'] == t].copy()
-                if tdf.empty: continue
+                ランキング結果トップ20は『🏆 ランキング』から確認できます
+                """)
                 
-                t_name = ticker_names.get(t, t)
-                st.markdown(f"### [{t}] {t_name}")
-                st.markdown("##### エントリー時間帯ごとの勝率")
-                
-                # エントリー時間帯の文字列作成
-                def get_time_range(dt): 
-                    return f"{dt.strftime('%H:%M')}～{(dt + timedelta(minutes=5)).strftime('%H:%M')}"
-                
-                tdf['TimeRange'] = tdf['Entry'].apply(get_time_range)
+    with tab5, diagnostics.stage("render.time"): # 🕒 時間分析
+        if tab5.open:
+            # --- データの存在チェック ---
+            if ana['tickers']:
+                for t in ana['tickers']:
+                    a_t = ana['by_ticker'][t]
+                    t_name = ticker_names.get(t, t)
+                    st.markdown(f"### [{t}] {t_name}")
+                    st.markdown("##### エントリー時間帯ごとの勝率")
                 
-                # 時間帯ごとの集計
-                try:
-                    time_stats = tdf.groupby('TimeRange', observed=True)['PnL'].agg(['count', lambda x: (x>0).mean(), 'mean']).reset_index()
-                    
-                    # 表示用に整形
-                    time_disp = time_stats.copy()
-                    time_disp.columns = ['時間帯', 'count', 'win_rate', 'mean']
-                    time_disp['WinRate'] = time_disp['win_rate'].apply(lambda x: f"{x:.1%}")
-                    time_disp['AvgPnL'] = time_disp['mean'].apply(lambda x: f"{x:+.2%}")
-                    time_disp['Count'] = time_disp['count'].astype(str)
-                    
-                    # 最終的な表示用カラム
-                    final_disp = time_disp[['時間帯', 'Count', 'WinRate', 'AvgPnL']]
-                    final_disp.columns = ['時間帯', 'トレード数', '勝率', '平均損益']
-                    
-                    st.dataframe(final_disp, hide_index=True, use_container_width=True)
-                except Exception:
-                    st.warning(f"[{t}] 時間分析を生成するためのデータが不足しています。")
+                    # 時間帯ごとの集計
+                    if not a_t['time'].empty:
+                        st.dataframe(display_table(a_t['time'], '時間帯'), hide_index=True, use_container_width=True)
+                    else:
+                        st.warning(f"[{t}] 時間分析を生成するためのデータが不足しています。")
                 
-                st.divider()
+                    st.divider()
 
-            # ★追加：リセットボタン
-            if st.button("♻️ バックテスト結果をクリア", key="reset_t5"): 
-                st.session_state['res_df'] = pd.DataFrame()
-                st.rerun()        
+                # ★追加：リセットボタン
+                if st.button("♻️ バックテスト結果をクリア", key="reset_t5"): 
+                    results.put('res_df', pd.DataFrame())
+                    st.rerun()
         
-        else:
-            st.info("""
-            **💡 個別バックテストの結果はありません。**
+            else:
+                st.info("""
+                **💡 個別バックテストの結果はありません。**
 
-            以下の手順で操作してください：
-            1. 画面上部の入力欄に銘柄コードを入れる
-            2. バックテスト実行ボタンを押す
+                以下の手順で操作してください：
+                1. 画面上部の入力欄に銘柄コードを入れる
+                2. バックテスト実行ボタンを押す
             
-            ランキング結果トップ20は『🏆 ランキング』から確認できます
-            """)
+                ランキング結果トップ20は『🏆 ランキング』から確認できます
+                """)
                 
-    with tab6: # 📝 詳細ログ
-        st.markdown("### 📝 詳細取引ログ")
+    with tab6, diagnostics.stage("render.log"): # 📝 詳細ログ
+        if tab6.open:
+            st.markdown("### 📝 詳細取引ログ")
         
-        # --- データの存在チェック ---
-        if not res_df.empty and 'Ticker' in res_df.columns:
-            # ★修正点1：リストの初期化（これがないとappendでエラーになります）
-            log_report = []
-            
-            # 安全のため、実際に結果が存在する銘柄コードのみを抽出してループ
-            unique_res_tickers = res_df['Ticker'].unique()
+            # --- データの存在チェック ---
+            if not res.empty and 'Ticker' in res.columns:
+                # 絞り込み (銘柄・エントリー日・決済理由) → 条件に合う行のうち表示中のページだけを整形
+                opt_t, d_min, d_max, opt_r = get_log_options(res_fp, res)
+                # ウィジェットのキーは結果セットごと (結果が変われば選択を初期化)。条件を変えたら1ページ目に戻す
+                kf = res_fp[:16]; page_key = f"log_page_{kf}"
+                to_first = lambda: st.session_state.update({page_key: 1})
+                f1, f2, f3 = st.columns([2, 2, 2])
+                sel_t = f1.multiselect("銘柄", opt_t, format_func=lambda t: f"{t} {ticker_names.get(t, '')}", key=f"log_tickers_{kf}", on_change=to_first)
+                sel_d = f2.date_input("エントリー日", (d_min, d_max), min_value=d_min, max_value=d_max, key=f"log_dates_{kf}", on_change=to_first)
+                sel_r = f3.multiselect("決済理由", opt_r, key=f"log_reasons_{kf}", on_change=to_first)
+                d_range = tuple(sel_d) if isinstance(sel_d, (tuple, list)) and len(sel_d) == 2 else None   # 範囲の選択途中は絞り込まない
+                rows = get_log_rows(res_fp, res, tuple(sel_t), d_range, tuple(sel_r))
+
+                p1, p2 = st.columns([1, 1])
+                page_size = p1.selectbox("1ページの件数", LOG_PAGE_SIZES, index=1, key="log_page_size", on_change=to_first)
+                n_pages = max(1, -(-len(rows) // page_size))
+                page = p2.number_input(f"ページ (全 {n_pages})", min_value=1, max_value=n_pages, step=1, key=page_key)
+                page = min(int(page), n_pages)
+                page_rows = rows[(page - 1) * page_size: page * page_size]
+                st.caption(f"{len(rows):,} 件中 {(page - 1) * page_size + 1 if len(rows) else 0:,}～{(page - 1) * page_size + len(page_rows):,} 件目 (右上のコピーボタンでこのページをコピーできます)")
+                st.code("".join(iter_trade_log(res.frame(rows=page_rows), ticker_names)), language="text")
+
+                # 書き出し (条件に合う全件。ボタンを押したときに一時ファイルへ分割して書く)
+                st.caption("絞り込み条件に合う全件を書き出します↓")
+                for col, (kind, label, data, file_name, mime) in zip(st.columns(3), downloads(lambda: res.frame(rows=rows), ticker_names)):
+                    col.download_button(label, data, file_name=file_name, mime=mime, key=f"log_dl_{kind}", on_click="ignore")
+
+                # ★修正点2：リセットボタンを「表示コードの直後」に移動
+                if st.button("♻️ バックテスト結果をクリア", key="reset_t6"): 
+                    results.put('res_df', pd.DataFrame())
+                    st.rerun()
 
-            for t in unique_res_tickers:
-                # データの抽出とソート
-                tdf = res_df[res_df['Ticker'] == t].copy().sort_values('Entry', ascending=False).reset_index(drop=True)
-                if tdf.empty: continue
-                
-                # VWAP乖離の計算
-                tdf['VWAP乖離(%)'] = ((tdf['In'] - tdf['EntryVWAP']) / tdf['EntryVWAP']) * 100
-                t_name = ticker_names.get(t, t)
-                
-                log_report.append(f"[{t}] {t_name} 取引履歴")
-                log_report.append("-" * 80)
-                
-                for i, row in tdf.iterrows():
-                    entry_str = row['Entry'].strftime('%Y-%m-%d %H:%M')
-                    if pd.notna(row['EntryVWAP']) and row['EntryVWAP'] != 0:
-                        vwap_val = int(round(row['EntryVWAP']))
-                        vwap_dev = f"{row['VWAP乖離(%)']:+.2f}%"
-                        vwap_str = f"{vwap_val} (乖離 {vwap_dev})"
-                    else:
-                        vwap_str = "- (乖離 -)"
-                    
-                    # 買・売の金額を int() で切り捨て整形
-                    line = (
-                        f"{entry_str} | "
-                        f"前終値：{int(row['PrevClose'])} | 始値：{int(row['DayOpen'])} | "
-                        f"{row['Pattern']} | "
-                        f"PnL: {row['PnL']:+.2%} | Gap: {row['Gap(%)']:+.2f}% | "
-                        f"買：{int(row['In'])} | 売：{int(row['Out'])} | "
-                        f"VWAP: {vwap_str} | "
-                        f"{row['Reason']}"
-                    )
-                    log_report.append(line)
-                log_report.append("\n")
-            
-            st.caption("右上のコピーボタンで全文コピーできます↓")
-            st.code("\n".join(log_report), language="text")
-
-            # ★修正点2：リセットボタンを「表示コードの直後」に移動
-            if st.button("♻️ バックテスト結果をクリア", key="reset_t6"): 
-                st.session_state['res_df'] = pd.DataFrame()
-                st.rerun()
-
-        else:
-            # データがない時の案内
-            st.info("""
-            **💡 個別バックテストの結果はありません。**
-
-            以下の手順で操作してください：
-            1. 画面上部の入力欄に銘柄コードを入れる
-            2. バックテスト実行ボタンを押す
+            else:
+                # データがない時の案内
+                st.info("""
+                **💡 個別バックテストの結果はありません。**
+
+                以下の手順で操作してください：
+                1. 画面上部の入力欄に銘柄コードを入れる
+                2. バックテスト実行ボタンを押す
             
-            ランキング結果トップ20は『🏆 ランキング』から確認できます
-            """)
-
-    with tab_rank:
-        st.markdown("### 🏆 登録銘柄ランキング")        
-        # st.caption の代わりに st.markdown (HTML) を使用して色とサイズを調整します
-        st.markdown("""
-            <p style="font-size: 0.85rem; color: #9c9d9f; margin-bottom: 1rem;">
-                サイドバーの『ランキング生成』ボタンから実行してください。日経225＋αから上位20銘柄を抽出します。<br>
-                『バックテスト結果をクリア』してからご利用ください。
-            </p>
-            """, unsafe_allow_html=True)
+                ランキング結果トップ20は『🏆 ランキング』から確認できます
+                """)
+
+    with tab_rank, diagnostics.stage("render.ranking"):
+        if tab_rank.open:
+            st.markdown("### 🏆 登録銘柄ランキング")        
+            # st.caption の代わりに st.markdown (HTML) を使用して色とサイズを調整します
+            st.markdown("""
+                <p style="font-size: 0.85rem; color: #9c9d9f; margin-bottom: 1rem;">
+                    サイドバーの『ランキング生成』ボタンから実行してください。日経225＋αから上位20銘柄を抽出します。<br>
+                    途中で中止しても結果は残り、『続きから再開』で残りの銘柄から続けられます。<br>
+                    『バックテスト結果をクリア』してからご利用ください。
+                </p>
+                """, unsafe_allow_html=True)
         
-        # 進行状況を表示するエリア
-        ranking_container = st.container()
-
-        # サイドバーのボタンが押された（合図がある）場合にのみ実行
-        if st.session_state.get('trigger_rank_scan', False):
-            st.session_state['trigger_rank_scan'] = False # 合図をリセット
-            rank_list = []
-            all_tickers = list(TICKER_NAME_MAP.keys())
-            
-            with ranking_container:
-                with st.status("🔍 全登録銘柄を分析中...", expanded=True) as status:
-                    pb_r = st.progress(0)
-                    for i, t in enumerate(all_tickers):
-                        status.update(label=f"Scanning {i+1}/{len(all_tickers)}: {t}")
-                        pb_r.progress((i+1)/len(all_tickers))
-                        
-                        # 1. データ取得と空チェック
-                        df_r = fetch_intraday(t, start_date, end_date)
-                        if df_r.empty: continue
-                        
-                        # 2. 株価範囲のフィルタリング
-                        current_price = df_r['Close'].iloc[-1]
-                        if not (p_min <= current_price <= p_max): continue
-
-                        # 3. マップデータの取得
-                        p_maps, o_maps, a_maps = fetch_daily_stats_maps(t, start_date)
-
-                        # 4. 前日比（change_pct）の計算
-                        change_pct = 0.0
-                        try:
-                            d_close = df_r['Close'].dropna()
-                            if not d_close.empty:
-                                last_p = d_close.iloc[-1]
-                                # 最新足の日付をキーにして前日終値を取得
-                                date_key = d_close.index[-1].strftime('%Y-%m-%d')
-                                prev_p = p_maps.get(date_key)
-                                if prev_p:
-                                    change_pct = (last_p - prev_p) / prev_p
-                        except:
-                            pass
-
-                        # 5. シミュレーション実行
-                        t_trades = run_ticker_simulation(t, df_r, p_maps, o_maps, a_maps, params)
-                        if t_trades:
-                            tdf = pd.DataFrame(t_trades)
-                            wins = tdf[tdf['PnL'] > 0]; losses = tdf[tdf['PnL'] <= 0]
-                            rank_list.append({
-                                '銘柄コード': t, '銘柄名': get_ticker_name(t), '前日比': change_pct,
-                                '回数': len(tdf), '勝率': len(wins)/len(tdf), 
-                                '利益平均': wins['PnL'].mean() if not wins.empty else 0,
-                                '損失平均': losses['PnL'].mean() if not losses.empty else 0,
-                                'PF': wins['PnL'].sum()/abs(losses['PnL'].sum()) if not losses.empty and losses['PnL'].sum()!=0 else 9.99,
-                                '期待値': tdf['PnL'].mean()
-                            })
-                    status.update(label="✅ スキャン完了！", state="complete")
-
-            if rank_list:
-                st.session_state['last_rank_df'] = pd.DataFrame(rank_list).sort_values('期待値', ascending=False)
-                st.rerun()
+            # 進行状況を表示するエリア
+            ranking_container = st.container()
+            # 並び順 (下限 = ブートストラップ 95% 信頼区間の下限。トレード数が少ない銘柄ほど低くなる)
+            sort_opts = {"期待値": '期待値', "期待値の下限 (95%)": '期待値下限', "PF の下限 (95%)": 'PF下限', "勝率の下限 (95%)": '勝率下限'}
+            rank_fmt = {'前日比': '{:+.2%}', '勝率': '{:.1%}', '利益平均': '{:+.2%}', '損失平均': '{:+.2%}', '期待値': '{:+.2%}', 'PF': '{:.2f}',
+                        '勝率下限': '{:.1%}', 'PF下限': '{:.2f}', '期待値下限': '{:+.2%}', '期待値上限': '{:+.2%}', '最大DD': '{:.2%}', '最大DD上限': '{:.2%}'}
+
+            # スキャンの途中経過 (銘柄の結果が確定するたびに保存する。中止や他の操作による再実行で中断しても残り、続きから再開できる)
+            partial = st.session_state.get('rank_partial')
+            run_scan = False
+            # サイドバーのボタンが押された（合図がある）場合は最初から
+            if st.session_state.get('trigger_rank_scan', False):
+                st.session_state['trigger_rank_scan'] = False # 合図をリセット
+                partial = st.session_state['rank_partial'] = {'tickers': list(TICKER_NAME_MAP.keys()), 'start': start_date, 'end': end_date,
+                                                              'params': dict(params), 'done': set(), 'rows': {}, 'finished': False}
+                run_scan = True
+            elif partial is not None and not partial['finished']:
+                with ranking_container:
+                    c1, c2 = st.columns([3, 1])
+                    state = "中止しました" if st.session_state.get('rank_stop') else "中断されています"
+                    c1.info(f"⏸ スキャンは{state} ({len(partial['done'])}/{len(partial['tickers'])} 銘柄完了)。下の表は途中結果です。")
+                    run_scan = c2.button("▶ 続きから再開", key="rank_resume", use_container_width=True)
+
+            if run_scan:
+                remaining = [t for t in partial['tickers'] if t not in partial['done']]
+                sort_col = sort_opts.get(st.session_state.get('rank_sort'), '期待値')
+                # 中止: 押すと on_click で rank_stop が立つ。スキャンは銘柄の区切りごとに should_stop でこれを見て止まり、途中結果は rank_partial に残る
+                # (押したあとの再実行の要求で、スクリプトはその確認のところで打ち切られることもある。その場合も銘柄の区切りで、次の実行で中止を表示する)
+                st.session_state['rank_stop'] = False
+                def _stop(): return st.session_state.get('rank_stop', False)
+                with ranking_container:
+                    st.button("⏹ 中止 (途中結果を残す)", key="rank_cancel", on_click=lambda: st.session_state.update(rank_stop=True))
+                    with st.status("🔍 全登録銘柄を分析中...", expanded=True) as status:
+                        pb_r = st.progress(0)
+                        live = st.empty()   # 上位20銘柄 (銘柄の結果が確定するたびに更新)
+                        top = TopK(20, sort_col)
+                        for row in partial['rows'].values(): top.push(row)
+                        shown = [0.0]
+                        def _progress(label, frac):
+                            if not _stop(): status.update(label=label); pb_r.progress(frac)
+                        def _on_done(t, row):
+                            partial['done'].add(t)
+                            if not row: return
+                            partial['rows'][t] = row; top.push(row)
+                            if not _stop() and monotonic() - shown[0] >= 0.5:   # 表の描画は0.5秒に1回まで (中止の要求後は描画しない)
+                                live.dataframe(top.frame().style.format(rank_fmt), use_container_width=True, hide_index=True); shown[0] = monotonic()
+                        timings = []; errors = []; memo = {}
+                        with _diagnosed("rank"):
+                            _, bulk_stats = scan_ranking(remaining, partial['start'], partial['end'], partial['params'], workers=rank_workers,
+                                                         fetch_intraday=fetch_intraday, fetch_daily_bars=fetch_daily_bars, progress=_progress,
+                                                         concurrency=fetch_conc, thread_initializer=_attach_script_ctx, timings_out=timings, errors_out=errors, memo_out=memo,
+                                                         sort_by=sort_col, on_done=_on_done, should_stop=_stop, engine="panel" if rank_panel else None)
+                        partial['finished'] = not bulk_stats['cancelled']
+                        st.session_state['fetch_timings'] = {**summarize_timings(timings), **memo}
+                        st.session_state['fetch_errors'] = [(e.ticker, e.message) for e in errors]
+                        st.caption(f"一括取得: {bulk_stats['requests']} リクエスト / {bulk_stats['tickers']} 銘柄 / {bulk_stats['bytes']/1e6:.1f} MB")
+                        st.caption(f"日足で除外: 株価範囲外 {bulk_stats['skipped_price']} 銘柄 / ギャップ範囲内の日なし {bulk_stats['skipped_gap']} 銘柄 / "
+                                   f"日足なし {bulk_stats['skipped_no_data']} 銘柄｜ギャップ範囲外の日 {bulk_stats['skipped_sessions']} 日 (対象 {bulk_stats['sessions']} 日)")
+                        status.update(label="✅ スキャン完了！", state="complete")
+
+                # 途中から再開した場合も含めた全銘柄のランキング (銘柄リストの順に並べてから並べ替え)
+                rank_df = rank_frame([partial['rows'][t] for t in partial['tickers'] if t in partial['rows']])
+                if not rank_df.empty:
+                    results.put('last_rank_df', rank_df)
+                    st.rerun()
             
-        # 結果の表示エリア
-        if 'last_rank_df' in st.session_state:
-            st.write("---")
-            rdf = st.session_state['last_rank_df'].head(20)
-            st.dataframe(
-                rdf.style.format({
-                    '前日比': '{:+.2%}', '勝率': '{:.1%}', '利益平均': '{:+.2%}', '損失平均': '{:+.2%}', '期待値': '{:+.2%}', 'PF': '{:.2f}'
-                }),
-                use_container_width=True, hide_index=True, height=735
-            )
-            # リセットボタン（これは残しておきます）
-            if st.button("ランキング表示をクリア"):
-                del st.session_state['last_rank_df']
-                st.rerun()
+            # 結果の表示エリア (中断中は途中結果)
+            rank_view = results.frame('last_rank_df')
+            if partial is not None and not partial['finished'] and partial['rows']:
+                rank_view = rank_frame([partial['rows'][t] for t in partial['tickers'] if t in partial['rows']])
+            if rank_view is not None:
+                st.write("---")
+                sort_opts = {k: v for k, v in sort_opts.items() if v in rank_view.columns}
+                sort_key = st.selectbox("並び順", list(sort_opts), key="rank_sort")
+                rdf = rank_view.sort_values(sort_opts[sort_key], ascending=False).head(20)
+                st.dataframe(rdf.style.format(rank_fmt), use_container_width=True, hide_index=True, height=735)
+                # リセットボタン（これは残しておきます）
+                if st.button("ランキング表示をクリア"):
+                    results.pop('last_rank_df'); st.session_state.pop('rank_partial', None)
+                    st.rerun()
+
+    if diag_on and tabs[7].open:
+        with tabs[7]: # 🩺 診断
+            st.markdown("### 🩺 診断")
+            rec = st.session_state.get('diag')
+            if rec is None:
+                st.info("診断モードのまま バックテスト / ランキング生成 / 探索 を実行すると、段階ごとの処理時間がここに表示されます。")
+            else:
+                st.caption(f"{rec.label}｜{rec.started:%Y-%m-%d %H:%M:%S}｜実行 {rec.wall:.2f} 秒｜記録先: {diagnostics.default_jsonl_path()}"
+                           "｜段階は入れ子になるため割合の合計は100%を超えます。render.* (表示) は再実行のたびに加算されます。")
+                st.markdown("##### 段階ごと")
+                st.dataframe(rec.stage_frame().style.format({'秒': '{:.3f}', 'ms/回': '{:.2f}', '割合': '{:.1%}'}), use_container_width=True, hide_index=True)
+                st.markdown("##### キャッシュ (st.cache_data)")
+                st.dataframe(rec.cache_frame().style.format({'ヒット率': '{:.1%}'}), use_container_width=True, hide_index=True)
+                st.markdown("##### 銘柄ごと (秒・上位50銘柄)")
+                tdf = rec.ticker_frame().head(50)
+                st.dataframe(tdf.style.format({c: '{:.3f}' for c in tdf.columns if c != '銘柄'}), use_container_width=True, hide_index=True)
+                if rec.profiler is not None:
+                    st.markdown("##### サンプリングプロファイル")
+                    st.caption(f"{rec.profiler.n_samples:,} 回採取｜保存先: {rec.profile_path}")
+                    st.dataframe(rec.profiler.top(30), use_container_width=True, hide_index=True)
+                    st.download_button("プロファイル (folded) をダウンロード", rec.profiler.folded(), file_name=f"profile-{rec.run_id}.folded", key="diag_prof_dl")
+                st.download_button("記録 (JSON Lines) をダウンロード", "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rec.records()),
+                                   file_name=f"diagnostics-{rec.run_id}.jsonl", key="diag_jsonl_dl")
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import sys
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+import pandas as pd
+import market_data
+from backtest_engine import make_params
+from trade_buffer import TradeBuffer, summarize_pnl
+from trade_export import write_frame, write_trade_log
+from fetch_pipeline import DEFAULT_CONCURRENCY, DEFAULT_RATE
+from ranking import run_backtest, scan_ranking, load_bars
+from sweep import grid_from_spec
+from walk_forward import run_walk_forward
+from exit_surface import record_paths, exit_surface, EXIT_KEYS
+from live_scanner import LiveScanner, ReplayFeed, PollingFeed, run_feed
+from indicator_cache import normalize_bars
+from robustness import DEFAULT_RESAMPLES
+from universe import TICKER_NAME_MAP
+import diagnostics
+
+# --- コマンドライン版 (ブラウザなしでバックテスト / ランキングを実行) ---
+# 例:
+#   python backtest_cli.py backtest --params params.json --tickers 8267.T,7203.T --out results/
+#   python backtest_cli.py rank --params params.json --workers 8 --out results/      (銘柄未指定なら全登録銘柄)
+#   python backtest_cli.py rank --params params.json --engine panel                  (全銘柄を1つのパネルで一括計算)
+#   python backtest_cli.py backtest --provider local:archive/ --tickers 8267.T       (保存済みファイルをオフラインで再生)
+#   python backtest_cli.py rank --provider local:archive/ --end 2026-02-27 --days 30  (期間を日付で指定。--start も指定できる)
+#   python backtest_cli.py backtest --tickers 8267.T --trade-log --format parquet --out results/   (詳細ログのテキストも書き出す。出力はどれも分割して書く)
+#   python backtest_cli.py walkforward --params params.json --grid grid.json --train 20 --test 5 --workers 8 --out results/
+#   python backtest_cli.py surface --params params.json --grid grid.json --out results/     (決済パラメータの格子の応答曲面)
+#   python backtest_cli.py live --params params.json --tickers 8267.T,7203.T                 (寄付後に起動し、確定した5分足ごとにシグナルを表示)
+#   python backtest_cli.py live --provider local:archive/ --replay-date 2026-03-02 --out results/   (保存済みの1日をライブと同じ手順で再生)
+#   python backtest_cli.py rank --params params.json --diag --profile                 (段階ごとの時間を .diagnostics/ に記録し、全体をプロファイル)
+# params.json はサイドバーと同じキー (割合は小数、時刻は "HH:MM")。未指定のキーはサイドバーの初期値:
+#   {"start_t": "09:00", "end_t": "09:15", "ts_start": 0.005, "ts_width": 0.002, "u_atr": true, "p_min": 500, "p_max": 5000}
+# grid.json は探索範囲 (sweep.grid_from_spec の書式、未指定のキーは params の値):
+#   {"masks": "all", "end_t": "09:15-10:00/15", "ts_start": "0.003:0.010:0.001", "ts_width": [0.002, 0.003], "atr_mul": "1.0:2.0:0.5"}
+
+
+RANK_SORT = {'expectancy': '期待値', 'expectancy_lb': '期待値下限', 'pf_lb': 'PF下限', 'win_rate_lb': '勝率下限'}
+
+
+def _write(df, out_dir, name, fmt):
+    return write_frame(df, os.path.join(out_dir, f"{name}.{fmt}"), fmt)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="BACK TESTER (headless)")
+    ap.add_argument("command", choices=["backtest", "rank", "walkforward", "surface", "live"],
+                    help="backtest: 指定銘柄のトレード / rank: ランキングスキャン / walkforward: ウォークフォワード検証 / surface: 決済パラメータの応答曲面 / live: ライブのシグナル検出")
+    ap.add_argument("--params", help="パラメータ JSON ファイル")
+    ap.add_argument("--tickers", help="銘柄コード (カンマ区切り)。省略時は全登録銘柄")
+    ap.add_argument("--days", type=int, help="過去何日分 (params の days より優先)")
+    ap.add_argument("--end", help="期間の最終日 (YYYY-MM-DD、その日を含む)。省略時は現在まで")
+    ap.add_argument("--start", help="期間の開始日 (YYYY-MM-DD)。省略時は期間の終わりから days 日前")
+    ap.add_argument("--workers", type=int, default=1, help="rank / walkforward の並列ワーカー数 (1 = 逐次)")
+    ap.add_argument("--grid", help="walkforward / surface の探索範囲 JSON ファイル (surface は決済パラメータだけを使う)")
+    ap.add_argument("--train", type=int, default=20, help="walkforward の学習日数")
+    ap.add_argument("--test", type=int, default=5, help="walkforward の検証日数 (窓をずらす日数)")
+    ap.add_argument("--min-trades", type=int, default=10, help="walkforward で学習期間に必要なトレード数")
+    ap.add_argument("--sort", choices=list(RANK_SORT), default="expectancy", help="rank の並び順 (*_lb = ブートストラップ 95%% 信頼区間の下限)")
+    ap.add_argument("--engine", choices=["ticker", "panel"], default="ticker", help="rank の計算方法 (panel = 全銘柄を 銘柄 × 日 × 時間枠 の配列で一括計算、--workers は使わない)")
+    ap.add_argument("--replay-date", help="live: この日 (YYYY-MM-DD) の保存済みの5分足を時刻順に再生する (省略時は提供元を定期的に取得)")
+    ap.add_argument("--poll", type=float, default=60.0, help="live: 提供元を取得する間隔 (秒)")
+    ap.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES, help="rank の信頼区間のブートストラップ回数 (0 = 計算しない)")
+    ap.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同時に実行するデータ取得の数")
+    ap.add_argument("--rate", type=float, default=DEFAULT_RATE, help="1秒あたりのデータ取得開始数の上限 (省略時は無制限)")
+    ap.add_argument("--provider", help="データの提供元: yfinance / local:<ディレクトリ> (省略時は BACKTESTER_PROVIDER か yfinance)")
+    ap.add_argument("--diag", action="store_true", help="段階ごとの時間・回数を表示し、JSON Lines (--diag-dir/diagnostics.jsonl) に追記する")
+    ap.add_argument("--profile", action="store_true", help="実行全体のサンプリングプロファイルを --diag-dir に folded 形式で保存する (--diag を含む)")
+    ap.add_argument("--diag-dir", default=diagnostics.DIAG_DIR, help="診断の出力先ディレクトリ")
+    ap.add_argument("--out", default=".", help="出力ディレクトリ")
+    ap.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    ap.add_argument("--trade-log", action="store_true", help="backtest: 詳細ログ (アプリの 📝 詳細ログ と同じテキスト) も trade_log.txt に書き出す")
+    args = ap.parse_args(argv)
+    if args.provider: market_data.set_provider(args.provider)
+    if args.sort != "expectancy" and not args.resamples: ap.error("--sort *_lb requires --resamples > 0")
+
+    overrides = {}
+    if args.params:
+        with open(args.params, encoding="utf-8") as f: overrides = json.load(f)
+    if args.days: overrides['days'] = args.days
+    params = make_params(overrides)
+    tickers = [t.strip() for t in args.tickers.split(",") if t.strip()] if args.tickers else list(TICKER_NAME_MAP.keys())
+
+    try:
+        end_date = datetime.fromisoformat(args.end) + timedelta(days=1) if args.end else datetime.now()
+        start_date = datetime.fromisoformat(args.start) if args.start else end_date - timedelta(days=params['days'])
+    except ValueError as e: ap.error(f"--start / --end: {e}")
+    if start_date >= end_date: ap.error("--start must be on or before --end")
+    os.makedirs(args.out, exist_ok=True)
+    progress = lambda label, frac: print(f"\r{label:<40} {frac:6.1%}", end="", file=sys.stderr, flush=True)
+    errors = []; memo = {}
+
+    diag = diagnostics.diagnosed(args.command, profile=args.profile, directory=args.diag_dir) if args.diag or args.profile else nullcontext()
+    with diag as rec:
+        if args.command == "backtest":
+            trades = run_backtest(tickers, start_date, end_date, params, progress=progress, concurrency=args.concurrency, rate=args.rate, errors_out=errors, memo_out=memo)
+            summary = pd.DataFrame([{'銘柄コード': t, **summarize_pnl(g['PnL'].to_numpy())} for t, g in trades.groupby('Ticker', sort=False, observed=True)]) if not trades.empty else pd.DataFrame()
+            outputs = [_write(trades, args.out, "trades", args.format), _write(summary, args.out, "summary", args.format)]
+            if args.trade_log: outputs.append(write_trade_log(trades, TICKER_NAME_MAP, os.path.join(args.out, "trade_log.txt")))
+        elif args.command in ("walkforward", "surface"):
+            spec = {}
+            if args.grid:
+                with open(args.grid, encoding="utf-8") as f: spec = json.load(f)
+            data = load_bars(tickers, start_date, end_date, progress=progress, concurrency=args.concurrency, rate=args.rate, errors_out=errors)
+            if args.command == "surface":
+                grid = grid_from_spec(spec, params)
+                with diagnostics.stage("record_paths"): paths, off_grid = record_paths(data, params)
+                with diagnostics.stage("exit_surface"): surf = exit_surface(paths, {k: grid[k] for k in EXIT_KEYS}, params['u_atr'])
+                best = surf[surf['回数'] > 0].sort_values('期待値', ascending=False).head(1)
+                print(f"\nexit surface: {0 if paths is None else len(paths['e'])} entries x {len(surf)} exit settings" +
+                      (f", best expectancy {best['期待値'].iloc[0]:+.3%} (PF {best['PF'].iloc[0]:.2f})" if len(best) else "") +
+                      (f", {len(off_grid)} off-grid tickers skipped" if off_grid else ""), file=sys.stderr)
+                outputs = [_write(surf, args.out, "surface", args.format)]
+            else:
+                with diagnostics.stage("walk_forward"):
+                    folds, wf = run_walk_forward(data, grid_from_spec(spec, params), params, args.train, args.test, min_trades=args.min_trades, workers=args.workers)
+                print(f"\nwalk-forward: {wf['folds']} folds / {wf['sessions']} sessions / out-of-sample {wf['回数']} trades, "
+                      f"PF {wf['PF']:.2f}, expectancy {wf['期待値']:+.3%} (in-sample mean {wf['学習期待値']:+.3%})", file=sys.stderr)
+                outputs = [_write(folds, args.out, "walkforward", args.format)]
+        elif args.command == "live":
+            replay = pd.Timestamp(args.replay_date) if args.replay_date else None
+            if replay is not None: start_date, end_date = replay - timedelta(days=params['days']), replay + timedelta(days=1)
+            data = load_bars(tickers, start_date, end_date, progress=progress, concurrency=args.concurrency, rate=args.rate, errors_out=errors)
+            print("", file=sys.stderr)
+            scanner = LiveScanner(params)
+            bars = {t: normalize_bars(df) for t, df, _ in data}
+            if replay is not None:
+                cut = replay.tz_localize('Asia/Tokyo')
+                for t, _, maps in data: scanner.add(t, maps, bars[t][bars[t].index < cut])
+                feed = ReplayFeed({t: b[b.index < cut + timedelta(days=1)] for t, b in bars.items()}, start=cut)
+            else:
+                for t, _, maps in data: scanner.add(t, maps, bars[t])
+                feed = PollingFeed(market_data.PROVIDER, bars, {t: b.index[-1] for t, b in bars.items()}, poll=args.poll)
+            show = lambda sg: print(f"{sg['time']:%Y-%m-%d %H:%M} {sg['kind']:<5} {sg['ticker']:<8} {sg['price']:10.1f}  " +
+                                    (f"stop {sg['stop']:.1f} gap {sg['gap']:+.2%}" if sg['kind'] == 'entry' else f"{sg['reason']} {sg['pnl']:+.2%}"), flush=True)
+            with diagnostics.stage("live"): n_bars = run_feed(scanner, feed, show)
+            print(f"live: {n_bars} bars / {len(scanner.trades)} trades / {len(scanner.positions())} open positions", file=sys.stderr)
+            outputs = [_write(scanner.trades.to_frame(), args.out, "live_trades", args.format)]
+        else:
+            trades = []
+            rank_df, bulk_stats = scan_ranking(tickers, start_date, end_date, params, workers=args.workers, progress=progress, trades_out=trades,
+                                               concurrency=args.concurrency, rate=args.rate, errors_out=errors, memo_out=memo,
+                                               sort_by=RANK_SORT[args.sort], resamples=args.resamples, engine=args.engine)
+            print(f"\nbulk fetch: {bulk_stats['requests']} requests / {bulk_stats['tickers']} tickers / {bulk_stats['bytes']/1e6:.1f} MB", file=sys.stderr)
+            print(f"daily pre-filter: skipped {bulk_stats['skipped_price']} (price) / {bulk_stats['skipped_gap']} (no session in gap window) / "
+                  f"{bulk_stats['skipped_no_data']} (no daily data) tickers, {bulk_stats['skipped_sessions']} of {bulk_stats['sessions'] + bulk_stats['skipped_sessions']} sessions", file=sys.stderr)
+            outputs = [_write(TradeBuffer.concat(trades).to_frame(), args.out, "trades", args.format), _write(rank_df, args.out, "ranking", args.format)]
+    print("", file=sys.stderr)
+    if rec is not None:
+        for r in rec.stage_frame().itertuples(index=False):
+            print(f"stage {r[0]:<22} {r[1]:>7} calls {r[2]:9.3f} s", file=sys.stderr)
+        print(f"diagnostics: {rec.wall:.2f} s wall -> {diagnostics.default_jsonl_path(args.diag_dir)}" + (f", profile -> {rec.profile_path}" if rec.profile_path else ""), file=sys.stderr)
+    if memo: print(f"sessions: {memo.get('reused', 0)} reused / {memo.get('computed', 0)} computed", file=sys.stderr)
+    for e in errors: print(f"fetch error: {e}", file=sys.stderr)
+    for p in outputs: print(p)
+    return 1 if errors and len(errors) == len(tickers) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+from datetime import time
+from indicator_cache import INDICATOR_CACHE, IND_COLS, normalize_bars, compute_indicators
+from bars import Bars, _nancumsum
+from trade_buffer import TradeBuffer, summarize_pnl
+from session_memo import SESSION_MEMO, session_matrix, session_digest, params_digest
+import diagnostics
+
+# --- 基本関数 ---
+def get_trade_pattern(row, gap_pct):
+    check_vwap = row['VWAP'] if pd.notna(row['VWAP']) else row['Close']
+    if (gap_pct <= -0.004) and (row['Close'] > check_vwap): return "A：反転狙い"
+    elif (-0.003 <= gap_pct < 0.003) and (row['Close'] > row['EMA5']): return "D：上昇継続"
+    elif (gap_pct >= 0.005) and (row.get('RSI14', 50) >= 65): return "C：ブレイク"
+    elif (gap_pct >= 0.003) and (row['Close'] > row['EMA5']): return "B：押目上昇"
+    return "E：他タイプ"
+
+# --- シミュレーション・コアロジック (個別・ランキング共通) ---
+EXIT_TIME = time(14, 55)   # 時間切れ決済の時刻
+SIM_ENGINE = "vector"      # "vector" = 配列エンジン / "loop" = 従来の iterrows ループ
+
+# サイドバーの初期値と同じパラメータ (割合は小数、時刻は time)
+DEFAULT_PARAMS = {
+    'days': 59, 'start_t': time(9, 0), 'end_t': time(9, 15), 'u_vwap': True, 'u_ema': True, 'u_rsi': True, 'u_macd': True,
+    'g_min': -0.03, 'g_max': 0.01, 'ts_start': 0.005, 'ts_width': 0.002, 'sl_fix': -0.005, 'u_atr': True, 'atr_mul': 1.5, 'atr_min': 0.005,
+    'p_min': 500, 'p_max': 5000
+}
+
+# 辞書 (JSON など) からパラメータを作成。未指定は DEFAULT_PARAMS、時刻は "HH:MM" 文字列も可
+def make_params(overrides=None):
+    params = dict(DEFAULT_PARAMS)
+    for k, v in (overrides or {}).items():
+        if k not in params: raise KeyError(f"unknown parameter: {k}")
+        if k in ('start_t', 'end_t') and isinstance(v, str): v = time.fromisoformat(v)
+        params[k] = v
+    return params
+
+# 5分足の整形とインジケーター付与 (両エンジン共通・キャッシュなし)
+def add_indicators(df):
+    return compute_indicators(normalize_bars(df))
+
+# インジケーターは INDICATOR_CACHE (銘柄 + 足データのハッシュがキー) から取得し、パラメータ変更だけなら再計算しない
+# df は5分足の DataFrame か、取り込み時に正規化した Bars (日ごとの分割・VWAP を作り直さない。キャッシュからはインジケーターの列だけを受け取る)
+# 配列エンジンでは日ごとの結果を SESSION_MEMO から再利用し、memo_counts (dict) に再利用/計算した日数を加算する
+# 結果は TradeBuffer (out を渡せばそこに追記) で返す
+def run_ticker_simulation(ticker, df, pc_map, co_map, a_map, params, engine=None, out=None, memo_counts=None):
+    out = out if out is not None else TradeBuffer()
+    if df.empty: return out
+    bars = df if isinstance(df, Bars) else None
+    with diagnostics.stage("indicators", ticker): df = INDICATOR_CACHE.get(ticker, df)
+    if (engine or SIM_ENGINE) == "loop":
+        if bars is not None: df = bars.frame().assign(**{c: df[c].to_numpy() for c in IND_COLS})
+        with diagnostics.stage("simulate_loop", ticker): return _simulate_loop(ticker, df, pc_map, co_map, a_map, params, out)
+    return _simulate_vector(ticker, df, pc_map, co_map, a_map, params, out, memo_counts, bars)
+
+# 従来エンジン: 日付ごとに絞り込み、1本ずつ iterrows で判定
+def _simulate_loop(ticker, df, pc_map, co_map, a_map, params, out):
+    unique_dates = np.unique(df.index.date)
+    for d in unique_dates:
+        day = df[df.index.date == d].copy().between_time('09:00', '15:00')
+        if day.empty: continue
+        day['VWAP'] = (day['Close'] * day['Volume']).cumsum() / day['Volume'].cumsum().replace(0, np.nan)
+        date_str = d.strftime('%Y-%m-%d')
+        pc = pc_map.get(date_str); do = co_map.get(date_str)
+        if pc is None or do is None: continue
+        gap_v = (do - pc) / pc
+        
+        in_pos = False; entry_p = 0; stop_p = 0; t_high = 0; t_active = False; sl_rec = 0
+        for ts, row in day.iterrows():
+            if not in_pos:
+                if params['start_t'] <= ts.time() <= params['end_t'] and params['g_min'] <= gap_v <= params['g_max']:
+                    c_vwap = (row['Close'] > row['VWAP']) if params['u_vwap'] else True
+                    c_ema = (row['Close'] > row['EMA5']) if params['u_ema'] else True
+                    c_rsi = (row['RSI14'] > 45 and row['RSI14'] > row['RSI14_P']) if params['u_rsi'] else True
+                    c_macd = (row['MH'] > row['MH_P']) if params['u_macd'] else True
+                    
+                    if c_vwap and c_ema and c_rsi and c_macd:
+                        entry_p = row['Close'] * 1.0003; in_pos = True; entry_t = ts; entry_vwap = row['VWAP']
+                        # ATR損切り計算
+                        if params['u_atr']:
+                            av = a_map.get(date_str)
+                            sl_rec = max(params['atr_min'], (av/entry_p)*params['atr_mul']) if av and entry_p>0 else abs(params['sl_fix'])
+                        else: sl_rec = abs(params['sl_fix'])
+                        stop_p = entry_p * (1 - sl_rec); t_high = row['High']; t_active = False
+            else:
+                t_high = max(t_high, row['High'])
+                if not t_active and t_high >= entry_p * (1 + params['ts_start']): t_active = True
+                ex_p = None; rsn = ""
+                if t_active and row['Low'] <= t_high * (1 - params['ts_width']):
+                    ex_p = t_high * (1 - params['ts_width']) * 0.9997; rsn = "トレーリング"
+                elif row['Low'] <= stop_p: ex_p = stop_p * 0.9997; rsn = "損切り"
+                elif ts.time() >= EXIT_TIME: ex_p = row['Close'] * 0.9997; rsn = "時間切れ"
+                
+                if ex_p:
+                    out.append(ticker, entry_t.value, ts.value, (ex_p - entry_p)/entry_p, entry_p, ex_p, rsn, get_trade_pattern(row, gap_v), gap_v*100, entry_vwap, pc, do, sl_rec*100)
+                    in_pos = False; break
+    return out
+
+# 時刻 → その日の0時からのマイクロ秒
+def _time_us(t):
+    return ((t.hour * 60 + t.minute) * 60 + t.second) * 1_000_000 + t.microsecond
+
+# 場中 (09:00～15:00) の足を日付順に並べた配列と、日ごとの区間 [starts, ends) を作成
+# bars (df の元の Bars) を渡すと、取り込み時に求めた並び・日付・VWAP と OHLCV を使う (df はインジケーターの列だけでよい)
+def session_arrays(df, bars=None):
+    if bars is not None: return _session_from_bars(df, bars)
+    idx = df.index
+    day0 = idx.normalize()
+    tod = np.asarray(idx - day0, dtype='timedelta64[us]').astype(np.int64)
+    # between_time('09:00', '15:00') 相当 (両端含む) + 日付順に安定ソート (df.index.date == d と同じ並び)
+    sel = np.flatnonzero((tod >= _time_us(time(9, 0))) & (tod <= _time_us(time(15, 0))))
+    if sel.size == 0: return None
+    all_codes = np.asarray(day0, dtype='datetime64[us]').astype(np.int64)
+    sel = sel[np.argsort(all_codes[sel], kind='stable')]
+    day_code = all_codes[sel]
+    bounds = np.flatnonzero(np.diff(day_code)) + 1
+    starts = np.r_[0, bounds]; ends = np.r_[bounds, len(sel)]
+
+    col = lambda c: df[c].to_numpy(dtype=np.float64)[sel]
+    S = {'ns': idx[sel].as_unit('ns').asi8, 'tod': tod[sel], 'starts': starts, 'ends': ends,
+         'dates': [d.strftime('%Y-%m-%d') for d in day0[sel][starts]]}
+    for c in ('Close', 'High', 'Low', 'Volume', 'EMA5', 'RSI14', 'RSI14_P', 'MH', 'MH_P'): S[c] = col(c)
+    # 日ごとの VWAP
+    vwap = np.empty(len(sel))
+    for a, b in zip(starts, ends):
+        v_cum = _nancumsum(S['Volume'][a:b]); v_cum[v_cum == 0] = np.nan
+        vwap[a:b] = _nancumsum(S['Close'][a:b] * S['Volume'][a:b]) / v_cum
+    S['VWAP'] = vwap
+    return S
+
+def _session_from_bars(ind, bars):
+    sel = bars.sel
+    if sel.size == 0: return None
+    S = {'ns': bars.ns[sel], 'tod': bars.tod(), 'starts': bars.starts, 'ends': bars.ends, 'dates': bars.dates, 'VWAP': bars.vwap}
+    for c in ('Close', 'High', 'Low', 'Volume'): S[c] = bars.cols[c][sel].astype(np.float64)
+    for c in IND_COLS: S[c] = ind[c].to_numpy(dtype=np.float64)[sel]
+    return S
+
+# 配列エンジン: 日ごとの区間を一度だけ求め、エントリー/決済を配列演算で判定
+def _simulate_vector(ticker, df, pc_map, co_map, a_map, params, out, memo_counts=None, bars=None):
+    with diagnostics.stage("day_split", ticker): S = session_arrays(df, bars)
+    if S is None: return out
+    with diagnostics.stage("simulate", ticker): return simulate_sessions(ticker, S, pc_map, co_map, a_map, params, out, SESSION_MEMO, memo_counts)
+
+# 場中配列 (session_arrays の結果) に対するエントリー/決済判定。out (TradeBuffer) に追記して返す
+# memo (SessionMemo) を渡すと日ごとの結果を再利用し、memo_counts (dict) に 'reused' / 'computed' の日数を加算する
+def simulate_sessions(ticker, S, pc_map, co_map, a_map, params, out=None, memo=None, memo_counts=None):
+    out = out if out is not None else TradeBuffer(capacity=len(S['starts']))   # 1日1トレードまで
+    s_ns, tod = S['ns'], S['tod']
+    close, vwap, ema, rsi, rsi_p, mh, mh_p = S['Close'], S['VWAP'], S['EMA5'], S['RSI14'], S['RSI14_P'], S['MH'], S['MH_P']
+
+    # 日付に依存しないエントリー条件 (時間帯・VWAP・EMA・RSI・MACD)
+    base = (tod >= _time_us(params['start_t'])) & (tod <= _time_us(params['end_t']))
+    if params['u_vwap']: base &= close > vwap
+    if params['u_ema']: base &= close > ema
+    if params['u_rsi']: base &= (rsi > 45) & (rsi > rsi_p)
+    if params['u_macd']: base &= mh > mh_p
+    exit_time = tod >= _time_us(EXIT_TIME)
+    if memo is not None: M = session_matrix(S); p_key = params_digest(params)
+
+    for a, b, date_str in zip(S['starts'], S['ends'], S['dates']):
+        pc = pc_map.get(date_str); do = co_map.get(date_str)
+        if pc is None or do is None: continue
+        gap_v = (do - pc) / pc
+        if not (params['g_min'] <= gap_v <= params['g_max']): continue
+        av = a_map.get(date_str)
+        day = lambda: _simulate_day(S, s_ns, base, exit_time, a, b, gap_v, pc, do, av, params)
+        tr = day() if memo is None else memo.lookup((ticker, date_str, session_digest(M, a, b), pc, do, av, p_key), day, memo_counts)
+        if tr is not None: out.append(ticker, *tr)
+    return out
+
+# 1日分 [a, b) の判定。トレードがあれば TradeBuffer.append の引数 (銘柄以外) のタプル、なければ None
+def _simulate_day(S, s_ns, base, exit_time, a, b, gap_v, pc, do, av, params):
+    close, high, low, vwap = S['Close'], S['High'], S['Low'], S['VWAP']
+    ent = base[a:b]
+    e = int(np.argmax(ent))
+    if not ent[e]: return None
+    e += a
+
+    entry_p = close[e] * 1.0003
+    if params['u_atr']:
+        sl_rec = max(params['atr_min'], (av/entry_p)*params['atr_mul']) if av and entry_p>0 else abs(params['sl_fix'])
+    else: sl_rec = abs(params['sl_fix'])
+    stop_p = entry_p * (1 - sl_rec)
+
+    # エントリー足以降の高値の累積最大 (途中の NaN は無視、エントリー足が NaN なら以後 NaN = 従来の max() と同じ)
+    t_high = _post_entry_high(high[e:b])
+    l_post = low[e+1:b]
+    trail_lv = t_high * (1 - params['ts_width'])
+    hit_trail = (t_high >= entry_p * (1 + params['ts_start'])) & (l_post <= trail_lv)
+    hit_stop = l_post <= stop_p
+    hit = hit_trail | hit_stop | exit_time[e+1:b]
+    if not hit.any(): return None
+    j = int(np.argmax(hit)); x = e + 1 + j
+
+    if hit_trail[j]: ex_p = trail_lv[j] * 0.9997; rsn = "トレーリング"
+    elif hit_stop[j]: ex_p = stop_p * 0.9997; rsn = "損切り"
+    else: ex_p = close[x] * 0.9997; rsn = "時間切れ"
+    if not ex_p: return None
+
+    ex_row = {'Close': close[x], 'VWAP': vwap[x], 'EMA5': S['EMA5'][x], 'RSI14': S['RSI14'][x]}
+    return (s_ns[e], s_ns[x], (ex_p - entry_p)/entry_p, entry_p, ex_p, rsn, get_trade_pattern(ex_row, gap_v), gap_v*100, vwap[e], pc, do, sl_rec*100)
+
+# エントリー足からの高値の累積最大を、エントリー足の次の足から返す
+def _post_entry_high(h):
+    h = h.copy(); h[1:][np.isnan(h[1:])] = -np.inf
+    return np.maximum.accumulate(h)[1:]
+
+# --- ランキング集計 (1銘柄分のトレード → 回数・勝率・損益平均・PF・期待値) ---
+# TradeBuffer は損益列から直接、dict のリストは PnL を取り出して集計する
+def summarize_trades(trades):
+    if isinstance(trades, TradeBuffer): return trades.summary()
+    return summarize_pnl([t['PnL'] for t in trades])
@@ -0,0 +1,142 @@
+import os
+import glob
+from datetime import datetime, date
+import pandas as pd
+
+# --- 5分足の永続ストア (Parquet) ---
+# レイアウト: <root>/<ticker>/date=YYYY-MM-DD.parquet  (直近の日ごとのファイル)
+#             <root>/<ticker>/month=YYYY-MM.parquet    (compact() で月単位にまとめたファイル)
+# 各ファイルは UTC の 'Datetime' 列 + OHLCV 列。日付の区切りは東京時間。
+# 月単位のファイルは ROW_GROUP_ROWS 行ごとの行グループに分けて書き、read() は時刻の範囲で行グループを読み飛ばす。
+
+TZ = 'Asia/Tokyo'
+TS_COL = 'Datetime'
+ROW_GROUP_ROWS = 100   # 5分足で約1日分
+
+
+class ParquetBarStore:
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    # --- パス関連 ---
+    def _ticker_dir(self, ticker):
+        return os.path.join(self.root, ticker.replace('/', '_'))
+
+    def _day_path(self, ticker, d):
+        return os.path.join(self._ticker_dir(ticker), f"date={d.strftime('%Y-%m-%d')}.parquet")
+
+    def _month_path(self, ticker, ym):
+        return os.path.join(self._ticker_dir(ticker), f"month={ym}.parquet")
+
+    # ファイル一覧 [(開始日, 終了日, パス)] を開始日順で返す
+    def _partitions(self, ticker):
+        parts = []
+        for p in glob.glob(os.path.join(self._ticker_dir(ticker), '*.parquet')):
+            key, val = os.path.basename(p)[:-len('.parquet')].split('=', 1)
+            if key == 'date':
+                d = date.fromisoformat(val); parts.append((d, d, p))
+            elif key == 'month':
+                first = date.fromisoformat(val + '-01')
+                last = (pd.Timestamp(first) + pd.offsets.MonthEnd(0)).date()
+                parts.append((first, last, p))
+        return sorted(parts)
+
+    # --- 読み書き ---
+    @staticmethod
+    def _to_table(df):
+        if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
+        idx = df.index.tz_localize('UTC') if df.index.tzinfo is None else df.index.tz_convert('UTC')
+        out = df.copy(); out.index = idx; out.index.name = TS_COL
+        return out.reset_index()
+
+    @staticmethod
+    def _merge(old, new):
+        if old is None or old.empty: merged = new
+        else: merged = pd.concat([old, new], ignore_index=True)
+        return merged.drop_duplicates(subset=TS_COL, keep='last').sort_values(TS_COL).reset_index(drop=True)
+
+    @staticmethod
+    def _save(tbl, path):
+        tbl.to_parquet(path, index=False, row_group_size=ROW_GROUP_ROWS)
+
+    def write(self, ticker, df):
+        """5分足を追記する。同じ時刻の足は新しい値で上書き。"""
+        if df is None or df.empty: return 0
+        tbl = self._to_table(df)
+        tbl = tbl[tbl[TS_COL].notna()]
+        os.makedirs(self._ticker_dir(ticker), exist_ok=True)
+        months = {os.path.basename(p): p for _, _, p in self._partitions(ticker) if os.path.basename(p).startswith('month=')}
+        local_day = tbl[TS_COL].dt.tz_convert(TZ).dt.date
+        for d, part in tbl.groupby(local_day, sort=True):
+            m_path = self._month_path(ticker, d.strftime('%Y-%m'))
+            path = m_path if os.path.basename(m_path) in months else self._day_path(ticker, d)
+            old = pd.read_parquet(path) if os.path.exists(path) else None
+            self._save(self._merge(old, part), path)
+        return len(tbl)
+
+    def first_timestamp(self, ticker):
+        """保存済みの最古の足の時刻 (東京時間)。未保存なら None。"""
+        parts = self._partitions(ticker)
+        if not parts: return None
+        ts = pd.read_parquet(parts[0][2], columns=[TS_COL])[TS_COL]
+        return ts.min().tz_convert(TZ) if not ts.empty else None
+
+    def last_timestamp(self, ticker):
+        """保存済みの最新の足の時刻 (東京時間)。未保存なら None。"""
+        parts = self._partitions(ticker)
+        if not parts: return None
+        ts = pd.read_parquet(parts[-1][2], columns=[TS_COL])[TS_COL]
+        return ts.max().tz_convert(TZ) if not ts.empty else None
+
+    def read(self, ticker, start=None, end=None):
+        """[start, end] の日付範囲にかかるファイルだけを、範囲外の行グループを読み飛ばして読み込み、東京時間インデックスで返す。"""
+        s_day = pd.Timestamp(start).date() if start is not None else date.min
+        e_day = pd.Timestamp(end).date() if end is not None else date.max
+        # 東京時間の [s_day 0:00, e_day 翌日 0:00) を UTC で
+        filters = []
+        if start is not None: filters.append((TS_COL, '>=', pd.Timestamp(s_day, tz=TZ).tz_convert('UTC')))
+        if end is not None: filters.append((TS_COL, '<', (pd.Timestamp(e_day, tz=TZ) + pd.Timedelta(days=1)).tz_convert('UTC')))
+        frames = []
+        for first, last, p in self._partitions(ticker):
+            if last < s_day or first > e_day: continue
+            frames.append(pd.read_parquet(p, filters=filters or None))
+        if not frames: return pd.DataFrame()
+        tbl = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        df = tbl.set_index(TS_COL).sort_index()
+        df.index = df.index.tz_convert(TZ)
+        return df
+
+    # --- メンテナンス ---
+    def compact(self, ticker, today=None):
+        """当月より前の日ごとのファイルを月単位のファイルにまとめる。まとめたファイル数を返す。"""
+        cur_month = (today or datetime.now()).strftime('%Y-%m')
+        by_month = {}
+        for first, _, p in self._partitions(ticker):
+            if os.path.basename(p).startswith('date=') and first.strftime('%Y-%m') < cur_month:
+                by_month.setdefault(first.strftime('%Y-%m'), []).append(p)
+        n = 0
+        for ym, paths in by_month.items():
+            m_path = self._month_path(ticker, ym)
+            old = pd.read_parquet(m_path) if os.path.exists(m_path) else None
+            new = pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+            self._save(self._merge(old, new), m_path)
+            for p in paths: os.remove(p)
+            n += len(paths)
+        return n
+
+    def total_bytes(self):
+        return sum(os.path.getsize(p) for p in glob.glob(os.path.join(self.root, '*', '*.parquet')))
+
+    def enforce_size_cap(self, max_bytes=None):
+        """合計サイズが上限を超えていれば、古い期間のファイルから削除する。削除したファイル数を返す。"""
+        cap = max_bytes or self.max_bytes
+        if not cap or not os.path.isdir(self.root): return 0
+        files = []
+        for t in os.listdir(self.root):
+            for first, _, p in self._partitions(t): files.append((first, p, os.path.getsize(p)))
+        total = sum(sz for _, _, sz in files); n = 0
+        for _, p, sz in sorted(files):
+            if total <= cap: break
+            os.remove(p); total -= sz; n += 1
+        return n
@@ -0,0 +1,164 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+# --- 5分足の正規化済み形式 (取り込み時に1回だけ作る) ---
+# 提供元から受け取った5分足 (yfinance と同じ列) を、列ごとの連続した配列と場中の並びに1回だけ変換する (ingest_bars)。
+# 以後のシミュレーションでは MultiIndex 列の平坦化・タイムゾーン変換・コピー・日ごとの分割・日付文字列の作成を繰り返さない。
+#   価格: float32 に変換しても値が変わらなければ float32 (呼値に乗った価格はほぼこちら)、変わるなら float64 のまま。
+#   出来高: 整数で int32 に収まれば int32、それ以外 (NaN を含むなど) は float64。どちらも計算では float64 に戻すので結果は変わらない。
+#   時刻: UTC の ns (int64)。東京時間は夏時間がないので、日付・時刻は UTC + 9 時間の整数演算で求める。
+#   場中 (09:00～15:00、両端含む) の足の位置を日付順に並べ、日ごとの区間・日付・時間枠・当日の累積 VWAP も取り込み時に求める
+#   (backtest_engine.session_arrays と同じ並び・同じ値)。
+# frame() で normalize_bars と同じ DataFrame に戻せる (インジケーターの計算など DataFrame が必要な処理用)。
+# arrays() / meta() と from_arrays() で配列のまま受け渡しできる (プロセス並列で共有メモリに置き、ワーカーでコピーせずに組み立てる)。
+# 行ハッシュは持たず、その要約 (digest、インジケーターキャッシュのキー) だけを持つ。
+
+BAR_COLS = ['Open', 'High', 'Low', 'Close', 'Volume']
+PRICE_COLS = ['Open', 'High', 'Low', 'Close']
+TZ = 'Asia/Tokyo'
+TZ_OFFSET_US = 9 * 3600 * 1_000_000   # 東京時間 - UTC
+DAY_US = 86_400_000_000
+OPEN_US, CLOSE_US = 9 * 3600 * 1_000_000, 15 * 3600 * 1_000_000
+SLOT_US = 5 * 60 * 1_000_000
+ARRAY_FIELDS = ['ns', 'sel', 'starts', 'ends', 'day_nums', 'day', 'slot', 'vwap']   # arrays() で渡す配列 (列は 'col:' + 列名)
+
+
+# float32 で値が変わらなければ float32
+def _compact_price(a):
+    b = a.astype(np.float32)
+    return b if np.array_equal(b.astype(np.float64), a, equal_nan=True) else a
+
+
+# 整数で int32 に収まれば int32
+def _compact_volume(a):
+    if a.size and not (np.isfinite(a).all() and (a == np.round(a)).all() and np.abs(a).max() < 2**31): return a
+    return a.astype(np.int32)
+
+
+class Bars:
+    """
+    1銘柄の正規化済み5分足 (変更不可)。ingest_bars で作る。
+    ns: 足の開始時刻 (UTC ns、元の順)、cols: BAR_COLS の配列、digest: normalize_bars の結果の行ハッシュの要約 (rows_digest)。
+    場中の並び: sel (足の位置、日付順)、starts / ends (日ごとの sel の区間)、dates ('YYYY-MM-DD')、day_nums (1970-01-01 からの日数)、
+    day (sel の足ごとの日の位置)、slot (sel の足ごとの 09:00 からの5分枠、5分刻みでない足は -1)、vwap (sel の足ごとの当日の累積 VWAP)。
+    """
+
+    def __init__(self, df):
+        """df: normalize_bars の結果 (東京時間のインデックス、BAR_COLS)。"""
+        self.ns = df.index.as_unit('ns').asi8.copy()
+        self.unit = df.index.unit; self.index_name = df.index.name
+        self.dtypes = {c: df[c].dtype for c in BAR_COLS}
+        self.cols = {c: _compact_price(df[c].to_numpy(dtype=np.float64)) for c in PRICE_COLS}
+        self.cols['Volume'] = _compact_volume(df['Volume'].to_numpy(dtype=np.float64))
+        self.digest = rows_digest(row_hash(df))
+        self._index = None
+
+        wall = self.ns // 1000 + TZ_OFFSET_US
+        day_code, tod = np.divmod(wall, DAY_US)
+        sel = np.flatnonzero((tod >= OPEN_US) & (tod <= CLOSE_US))
+        sel = sel[np.argsort(day_code[sel], kind='stable')]
+        self.sel = sel.astype(np.int32)
+        bounds = np.flatnonzero(np.diff(day_code[sel])) + 1
+        self.starts = np.r_[0, bounds].astype(np.int64) if sel.size else np.zeros(0, dtype=np.int64)
+        self.ends = np.r_[bounds, sel.size].astype(np.int64) if sel.size else np.zeros(0, dtype=np.int64)
+        self.day_nums = day_code[sel][self.starts]
+        self.dates = [str(d) for d in self.day_nums.astype('datetime64[D]')]
+        self.day = np.repeat(np.arange(len(self.starts), dtype=np.int16 if len(self.starts) < 2**15 else np.int32), self.ends - self.starts)
+        slot, rem = np.divmod(tod[sel] - OPEN_US, SLOT_US)
+        self.slot = np.where(rem == 0, slot, -1).astype(np.int16)
+        # 日ごとの VWAP (session_arrays と同じ計算)
+        close, vol = self.column('Close')[sel], self.column('Volume')[sel]
+        self.vwap = np.empty(sel.size)
+        for a, b in zip(self.starts, self.ends):
+            v_cum = _nancumsum(vol[a:b]); v_cum[v_cum == 0] = np.nan
+            self.vwap[a:b] = _nancumsum(close[a:b] * vol[a:b]) / v_cum
+
+    def __len__(self):
+        return len(self.ns)
+
+    @property
+    def empty(self):
+        return len(self.ns) == 0
+
+    @property
+    def nbytes(self):
+        return (self.ns.nbytes + sum(a.nbytes for a in self.cols.values()) + self.sel.nbytes
+                + self.day.nbytes + self.slot.nbytes + self.vwap.nbytes + self.starts.nbytes + self.ends.nbytes)
+
+    def column(self, c):
+        """列の値 (float64)。"""
+        return self.cols[c].astype(np.float64)
+
+    @property
+    def index(self):
+        """東京時間の DatetimeIndex (最初に使ったときに作る)。"""
+        if self._index is None:
+            self._index = pd.DatetimeIndex(self.ns.view('datetime64[ns]'), name=self.index_name).as_unit(self.unit).tz_localize('UTC').tz_convert(TZ)
+        return self._index
+
+    def __getitem__(self, c):
+        return pd.Series(self.column(c).astype(self.dtypes[c]), index=self.index, name=c)
+
+    def frame(self):
+        """normalize_bars と同じ DataFrame。"""
+        return pd.DataFrame({c: self.column(c).astype(self.dtypes[c]) for c in BAR_COLS}, index=self.index)
+
+    def tod(self):
+        """場中の足 (sel の順) の 0時からのマイクロ秒。"""
+        return (self.ns[self.sel] // 1000 + TZ_OFFSET_US) % DAY_US
+
+    def cells(self):
+        """パネル用 (panel_engine._cells と同じ): (sel, day_nums, day, slot)。5分刻みでない・重複・日の中で逆順の足があれば None。"""
+        key = self.day.astype(np.int64) * (CLOSE_US // SLOT_US + 1) + self.slot
+        if (self.slot < 0).any() or (np.diff(key) <= 0).any(): return None
+        return self.sel.astype(np.int64), self.day_nums, self.day.astype(np.int64), self.slot.astype(np.int64)
+
+    def arrays(self):
+        """{名前: 配列} (ARRAY_FIELDS と 'col:' + 列名)。型は取り込み時のまま。"""
+        return {**{f: getattr(self, f) for f in ARRAY_FIELDS}, **{'col:' + c: a for c, a in self.cols.items()}}
+
+    def meta(self):
+        """配列以外の情報 (from_arrays に渡す)。"""
+        return {'digest': self.digest, 'unit': self.unit, 'index_name': self.index_name, 'dtypes': self.dtypes}
+
+    @classmethod
+    def from_arrays(cls, meta, arrays):
+        """arrays() / meta() の結果から組み立てる (配列はコピーしない。日付の文字列だけ作り直す)。"""
+        b = cls.__new__(cls)
+        b.__dict__.update(meta); b._index = None
+        for f in ARRAY_FIELDS: setattr(b, f, arrays[f])
+        b.cols = {c: arrays['col:' + c] for c in BAR_COLS}
+        b.dates = [str(d) for d in b.day_nums.astype('datetime64[D]')]
+        return b
+
+    def __getstate__(self):
+        st = dict(self.__dict__); st['_index'] = None
+        return st
+
+
+def row_hash(df):
+    """行ごとのハッシュ (インデックスを含む)。"""
+    return pd.util.hash_pandas_object(df, index=True).to_numpy()
+
+
+def rows_digest(row_hashes):
+    """行ハッシュ全体の要約 (16 バイト)。"""
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).digest()
+
+
+# pandas の cumsum (skipna) と同じ結果になる累積和
+def _nancumsum(a):
+    mask = np.isnan(a)
+    out = np.cumsum(np.where(mask, 0.0, a))
+    out[mask] = np.nan
+    return out
+
+
+def ingest_bars(df):
+    """提供元の5分足 (DataFrame) → Bars。Bars ならそのまま返す。"""
+    if isinstance(df, Bars): return df
+    if isinstance(df.columns, pd.MultiIndex): df = df.copy(); df.columns = df.columns.get_level_values(0)
+    df = df[BAR_COLS]
+    df = df.set_axis(df.index.tz_localize('UTC').tz_convert(TZ) if df.index.tzinfo is None else df.index.tz_convert(TZ), axis=0)
+    return Bars(df)
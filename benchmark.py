@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time as _time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from backtest_engine import DEFAULT_PARAMS, add_indicators, session_arrays, simulate_sessions, summarize_trades
+from bars import ingest_bars
+from indicator_cache import IND_COLS
+from market_data import build_daily_stats_maps
+from analytics import compute_analytics
+from report import build_summary_report, build_trade_log
+from trade_buffer import TradeBuffer
+from panel_engine import build_panel, simulate_panel
+from live_scanner import TickerStream
+
+# --- ベンチマーク (合成データでパイプラインの各段階を計測) ---
+# 東証の場中 (09:00～11:30 / 12:30～15:00) の5分足と、それに対応する日足を乱数で生成し、
+# 日足マップ → 取り込み (ingest_bars) → インジケーター → 日ごとの分割 → エントリー/決済判定 → 集計 → レポート (タブの集計 + テキスト) の各段階の時間を計る。
+# 取り込み以降はアプリ・CLI と同じく Bars を入力にする (market_data.fetch_intraday の出力と同じ経路)。
+# panel は同じインジケーター付きの足から 銘柄 × 日 × 時間枠 のパネルを作って一括判定するまでの時間 (分割 + 判定の代わり)。
+# 結果は JSON に保存し、--baseline で過去の結果と比べて閾値を超えて遅くなった段階があれば終了コード 1 を返す。
+#   python benchmark.py --tickers 20 --days 59 --out bench.json
+#   python benchmark.py --tickers 20 --days 59 --baseline bench.json --threshold 0.25
+# --live は live_scanner の1本あたりの更新時間を履歴の日数ごとに計る (履歴の長さによらず一定であることの確認)。
+#   python benchmark.py --live 5,20,59,250
+
+TZ = 'Asia/Tokyo'
+STAGES = ['daily_maps', 'ingest', 'indicators', 'day_split', 'entry_exit', 'aggregate', 'report', 'panel']
+WARMUP_DAYS = 20        # ATR(14) 用に日足だけ余分に作る日数
+MIN_REGRESSION_SEC = 0.005   # これより小さい差は計測誤差として無視
+
+
+# 東証の呼値 (売買単位の簡易版)
+def _tick_size(p):
+    return 1.0 if p <= 3000 else 5.0 if p <= 5000 else 10.0 if p <= 30000 else 50.0
+
+
+def _session_slots():
+    """1日の5分足の開始時刻 (0時からの分)。前場 09:00～11:25、後場 12:30～14:55。"""
+    return [m for m in range(9 * 60, 15 * 60, 5) if not 11 * 60 + 30 <= m < 12 * 60 + 30]
+
+
+def make_synthetic_ticker(n_days, seed=0, start='2026-01-05', price=None, nan_rate=0.0):
+    """
+    1銘柄分の合成データ (5分足, 日足) を返す。どちらも yfinance と同じ列・東京時間のインデックス。
+    寄付ギャップ・場中のランダムウォーク・寄付/引け付近の出来高の膨らみ・呼値への丸めを再現する。
+    日足は ATR 用に WARMUP_DAYS 日分だけ5分足より前から始まる。
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start, periods=n_days + WARMUP_DAYS)
+    slots = np.array(_session_slots()); n_slot = len(slots)
+    p = float(price or rng.uniform(500, 8000))
+    vol_base = rng.uniform(5_000, 200_000)
+    u_shape = 1.0 + 2.0 * np.exp(-np.arange(n_slot) / 4) + 1.0 * np.exp(-(n_slot - 1 - np.arange(n_slot)) / 4)
+
+    opens = np.empty((len(days), n_slot)); closes = np.empty_like(opens)
+    highs = np.empty_like(opens); lows = np.empty_like(opens); vols = np.empty_like(opens)
+    for k in range(len(days)):
+        p *= 1 + rng.normal(0, 0.008)   # 寄付ギャップ
+        ret = rng.normal(0, 0.0025, n_slot) + rng.normal(0, 0.0005)
+        c = p * np.cumprod(1 + ret)
+        o = np.r_[p, c[:-1]]
+        h = np.maximum(o, c) * (1 + np.abs(rng.normal(0, 0.0012, n_slot)))
+        l = np.minimum(o, c) * (1 - np.abs(rng.normal(0, 0.0012, n_slot)))
+        tick = _tick_size(p)
+        opens[k], closes[k] = np.round(o / tick) * tick, np.round(c / tick) * tick
+        highs[k] = np.maximum(np.ceil(h / tick) * tick, np.maximum(opens[k], closes[k]))
+        lows[k] = np.minimum(np.floor(l / tick) * tick, np.minimum(opens[k], closes[k]))
+        vols[k] = np.round(vol_base * u_shape * rng.lognormal(0, 0.6, n_slot) / 100) * 100
+        p = c[-1]
+
+    d0 = pd.DatetimeIndex(days).tz_localize(TZ)
+    daily = pd.DataFrame({'Open': opens[:, 0], 'High': highs.max(axis=1), 'Low': lows.min(axis=1),
+                          'Close': closes[:, -1], 'Adj Close': closes[:, -1], 'Volume': vols.sum(axis=1)}, index=d0)
+    daily.index.name = 'Date'
+
+    ix = slice(WARMUP_DAYS, None)
+    idx = (d0[ix].repeat(n_slot) + pd.to_timedelta(np.tile(slots, n_days), unit='min'))
+    intraday = pd.DataFrame({'Open': opens[ix].ravel(), 'High': highs[ix].ravel(), 'Low': lows[ix].ravel(),
+                             'Close': closes[ix].ravel(), 'Adj Close': closes[ix].ravel(), 'Volume': vols[ix].ravel()}, index=idx)
+    intraday.index.name = 'Datetime'
+    if nan_rate:
+        m = rng.random(len(intraday)) < nan_rate
+        intraday.loc[m, ['Open', 'High', 'Low', 'Close', 'Adj Close']] = np.nan
+    return intraday, daily
+
+
+def make_synthetic_universe(n_tickers, n_days, seed=0, start='2026-01-05'):
+    """{銘柄: (5分足, 日足)}。銘柄コードは 9000.T から連番。"""
+    return {f"{9000 + i}.T": make_synthetic_ticker(n_days, seed=seed * 100_003 + i, start=start) for i in range(n_tickers)}
+
+
+# --- 計測 ---
+def run_pipeline(universe, params, timings):
+    """全銘柄を段階ごとに処理し、各段階の所要時間 (秒) を timings[段階] に加算する。トレード一覧を返す。"""
+    def timed(stage, fn):
+        t0 = _time.perf_counter(); out = fn(); timings[stage] += _time.perf_counter() - t0
+        return out
+
+    maps = timed('daily_maps', lambda: {t: build_daily_stats_maps(d.copy()) for t, (_, d) in universe.items()})
+    bars = timed('ingest', lambda: {t: ingest_bars(df) for t, (df, _) in universe.items()})
+    ind = timed('indicators', lambda: {t: add_indicators(b)[IND_COLS].reset_index(drop=True) for t, b in bars.items()})
+    sess = timed('day_split', lambda: {t: session_arrays(df, bars[t]) for t, df in ind.items()})
+    trades = timed('entry_exit', lambda: {t: simulate_sessions(t, S, *maps[t], params) if S is not None else [] for t, S in sess.items()})
+    def aggregate():
+        for tt in trades.values():
+            if tt: summarize_trades(tt)
+        return TradeBuffer.concat(trades.values()).to_frame()
+    res_df = timed('aggregate', aggregate)
+    if not res_df.empty:
+        names = {t: t for t in universe}
+        s_date, e_date = res_df['Entry'].min(), res_df['Exit'].max()
+        def report():
+            ana = compute_analytics(res_df)
+            return build_summary_report(ana['summary'], names, s_date, e_date), build_trade_log(res_df, names)
+        timed('report', report)
+    timed('panel', lambda: simulate_panel(build_panel([(t, df, maps[t], bars[t]) for t, df in ind.items()])[0], params))
+    return res_df
+
+
+def run_benchmark(n_tickers=20, n_days=59, repeat=3, seed=0, params=None):
+    """repeat 回計測し、段階ごとの 最小・中央値 (秒) と実行条件を辞書で返す。"""
+    params = params or DEFAULT_PARAMS
+    universe = make_synthetic_universe(n_tickers, n_days, seed)
+    runs = {s: [] for s in STAGES}; n_trades = 0
+    for _ in range(repeat):
+        timings = dict.fromkeys(STAGES, 0.0)
+        n_trades = len(run_pipeline(universe, params, timings))
+        for s in STAGES: runs[s].append(timings[s])
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'config': {'tickers': n_tickers, 'days': n_days, 'repeat': repeat, 'seed': seed,
+                   'bars': int(sum(len(df) for df, _ in universe.values())), 'trades': n_trades},
+        'env': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'stages': {s: {'min': min(v), 'median': float(np.median(v)), 'runs': v} for s, v in runs.items()},
+    }
+
+
+def run_live_benchmark(history_days=(5, 20, 59, 250), seed=0, params=None):
+    """履歴の日数ごとに、warm_up 後の1日分の足を TickerStream.update で流したときの1本あたりの時間 (マイクロ秒) を返す。"""
+    params = params or DEFAULT_PARAMS
+    out = {}
+    for nd in history_days:
+        intraday, daily = make_synthetic_ticker(nd + 1, seed=seed)
+        last = intraday.index.normalize()[-1]
+        s = TickerStream("9000.T", build_daily_stats_maps(daily.copy()), params)
+        s.warm_up(intraday[intraday.index < last])
+        today = intraday[intraday.index >= last]
+        rows = list(zip(today.index, today.itertuples(index=False)))
+        t0 = _time.perf_counter()
+        for ts, r in rows: s.update(ts, r.Open, r.High, r.Low, r.Close, r.Volume)
+        out[nd] = (_time.perf_counter() - t0) / len(rows) * 1e6
+    return out
+
+
+def check_regression(result, baseline, threshold=0.25, min_abs=MIN_REGRESSION_SEC):
+    """中央値が基準より threshold (割合) 以上かつ min_abs 秒以上遅くなった段階の一覧 [(段階, 基準, 今回)]。"""
+    slow = []
+    for s, cur in result['stages'].items():
+        base = baseline.get('stages', {}).get(s)
+        if not base: continue
+        b, c = base['median'], cur['median']
+        if c > b * (1 + threshold) and c - b > min_abs: slow.append((s, b, c))
+    return slow
+
+
+def _format(result, baseline=None):
+    lines = [f"{'stage':<12}{'median':>10}{'min':>10}" + (f"{'base':>10}{'ratio':>8}" if baseline else "")]
+    for s, v in result['stages'].items():
+        line = f"{s:<12}{v['median']*1000:>8.1f}ms{v['min']*1000:>8.1f}ms"
+        b = (baseline or {}).get('stages', {}).get(s)
+        if b: line += f"{b['median']*1000:>8.1f}ms{v['median']/b['median'] if b['median'] else float('nan'):>8.2f}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="合成データによるバックテストのベンチマーク")
+    ap.add_argument('--tickers', type=int, default=20)
+    ap.add_argument('--days', type=int, default=59)
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--out', help="結果の JSON の保存先")
+    ap.add_argument('--baseline', help="比較する過去の結果の JSON")
+    ap.add_argument('--threshold', type=float, default=0.25, help="中央値がこの割合以上遅くなったら失敗 (既定 0.25 = 25%%)")
+    ap.add_argument('--live', help="ライブ更新の1本あたりの時間を計る履歴の日数 (カンマ区切り、例 5,20,59,250)")
+    args = ap.parse_args(argv)
+
+    if args.live:
+        for nd, us in run_live_benchmark([int(v) for v in args.live.split(',')], args.seed).items():
+            print(f"live update, {nd:>4} days of history: {us:6.1f} us/bar")
+        return 0
+
+    result = run_benchmark(args.tickers, args.days, args.repeat, args.seed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f)
+    cfg = result['config']
+    print(f"{cfg['tickers']} tickers x {cfg['days']} days = {cfg['bars']:,} bars, {cfg['trades']} trades, repeat {cfg['repeat']}")
+    print(_format(result, baseline))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f: json.dump(result, f, ensure_ascii=False, indent=2)
+    if baseline:
+        if baseline.get('config', {}).get('bars') != cfg['bars']: print("warning: baseline was measured on a different data size")
+        slow = check_regression(result, baseline, args.threshold)
+        for s, b, c in slow: print(f"REGRESSION {s}: {b*1000:.1f}ms -> {c*1000:.1f}ms (+{(c/b - 1):.0%})")
+        if slow: return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
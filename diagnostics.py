@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import functools
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+
+# --- 処理段階ごとの計測 (診断用) ---
+# Recorder に 段階 (取得・インジケーター・日分割・シミュレーション・表示 など) ごと / 銘柄ごとの 経過時間と呼び出し回数、
+# st.cache_data で包んだ関数のヒット / ミス数を記録する。記録先はスレッドごとに bind() で結び付け、
+# 結び付けがなければ stage() などは何もしない (通常の実行ではほぼ負担にならない)。
+# fetch_pipeline は呼び出し元の Recorder を取得・計算スレッドにも結び付ける。プロセス並列のワーカー内は記録しない。
+# 段階は入れ子になり得る (例: pipeline.fetch の中の provider.intraday) ので、段階の時間の合計は実行時間を超えることがある。
+
+DIAG_DIR = os.environ.get("BACKTESTER_DIAG_DIR", ".diagnostics")
+_local = threading.local()
+
+
+class Recorder:
+    """1回の実行 (バックテスト・ランキングなど) の段階別の時間・回数とキャッシュのヒット / ミス数。"""
+
+    def __init__(self, label=""):
+        self.label = label
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = datetime.now()
+        self._t0 = time.perf_counter(); self.wall = None
+        self._lock = threading.Lock()
+        self.stages = {}      # 段階 -> [回数, 秒]
+        self.tickers = {}     # (銘柄, 段階) -> [回数, 秒]
+        self.cache = {}       # 関数名 -> [ヒット, ミス]
+        self.profiler = None; self.profile_path = None   # SamplingProfiler とその出力先 (diagnosed(profile=True) の場合)
+
+    def add(self, stage, seconds, ticker=None):
+        with self._lock:
+            s = self.stages.setdefault(stage, [0, 0.0]); s[0] += 1; s[1] += seconds
+            if ticker is not None:
+                s = self.tickers.setdefault((ticker, stage), [0, 0.0]); s[0] += 1; s[1] += seconds
+
+    def count_cache(self, name, hit):
+        with self._lock:
+            self.cache.setdefault(name, [0, 0])[0 if hit else 1] += 1
+
+    def finish(self):
+        self.wall = time.perf_counter() - self._t0
+
+    def stage_frame(self):
+        """段階ごとの 回数・合計秒・1回あたりミリ秒・実行時間に対する割合 (時間の長い順)。"""
+        wall = self.wall or (time.perf_counter() - self._t0)
+        with self._lock: rows = [(k, n, s) for k, (n, s) in self.stages.items()]
+        df = pd.DataFrame(rows, columns=['段階', '回数', '秒'])
+        df['ms/回'] = df['秒'] / df['回数'].clip(lower=1) * 1e3
+        df['割合'] = df['秒'] / wall if wall > 0 else 0.0
+        return df.sort_values('秒', ascending=False, ignore_index=True)
+
+    def ticker_frame(self):
+        """銘柄 × 段階 の合計秒 (合計の長い順)。"""
+        with self._lock: rows = [(t, k, s) for (t, k), (_, s) in self.tickers.items()]
+        if not rows: return pd.DataFrame(columns=['銘柄', '合計'])
+        df = pd.DataFrame(rows, columns=['銘柄', '段階', '秒']).pivot_table(index='銘柄', columns='段階', values='秒', aggfunc='sum', fill_value=0.0)
+        df.insert(0, '合計', df.sum(axis=1))
+        return df.sort_values('合計', ascending=False).reset_index().rename_axis(columns=None)
+
+    def cache_frame(self):
+        with self._lock: rows = [(k, h, m) for k, (h, m) in self.cache.items()]
+        df = pd.DataFrame(rows, columns=['関数', 'ヒット', 'ミス'])
+        df['ヒット率'] = df['ヒット'] / (df['ヒット'] + df['ミス']).clip(lower=1)
+        return df
+
+    def records(self):
+        """JSON Lines 用のレコード (実行 / 段階 / 銘柄ごとの段階 / キャッシュ / プロファイル)。"""
+        base = {'run': self.run_id}
+        out = [{**base, 'type': 'run', 'label': self.label, 'started': self.started.isoformat(timespec='seconds'), 'wall': self.wall}]
+        with self._lock:
+            out += [{**base, 'type': 'stage', 'stage': k, 'calls': n, 'seconds': s} for k, (n, s) in self.stages.items()]
+            out += [{**base, 'type': 'ticker', 'ticker': t, 'stage': k, 'calls': n, 'seconds': s} for (t, k), (n, s) in self.tickers.items()]
+            out += [{**base, 'type': 'cache', 'name': k, 'hits': h, 'misses': m} for k, (h, m) in self.cache.items()]
+        if self.profile_path: out.append({**base, 'type': 'profile', 'path': self.profile_path})
+        return out
+
+    def write_jsonl(self, path):
+        """records() を path に追記する (ディレクトリは作成)。"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for r in self.records(): f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        return path
+
+
+def current():
+    return getattr(_local, 'recorder', None)
+
+
+def bind(recorder):
+    """このスレッドの記録先を recorder にする (None で記録しない)。"""
+    _local.recorder = recorder
+
+
+@contextmanager
+def recording(recorder):
+    prev = current(); bind(recorder)
+    try: yield recorder
+    finally: bind(prev)
+
+
+@contextmanager
+def stage(name, ticker=None):
+    """with の中の経過時間を name の段階として記録する。"""
+    rec = current()
+    if rec is None: yield; return
+    t0 = time.perf_counter()
+    try: yield
+    finally: rec.add(name, time.perf_counter() - t0, ticker)
+
+
+def add(name, seconds, ticker=None):
+    rec = current()
+    if rec is not None: rec.add(name, seconds, ticker)
+
+
+def counted_cache(name, cache, fn):
+    """cache (st.cache_data(...) など) で包んだ fn を返し、呼び出しごとにヒット / ミスを記録する。
+    ミス = 包まれた fn が実際に呼ばれた場合 (同じスレッドで判定するので並行呼び出しでも混ざらない)。"""
+    @functools.wraps(fn)
+    def miss(*args, **kwargs):
+        _local.missed = True
+        return fn(*args, **kwargs)
+    cached = cache(miss)
+
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        rec = current()
+        if rec is None: return cached(*args, **kwargs)
+        _local.missed = False
+        try: return cached(*args, **kwargs)
+        finally: rec.count_cache(name, hit=not _local.missed)
+    return call
+
+
+def default_jsonl_path(directory=None):
+    return os.path.join(directory or DIAG_DIR, "diagnostics.jsonl")
+
+
+# --- サンプリングプロファイラ ---
+# interval 秒ごとに全スレッドのスタックを採取し、関数の並び (folded 形式: "スレッド;呼び出し元;...;関数 回数") ごとに数える。
+# cProfile は有効にしたスレッドしか計測しないが、スキャンの取得・計算はパイプラインのスレッドで動くので、こちらで全体を測る。
+# 出力は flamegraph.pl / speedscope でそのまま読める。
+class SamplingProfiler:
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter(); self.n_samples = 0
+        self._stop = threading.Event(); self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None: self._thread.join(); self._thread = None
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me: continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}"); frame = frame.f_back
+                self.samples[(names.get(ident, str(ident)),) + tuple(reversed(stack))] += 1
+            self.n_samples += 1
+
+    def folded(self):
+        """folded 形式の文字列 (スレッド名はスレッド番号を除いてまとめる)。"""
+        merged = Counter()
+        for (thread, *stack), n in self.samples.items(): merged[";".join([thread.rsplit("_", 1)[0]] + stack)] += n
+        return "".join(f"{k} {n}\n" for k, n in merged.most_common())
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f: f.write(self.folded())
+        return path
+
+    def top(self, n=30):
+        """関数ごとのサンプル数 (自身 = スタックの先頭にあった回数 / 合計 = スタックのどこかにあった回数) の上位 n 件。"""
+        own = Counter(); total = Counter()
+        for (_, *stack), k in self.samples.items():
+            if not stack: continue
+            own[stack[-1]] += k
+            for f in set(stack): total[f] += k
+        df = pd.DataFrame([(f, own[f], c) for f, c in total.items()], columns=['関数', '自身', '合計'])
+        return df.sort_values(['自身', '合計'], ascending=False, ignore_index=True).head(n)
+
+
+@contextmanager
+def diagnosed(label, profile=False, directory=None):
+    """label の実行を新しい Recorder に記録し (profile なら全スレッドのサンプリングも)、終了時に JSON Lines を追記する。"""
+    rec = Recorder(label); prof = SamplingProfiler().start() if profile else None
+    try:
+        with recording(rec): yield rec
+    finally:
+        rec.finish()
+        if prof is not None:
+            prof.stop(); rec.profiler = prof
+            rec.profile_path = prof.write(os.path.join(directory or DIAG_DIR, f"profile-{rec.run_id}.folded"))
+        rec.write_jsonl(default_jsonl_path(directory))
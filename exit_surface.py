@@ -0,0 +1,81 @@
+import itertools
+import numpy as np
+import pandas as pd
+from panel_engine import panel_from_data, panel_entries, stop_rate, EXIT_SLOTS
+from sweep import acc_metrics
+
+# --- 決済ルールの応答曲面 ---
+# エントリーは決済パラメータ (トレイリング開始・幅・損切り・ATR 倍率・最低損切り) によらないので、
+# エントリーごとのエントリー後の値動き (終値・安値・高値の累積最大) をパネルから1回だけ記録し (record_paths)、
+# 決済パラメータの格子の全組み合わせの 回数・勝率・PF・期待値 を記録した値動きの配列演算で求める (exit_surface)。
+# 決済は「トレーリング発動後に安値が 高値の累積最大 × (1 - 幅) 以下になる最初の枠」「安値が損切り価格以下になる最初の枠」
+# 「時間切れの枠」のうち最も早いもの (同じ枠ならこの順)。高値の累積最大は単調なので、発動の枠は開始幅ごと、
+# 発動後の最初の決済枠は幅ごとに1回求めれば、組み合わせごとの計算は エントリー数 の長さの配列の取り出しだけになる。
+# 1トレードごとの損益は、同じパラメータでパネル (= 配列エンジン) を実行したときと同じ。
+
+EXIT_KEYS = ('ts_start', 'ts_width', 'sl_fix', 'atr_mul', 'atr_min')
+
+
+def record_paths(data, params):
+    """
+    data: [(銘柄, 5分足, (p_map, o_map, a_map))] → エントリー後の値動き (dict) と、時間枠に乗らず除いた銘柄のリスト。
+    値動き: 'C' / 'L' / 't_high' (エントリー数, 時間枠)、'after' (エントリー足より後の枠)、'time_x' (時間切れの枠、なければ時間枠数)、
+    'entry_p'・'atr'・'atr_ok' (損切り幅の計算用)。エントリーがなければ None。
+    """
+    P, off_grid = panel_from_data(data)
+    E = panel_entries(P, params)
+    if E is None: return None, off_grid
+    time_x = _next_true(E['after'] & E['present'] & EXIT_SLOTS)[:, 0]
+    return {**{k: E[k] for k in ('e', 'C', 'L', 't_high', 'after', 'entry_p', 'atr', 'atr_ok')}, 'time_x': time_x}, off_grid
+
+
+# 各枠以降で B が真になる最初の枠 (行ごと、なければ枠数)。列は 枠数 + 1 (最後の列は「なし」から引いた場合の番兵)
+def _next_true(B):
+    R, K = B.shape
+    nxt = np.minimum.accumulate(np.where(B, np.arange(K), K)[:, ::-1], axis=1)[:, ::-1]
+    return np.concatenate([nxt, np.full((R, 1), K)], axis=1)
+
+
+def exit_surface(paths, grid, u_atr=True):
+    """
+    paths: record_paths の値動き、grid: EXIT_KEYS の各値のリスト (割合は小数)。ATR 損切りを使わない場合 atr_mul / atr_min は先頭の値だけ使う。
+    戻り値: 組み合わせごとの EXIT_KEYS・回数・勝率・PF・期待値 の DataFrame (ts_start, ts_width, 損切りの組み合わせ の順)。
+    """
+    ts_s = np.asarray(grid['ts_start'], dtype=np.float64); ts_w = np.asarray(grid['ts_width'], dtype=np.float64)
+    stops = list(itertools.product(grid['sl_fix'], grid['atr_mul'], grid['atr_min'])) if u_atr else [(v, grid['atr_mul'][0], grid['atr_min'][0]) for v in grid['sl_fix']]
+    acc = {k: np.zeros((len(ts_s), len(ts_w), len(stops))) for k in ('cnt', 'n_pnl', 'wins', 'g_win', 'g_loss')}
+    if paths is not None:
+        C, L, t_high, after, entry_p, time_x = (paths[k] for k in ('C', 'L', 't_high', 'after', 'entry_p', 'time_x'))
+        R, K = C.shape; rows = np.arange(R)
+        with np.errstate(invalid='ignore'):
+            # トレーリングの発動枠 (開始幅ごと) → 発動後に安値が決済水準以下になる最初の枠 (幅ごと)
+            act = np.stack([_next_true(after & (t_high >= entry_p[:, None] * (1 + s)))[:, 0] for s in ts_s], axis=1)
+            trail_x = np.stack([_next_true(after & (L <= t_high * (1 - w)))[rows[:, None], act] for w in ts_w], axis=2)   # (エントリー, 開始, 幅)
+        t_high_x = np.concatenate([t_high, np.full((R, 1), np.nan)], axis=1)[rows[:, None, None], trail_x]
+        trail_p = t_high_x * (1 - ts_w) * 0.9997
+        close_time = np.concatenate([C, np.full((R, 1), np.nan)], axis=1)[rows, time_x] * 0.9997
+        ep = entry_p[:, None, None]
+        for ci, (sl, am, amin) in enumerate(stops):
+            stop_p = entry_p * (1 - stop_rate(paths, sl, am, amin, u_atr))
+            with np.errstate(invalid='ignore'): stop_x = _next_true(after & (L <= stop_p[:, None]))[:, 0]
+            other_x = np.minimum(stop_x, time_x)
+            other_p = np.where(stop_x <= time_x, stop_p * 0.9997, close_time)
+            use_trail = trail_x <= other_x[:, None, None]
+            ex_p = np.where(use_trail, trail_p, other_p[:, None, None])
+            keep = (np.minimum(trail_x, other_x[:, None, None]) < K) & (ex_p != 0)
+            pnl = (ex_p - ep) / ep
+            valid = keep & ~np.isnan(pnl); p0 = np.where(valid, pnl, 0.0)
+            acc['cnt'][..., ci] = keep.sum(axis=0); acc['n_pnl'][..., ci] = valid.sum(axis=0); acc['wins'][..., ci] = (p0 > 0).sum(axis=0)
+            acc['g_win'][..., ci] = np.where(p0 > 0, p0, 0.0).sum(axis=0); acc['g_loss'][..., ci] = np.where(p0 <= 0, p0, 0.0).sum(axis=0)
+    win_rate, pf, exp = acc_metrics(**acc)
+    si, wi, ci = (a.ravel() for a in np.meshgrid(np.arange(len(ts_s)), np.arange(len(ts_w)), np.arange(len(stops)), indexing='ij'))
+    S = np.array(stops, dtype=np.float64).reshape(-1, 3)
+    return pd.DataFrame({'ts_start': ts_s[si], 'ts_width': ts_w[wi], 'sl_fix': S[ci, 0], 'atr_mul': S[ci, 1], 'atr_min': S[ci, 2],
+                         '回数': acc['cnt'].ravel().astype(int), '勝率': win_rate.ravel(), 'PF': pf.ravel(), '期待値': exp.ravel()})
+
+
+def surface_slice(surf, fixed):
+    """応答曲面のうち fixed ({パラメータ: 値}) に一致する組み合わせだけ (ヒートマップ用)。"""
+    m = np.ones(len(surf), dtype=bool)
+    for k, v in fixed.items(): m &= np.isclose(surf[k].to_numpy(), v)
+    return surf[m]
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import diagnostics
+
+# --- 取得とシミュレーションを重ねて実行するパイプライン ---
+# 取得 (ネットワーク待ち) はスレッドで最大 concurrency 件まで並行し、トークンバケットで1秒あたりの件数も制限する。
+# シミュレーションは専用の1スレッドで、データが届いた銘柄から順に実行する (取得待ちの間も次の取得が進む)。
+# 銘柄ごとに 取得時間 (fetch)・計算側がその銘柄のデータを待った時間 (wait)・計算時間 (compute) を記録する。
+# 呼び出し元のスレッドの diagnostics の記録先は取得・計算スレッドにも引き継ぎ、同じ時間を pipeline.* の段階として記録する。
+
+DEFAULT_CONCURRENCY = 4   # 同時に実行する取得の上限
+DEFAULT_RATE = None       # 1秒あたりの取得開始数の上限 (None で無制限。キャッシュ済みの取得も数えるので既定は無制限)
+
+
+class TokenBucket:
+    """1秒あたり rate 個のトークンを補充し、最大 burst 個まで貯めるレート制限。"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self.tokens = self.capacity
+        self._clock = clock; self._t = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self._t) * self.rate); self._t = now
+                if self.tokens >= 1: self.tokens -= 1; return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def run_pipeline(items, fetch, simulate, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, burst=None, progress=None, thread_initializer=None,
+                 on_result=None, should_stop=None):
+    """
+    items の各要素について fetch(item) -> データ を並行取得し、届いた順に simulate(item, データ) -> 結果 を実行する。
+    戻り値: (入力順の結果リスト, 入力順の所要時間リスト [{'item', 'fetch', 'wait', 'compute'} 秒])
+    on_result(item, 結果) と progress(item, 完了数, 全体数) は計算が1件終わるたびに呼ばれる (呼び出し元のスレッドで実行)。
+    should_stop() が真を返すと残りを取り消して終了する (未完了の要素の結果は None)。
+    thread_initializer は取得・計算スレッドの起動時に呼ばれる (Streamlit のコンテキストの引き継ぎなど)。
+    取得・計算で例外が出た場合は残りを取り消して、その例外を送出する。
+    """
+    items = list(items)
+    if not items: return [], []
+    return asyncio.run(_run(items, fetch, simulate, max(1, int(concurrency)), rate, burst, progress, thread_initializer, on_result, should_stop))
+
+
+async def _run(items, fetch, simulate, concurrency, rate, burst, progress, thread_initializer, on_result=None, should_stop=None):
+    loop = asyncio.get_running_loop()
+    rec = diagnostics.current()
+    def init():
+        diagnostics.bind(rec)
+        if thread_initializer: thread_initializer()
+    io_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fetch", initializer=init)
+    cpu_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="simulate", initializer=init)
+    sem = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate, burst) if rate else None
+    timings = [{'item': it, 'fetch': 0.0, 'wait': 0.0, 'compute': 0.0} for it in items]
+    results = [None] * len(items)
+
+    async def fetch_one(i):
+        async with sem:
+            if bucket: await bucket.acquire()
+            t0 = time.perf_counter()
+            data = await loop.run_in_executor(io_pool, fetch, items[i])
+            timings[i]['fetch'] = time.perf_counter() - t0
+            return i, data
+
+    tasks = [asyncio.create_task(fetch_one(i)) for i in range(len(items))]
+    try:
+        for n, fut in enumerate(asyncio.as_completed(tasks), 1):
+            w0 = time.perf_counter()
+            i, data = await fut
+            timings[i]['wait'] = time.perf_counter() - w0
+            c0 = time.perf_counter()
+            results[i] = await loop.run_in_executor(cpu_pool, simulate, items[i], data)
+            timings[i]['compute'] = time.perf_counter() - c0
+            if rec is not None:
+                for k in ('fetch', 'wait', 'compute'): rec.add(f"pipeline.{k}", timings[i][k], items[i])
+            if on_result: on_result(items[i], results[i])
+            if progress: progress(items[i], n, len(items))
+            if should_stop and should_stop(): break
+    finally:
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        io_pool.shutdown(wait=False, cancel_futures=True); cpu_pool.shutdown(wait=False, cancel_futures=True)
+    return results, timings
+
+
+def summarize_timings(timings):
+    """所要時間リストの合計 {'fetch', 'wait', 'compute', 'items'}。"""
+    return {'fetch': sum(t['fetch'] for t in timings), 'wait': sum(t['wait'] for t in timings),
+            'compute': sum(t['compute'] for t in timings), 'items': len(timings)}
+
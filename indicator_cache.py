@@ -0,0 +1,232 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from ta.trend import EMAIndicator
+from ta.momentum import RSIIndicator
+from bars import Bars, BAR_COLS, row_hash as _row_hash, rows_digest
+
+# --- インジケーター付き5分足のキャッシュ ---
+# キー: 銘柄 + 5分足の中身 (時刻・OHLCV) のハッシュ (Bars は取り込み時に求めた要約を使う)。戦略パラメータは含まないので、
+# サイドバーの決済設定などを変えただけの再実行ではインジケーターを再計算しない。
+# 保存するのはインジケーターの列 (IND_COLS、行の位置順) と行ハッシュだけで、OHLCV は持たない (足は Bars / 呼び出し元の DataFrame にある)。
+# Bars を渡すとインジケーターの列だけ (キャッシュと共有)、DataFrame を渡すと整形済みの足に列を付けた新しいフレームを返す。
+# 新しい足が末尾に追加された場合は、保存しておいた EWM の内部状態から追加分だけを計算する
+# (pandas の ewm(adjust=False) と同じ漸化式なので、全体を再計算した結果とビット単位で一致する)。
+# 複数のセッションやパイプラインの計算スレッドから同時に呼ばれるので、エントリーの参照・追加・削除はロックの中で行う
+# (インジケーターの計算そのものはロックの外。同じ足を同時に計算した場合は後から入れたほうが残る)。
+
+EXTEND_MAX_ROWS = 256   # これより多く追加された場合は全体を再計算したほうが速い
+IND_COLS = ['EMA5', 'RSI14', 'RSI14_P', 'MH', 'MH_P']
+
+# (名前, com, min_periods)  ※ pandas と同じく span / alpha を com に換算してから alpha を求める
+EWM_SPECS = {
+    'ema5': ((5 - 1) / 2, 5),          # EMA5
+    'fast': ((12 - 1) / 2, 12),        # MACD 短期
+    'slow': ((26 - 1) / 2, 26),        # MACD 長期
+    'sig': ((9 - 1) / 2, 9),           # MACD シグナル
+    'up': (1 / (1 / 14) - 1, 14),      # RSI 上昇幅
+    'dn': (1 / (1 / 14) - 1, 14),      # RSI 下落幅
+}
+
+
+# 5分足の整形 (MultiIndex 列の平坦化・必要列の抽出・東京時間への変換)。Bars (取り込み済み) は DataFrame に戻す
+def normalize_bars(df):
+    if isinstance(df, Bars): return df.frame()
+    if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
+    df = df[BAR_COLS].copy()
+    df.index = df.index.tz_localize('UTC').tz_convert('Asia/Tokyo') if df.index.tzinfo is None else df.index.tz_convert('Asia/Tokyo')
+    return df
+
+
+def compute_indicators(df):
+    """整形済みの5分足に EMA5 / RSI14 / MACD ヒストグラムを付与する (ta ライブラリと同じ値)。"""
+    ema_fast = EMAIndicator(close=df['Close'], window=12).ema_indicator()
+    ema_slow = EMAIndicator(close=df['Close'], window=26).ema_indicator()
+    macd_line = ema_fast - ema_slow
+    df['EMA5'] = EMAIndicator(close=df['Close'], window=5).ema_indicator()
+    df['RSI14'] = RSIIndicator(close=df['Close'], window=14).rsi()
+    df['RSI14_P'] = df['RSI14'].shift(1)
+    df['MH'] = macd_line - EMAIndicator(close=macd_line, window=9).ema_indicator(); df['MH_P'] = df['MH'].shift(1)
+    return df
+
+
+# --- EWM の漸化式 (pandas.core.window の ewm, adjust=False / ignore_na=False と同じ手順) ---
+def _ewm_step(state, cur, com):
+    w, old_wt, nobs = state
+    alpha = 1. / (1. + com)
+    obs = cur == cur
+    nobs += obs
+    if w == w:
+        old_wt *= 1. - alpha
+        if obs:
+            if w != cur:
+                w = old_wt * w + alpha * cur
+                w /= (old_wt + alpha)
+            old_wt = 1.
+    elif obs: w = cur
+    return (w, old_wt, nobs)
+
+
+def _ewm_out(state, minp):
+    return state[0] if state[2] >= minp else np.nan
+
+
+# 全体計算の結果から、i 行目を処理し終えた時点の EWM 状態を復元する (出力が NaN で隠れている場合は None)
+def _ewm_state_at(x, out, i, com, minp):
+    nobs = int(np.count_nonzero(~np.isnan(x[:i+1])))
+    if nobs < minp or np.isnan(out[i]): return None
+    k = 0
+    while k <= i and np.isnan(x[i-k]): k += 1
+    old_wt = 1.
+    for _ in range(k): old_wt *= 1. - 1. / (1. + com)
+    return (out[i], old_wt, nobs)
+
+
+def _rsi_inputs(close):
+    diff = close.diff(1)
+    return diff.where(diff > 0, 0.0), -diff.where(diff < 0, 0.0)
+
+
+def _snapshots(df, rows):
+    """各 rows 行目まで処理した時点の状態 (追加計算の起点) のリスト。復元できない行は None。"""
+    close = df['Close']
+    ema_fast = EMAIndicator(close=close, window=12).ema_indicator()
+    ema_slow = EMAIndicator(close=close, window=26).ema_indicator()
+    macd_line = ema_fast - ema_slow
+    up, dn = _rsi_inputs(close)
+    series = {
+        'ema5': (close, df['EMA5']), 'fast': (close, ema_fast), 'slow': (close, ema_slow),
+        'sig': (macd_line, EMAIndicator(close=macd_line, window=9).ema_indicator()),
+        'up': (up, up.ewm(alpha=1 / 14, min_periods=14, adjust=False).mean()),
+        'dn': (dn, dn.ewm(alpha=1 / 14, min_periods=14, adjust=False).mean()),
+    }
+    arrays = {name: (x.to_numpy(dtype=np.float64), out.to_numpy(dtype=np.float64)) for name, (x, out) in series.items()}
+    snaps = []
+    for i in rows:
+        st = {}
+        for name, (x, out) in arrays.items():
+            st[name] = _ewm_state_at(x, out, i, *EWM_SPECS[name]) if i >= 0 else None
+            if st[name] is None: break
+        else:
+            st['close'] = close.iloc[i]; st['rsi'] = df['RSI14'].iloc[i]; st['mh'] = df['MH'].iloc[i]
+            snaps.append(st); continue
+        snaps.append(None)
+    return snaps
+
+
+def step_indicators(st, cur):
+    """状態 st (_snapshots の1要素と同じ形) に終値 cur の足を1本追加する (st を更新)。(EMA5, RSI14, RSI14_P, MH, MH_P) を返す。"""
+    for name in ('ema5', 'fast', 'slow'): st[name] = _ewm_step(st[name], cur, EWM_SPECS[name][0])
+    macd = _ewm_out(st['fast'], 12) - _ewm_out(st['slow'], 26)
+    st['sig'] = _ewm_step(st['sig'], macd, EWM_SPECS['sig'][0])
+    diff = cur - st['close']
+    st['up'] = _ewm_step(st['up'], diff if diff > 0 else 0.0, EWM_SPECS['up'][0])
+    st['dn'] = _ewm_step(st['dn'], -diff if diff < 0 else -0.0, EWM_SPECS['dn'][0])
+    emaup, emadn = _ewm_out(st['up'], 14), _ewm_out(st['dn'], 14)
+    rsi = 100.0 if emadn == 0 else 100 - (100 / (1 + emaup / emadn))
+    mh = macd - _ewm_out(st['sig'], 9)
+    out = (_ewm_out(st['ema5'], 5), rsi, st['rsi'], mh, st['mh'])
+    st['close'] = cur; st['rsi'] = rsi; st['mh'] = mh
+    return out
+
+
+def initial_state():
+    """足が1本もない時点の状態 (最初の足から step_indicators で進めると compute_indicators と同じ値になる)。"""
+    return {**{name: (np.nan, 1.0, 0) for name in EWM_SPECS}, 'close': np.nan, 'rsi': np.nan, 'mh': np.nan}
+
+
+def _extend(old, start_state, new_bars):
+    """old (インジケーターの列、行の位置順) の末尾に new_bars (整形済みの5分足) の分を追加計算する。
+    (新しいフレーム, [1本前の状態, 最終行の状態]) を返す。"""
+    st = dict(start_state); prev = None
+    cols = {c: np.empty(len(new_bars)) for c in IND_COLS}
+    for r, cur in enumerate(new_bars['Close'].to_numpy(dtype=np.float64)):
+        prev = dict(st)
+        cols['EMA5'][r], cols['RSI14'][r], cols['RSI14_P'][r], cols['MH'][r], cols['MH_P'][r] = step_indicators(st, cur)
+    add = pd.DataFrame(cols, index=pd.RangeIndex(len(old), len(old) + len(new_bars)))
+    return pd.concat([old, add]), [prev, st]
+
+
+class IndicatorCache:
+    """銘柄 + 足データのハッシュをキーにしたインジケーターの列の LRU キャッシュ (メモリ量で上限管理、スレッドセーフ)。"""
+
+    def __init__(self, max_bytes=512 * 1024**2):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (インジケーターの列, 行ハッシュ, [1本前の状態, 最終行の状態], バイト数)
+        self._latest = {}               # 銘柄 -> 最新のキー (追加分の計算の起点)
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0; self.misses = 0; self.extends = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'extends': self.extends, 'entries': len(self._entries), 'bytes': self.nbytes}
+
+    def clear(self):
+        with self._lock: self._entries.clear(); self._latest.clear(); self.nbytes = 0
+
+    def get(self, ticker, df):
+        """
+        Bars → インジケーターの列 (IND_COLS、行の位置順の RangeIndex。キャッシュと共有しているので変更しないこと)。
+        DataFrame → 整形済みの5分足にインジケーターの列を付けた新しいフレーム (compute_indicators(normalize_bars(df)) と同じ)。
+        """
+        if isinstance(df, Bars): bars, digest = None, df.digest   # 取り込み時に求めた要約 (DataFrame に戻すのは計算が必要なときだけ)
+        else:
+            bars = normalize_bars(df); row_hash = _row_hash(bars); digest = rows_digest(row_hash)
+        key = hashlib.blake2b(ticker.encode() + digest, digest_size=16).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key); self.hits += 1
+                return _attach(bars, entry[0])
+            base_key = self._latest.get(ticker); base = self._entries.get(base_key)
+
+        if bars is None: bars = df.frame(); row_hash = _row_hash(bars)
+        extended = self._try_extend(base, bars, row_hash)
+        if extended is None:
+            full = compute_indicators(bars)   # DataFrame で渡された場合はこのまま返す
+            ind = full[IND_COLS].reset_index(drop=True)
+            states = _snapshots(full, [len(full) - 2, len(full) - 1])
+        else: ind, states = extended
+        entry = (ind, row_hash, states, int(ind.memory_usage(deep=True).sum() + row_hash.nbytes))
+        with self._lock:
+            if extended is None: self.misses += 1
+            else: self.extends += 1; self._drop(base_key)   # 追加計算した場合、元になった古い版は置き換える
+            self._put(ticker, key, entry)
+        return _attach(None if isinstance(df, Bars) else bars, ind)
+
+    # 既存のフレーム (base) が新しい足の先頭部分と一致すれば (最終足だけ更新された場合も含む)、追加分だけ計算する
+    @staticmethod
+    def _try_extend(base, bars, row_hash):
+        if base is None: return None
+        old, old_hash, states, _ = base
+        n_old = len(old_hash)
+        for keep, st in ((n_old, states[1]), (n_old - 1, states[0])):
+            if st is None or keep < 1 or not 0 < len(row_hash) - keep <= EXTEND_MAX_ROWS: continue
+            if np.array_equal(row_hash[:keep], old_hash[:keep]):
+                return _extend(old.iloc[:keep], st, bars.iloc[keep:])
+        return None
+
+    # 以下はロックの中で呼ぶ
+    def _drop(self, key):
+        if key in self._entries: self.nbytes -= self._entries.pop(key)[3]
+
+    def _put(self, ticker, key, entry):
+        self._drop(key)   # 同じ足を別のスレッドが先に入れていた場合
+        self._entries[key] = entry; self._latest[ticker] = key; self.nbytes += entry[3]
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, e = self._entries.popitem(last=False); self.nbytes -= e[3]
+        self._latest = {t: k for t, k in self._latest.items() if k in self._entries}
+
+
+# DataFrame で渡された場合は整形済みの足 (呼び出しごとのコピー) に列を付けて返す
+def _attach(bars, ind):
+    if bars is None: return ind
+    for c in IND_COLS: bars[c] = ind[c].to_numpy()
+    return bars
+
+
+INDICATOR_CACHE = IndicatorCache(max_bytes=int(os.environ.get("BACKTESTER_INDICATOR_CACHE_MB", "512")) * 1024**2)
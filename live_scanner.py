@@ -0,0 +1,210 @@
+import heapq
+import time as _time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from indicator_cache import normalize_bars, compute_indicators, initial_state, step_indicators, _snapshots
+from backtest_engine import EXIT_TIME, get_trade_pattern, _time_us
+from trade_buffer import TradeBuffer
+
+# --- ライブのシグナル検出 (5分足1本ごとの逐次更新) ---
+# 銘柄ごとに EMA5・RSI14 (Wilder)・MACD ヒストグラムの漸化式の状態、当日の累積 VWAP、建玉 (建値・損切り価格・高値の累積最大) を持ち、
+# 新しい5分足が届くたびに O(1) で更新して、バックテストの配列エンジンと同じ規則でエントリー / 決済のシグナルを出す。
+#   インジケーター: INDICATOR_CACHE の追加計算と同じ漸化式 (step_indicators) なので、全期間で計算した値とビット単位で一致する。
+#   前日終値・始値・ATR: バックテストと同じ日足マップ (当日分は場中に取得した日足から作る)。
+#   1日1トレードまで。場中 (09:00～15:00) に決済されなかった建玉はバックテストと同じくトレードにしない。
+# 更新にかかる時間は過去の足の本数によらない (過去の足は warm_up で状態にまとめる)。
+# ReplayFeed は保存済みの5分足を時刻順に1本ずつ流す (LocalFileProvider のアーカイブなどでライブの代わりに検証する)。
+# PollingFeed は提供元から当日の5分足を定期的に取り直し、確定した新しい足だけを流す。
+
+SESSION_START_US, SESSION_END_US = _time_us(datetime.min.time().replace(hour=9)), _time_us(datetime.min.time().replace(hour=15))
+EXIT_US = _time_us(EXIT_TIME)
+BAR_MINUTES = 5
+
+
+class TickerStream:
+    """1銘柄の逐次状態。update() に足を1本ずつ渡すと、その足で出たシグナル (dict) のリストを返す。"""
+
+    def __init__(self, ticker, daily_maps, params):
+        self.ticker = ticker
+        self.pc_map, self.co_map, self.a_map = daily_maps
+        self.params = params
+        self.ind = initial_state()
+        self.day = None; self.pos = None
+        self.bars = 0
+
+    def set_daily_maps(self, daily_maps):
+        """日足マップを差し替える (場中に当日の始値が取れたときなど)。"""
+        self.pc_map, self.co_map, self.a_map = daily_maps
+
+    def warm_up(self, history):
+        """
+        過去の5分足 (yfinance と同じ列) から状態を作る。最後の日の足は update() と同じく1本ずつ流して
+        当日の VWAP・建玉を復元し、その間に出たシグナルを返す (それより前の日はインジケーターの状態だけ)。
+        """
+        bars = normalize_bars(history)
+        if bars.empty: return []
+        wall = bars.index.tz_localize(None)
+        last_day = wall[-1].normalize()
+        k = int(np.searchsorted(wall, last_day))   # 最後の日の最初の足
+        if k > 0:
+            head = compute_indicators(bars.iloc[:k].copy())
+            st = _snapshots(head, [k - 1])[0]
+            if st is None:   # 末尾の NaN などで状態を復元できなければ最初の足から進める
+                st = initial_state()
+                for c in head['Close'].to_numpy(dtype=np.float64): step_indicators(st, c)
+            self.ind = st; self.bars = k
+        out = []
+        for ts, row in zip(bars.index[k:], bars.iloc[k:].itertuples(index=False)):
+            out += self.update(ts, row.Open, row.High, row.Low, row.Close, row.Volume)
+        return out
+
+    def update(self, ts, o, h, l, c, v):
+        """足 (ts は足の開始時刻、東京時間) を1本追加する。"""
+        ema5, rsi, rsi_p, mh, mh_p = step_indicators(self.ind, float(c))
+        self.bars += 1
+        ts = pd.Timestamp(ts)
+        ts = ts.tz_localize('UTC').tz_convert('Asia/Tokyo') if ts.tzinfo is None else ts.tz_convert('Asia/Tokyo')
+        tod = ((ts.hour * 60 + ts.minute) * 60 + ts.second) * 1_000_000 + ts.microsecond
+        if not SESSION_START_US <= tod <= SESSION_END_US: return []
+        date_str = ts.strftime('%Y-%m-%d')
+        if self.day is None or self.day['date'] != date_str: self._new_day(date_str)
+        d = self.day
+        # 当日の累積 VWAP (出来高・売買代金が NaN の足は足さず、その足の VWAP は NaN)
+        pv = c * v
+        if v == v: d['v'] += v
+        if pv == pv: d['pv'] += pv
+        vwap = d['pv'] / d['v'] if v == v and pv == pv and d['v'] != 0 else np.nan
+        bar = {'Close': c, 'High': h, 'Low': l, 'VWAP': vwap, 'EMA5': ema5, 'RSI14': rsi, 'RSI14_P': rsi_p, 'MH': mh, 'MH_P': mh_p}
+        if self.pos is None: return self._check_entry(ts, tod, bar) if d['active'] else []
+        return self._check_exit(ts, tod, bar)
+
+    def _new_day(self, date_str):
+        p = self.params
+        pc = self.pc_map.get(date_str); do = self.co_map.get(date_str)
+        gap_v = (do - pc) / pc if pc is not None and do is not None else None
+        self.day = {'date': date_str, 'pc': pc, 'do': do, 'gap': gap_v, 'av': self.a_map.get(date_str), 'pv': 0.0, 'v': 0.0,
+                    'active': gap_v is not None and p['g_min'] <= gap_v <= p['g_max']}   # 当日まだエントリーできるか
+        self.pos = None   # 持ち越しの建玉はトレードにしない
+
+    def _check_entry(self, ts, tod, b):
+        p = self.params; d = self.day
+        if not _time_us(p['start_t']) <= tod <= _time_us(p['end_t']): return []
+        if p['u_vwap'] and not b['Close'] > b['VWAP']: return []
+        if p['u_ema'] and not b['Close'] > b['EMA5']: return []
+        if p['u_rsi'] and not (b['RSI14'] > 45 and b['RSI14'] > b['RSI14_P']): return []
+        if p['u_macd'] and not b['MH'] > b['MH_P']: return []
+        entry_p = b['Close'] * 1.0003; av = d['av']
+        if p['u_atr']:
+            sl_rec = max(p['atr_min'], (av/entry_p)*p['atr_mul']) if av and entry_p>0 else abs(p['sl_fix'])
+        else: sl_rec = abs(p['sl_fix'])
+        self.pos = {'entry_ts': ts, 'entry_p': entry_p, 'stop_p': entry_p * (1 - sl_rec), 'sl_rec': sl_rec, 't_high': b['High'], 'entry_vwap': b['VWAP']}
+        d['active'] = False
+        return [{'kind': 'entry', 'ticker': self.ticker, 'time': ts, 'price': entry_p, 'stop': self.pos['stop_p'], 'gap': d['gap']}]
+
+    def _check_exit(self, ts, tod, b):
+        p = self.params; d = self.day; pos = self.pos
+        # 高値の累積最大 (以後の NaN は無視、エントリー足が NaN なら以後 NaN)
+        h = b['High']
+        if pos['t_high'] == pos['t_high'] and h == h and h > pos['t_high']: pos['t_high'] = h
+        t_high = pos['t_high']; trail_lv = t_high * (1 - p['ts_width'])
+        if t_high >= pos['entry_p'] * (1 + p['ts_start']) and b['Low'] <= trail_lv: ex_p = trail_lv * 0.9997; rsn = "トレーリング"
+        elif b['Low'] <= pos['stop_p']: ex_p = pos['stop_p'] * 0.9997; rsn = "損切り"
+        elif tod >= EXIT_US: ex_p = b['Close'] * 0.9997; rsn = "時間切れ"
+        else: return []
+        self.pos = None
+        if not ex_p: return []
+        entry_p = pos['entry_p']
+        trade = (pos['entry_ts'].value, ts.value, (ex_p - entry_p)/entry_p, entry_p, ex_p, rsn, get_trade_pattern(b, d['gap']),
+                 d['gap']*100, pos['entry_vwap'], d['pc'], d['do'], pos['sl_rec']*100)
+        return [{'kind': 'exit', 'ticker': self.ticker, 'time': ts, 'price': ex_p, 'reason': rsn, 'pnl': trade[2], 'trade': trade}]
+
+
+class LiveScanner:
+    """複数銘柄の TickerStream をまとめ、足を銘柄ごとに振り分ける。決済済みのトレードは trades (TradeBuffer) に溜める。"""
+
+    def __init__(self, params):
+        self.params = params
+        self.streams = {}
+        self.trades = TradeBuffer()
+        self.signals = []
+
+    def add(self, ticker, daily_maps, history=None):
+        """銘柄を追加し、history (過去の5分足) があれば warm_up する。warm_up 中に出たシグナルを返す。"""
+        s = self.streams[ticker] = TickerStream(ticker, daily_maps, self.params)
+        return self._record(s.warm_up(history) if history is not None else [])
+
+    def on_bar(self, ticker, ts, o, h, l, c, v):
+        return self._record(self.streams[ticker].update(ts, o, h, l, c, v))
+
+    def _record(self, signals):
+        for sg in signals:
+            if sg['kind'] == 'exit': self.trades.append(sg['ticker'], *sg['trade'])
+        self.signals += signals
+        return signals
+
+    def positions(self):
+        """建玉中の銘柄の一覧 (DataFrame)。"""
+        rows = [{'銘柄コード': t, 'エントリー': s.pos['entry_ts'], '建値': s.pos['entry_p'], '損切り': s.pos['stop_p'], '高値': s.pos['t_high']}
+                for t, s in self.streams.items() if s.pos is not None]
+        return pd.DataFrame(rows)
+
+
+def _bar_rows(ticker, df):
+    bars = normalize_bars(df)
+    return [(ts, ticker, row) for ts, row in zip(bars.index, bars.itertuples(index=False))]
+
+
+class ReplayFeed:
+    """{銘柄: 5分足} を start 以降の時刻順 (同じ時刻は銘柄の順) に (時刻, 銘柄, 足) で1本ずつ流す。"""
+
+    def __init__(self, frames, start=None):
+        self.frames = frames
+        self.start = pd.Timestamp(start).tz_localize('Asia/Tokyo') if start is not None and pd.Timestamp(start).tzinfo is None else start
+
+    def __iter__(self):
+        streams = []
+        for i, (t, df) in enumerate(self.frames.items()):
+            rows = _bar_rows(t, df)
+            if self.start is not None: rows = [r for r in rows if r[0] >= self.start]
+            streams.append([(ts, i, t, row) for ts, t, row in rows])
+        for ts, _, t, row in heapq.merge(*streams, key=lambda r: (r[0], r[1])): yield ts, t, row
+
+
+class PollingFeed:
+    """
+    provider (providers.MarketDataProvider) から当日の5分足を poll 秒ごとに取り直し、確定した (開始から5分経った) 新しい足だけを流す。
+    since ({銘柄: 時刻} か全銘柄共通の時刻) 以前の足は流さない。now は現在時刻を返す関数 (検証用に差し替え可能)。
+    """
+
+    def __init__(self, provider, tickers, since, poll=60.0, now=None, sleep=_time.sleep):
+        self.provider = provider; self.tickers = list(tickers)
+        self.last = {t: pd.Timestamp(since[t] if isinstance(since, dict) else since) for t in self.tickers}
+        self.poll = poll; self.now = now or (lambda: pd.Timestamp.now(tz='Asia/Tokyo')); self.sleep = sleep
+
+    def fetch_once(self):
+        """新しく確定した足 [(時刻, 銘柄, 足)] (時刻順)。"""
+        now = self.now(); out = []
+        for t in self.tickers:
+            df = self.provider.intraday(t, now.normalize().tz_localize(None), (now + timedelta(days=1)).normalize().tz_localize(None))
+            if df is None or df.empty: continue
+            for ts, tk, row in _bar_rows(t, df):
+                if ts > self.last[t] and ts + timedelta(minutes=BAR_MINUTES) <= now: out.append((ts, tk, row)); self.last[t] = ts
+        return sorted(out, key=lambda r: r[0])
+
+    def __iter__(self):
+        while True:
+            yield from self.fetch_once()
+            if self.now().hour >= 15: return   # 大引け後は終了
+            self.sleep(self.poll)
+
+
+def run_feed(scanner, feed, on_signal=None):
+    """feed の足を scanner に流す。on_signal(シグナル) はシグナルが出るたびに呼ばれる。流した足の本数を返す。"""
+    n = 0
+    for ts, t, row in feed:
+        if t not in scanner.streams: continue
+        for sg in scanner.on_bar(t, ts, row.Open, row.High, row.Low, row.Close, row.Volume):
+            if on_signal: on_signal(sg)
+        n += 1
+    return n
@@ -0,0 +1,156 @@
+import os
+import threading
+from datetime import datetime, timedelta
+import pandas as pd
+from bar_store import ParquetBarStore
+from bars import ingest_bars
+from providers import make_provider
+import diagnostics
+
+# --- データ取得 ---
+# 提供元は環境変数 BACKTESTER_PROVIDER ("yfinance" / "local:<ディレクトリ>") か set_provider() で切り替える。
+# 取得の失敗は ProviderError として呼び出し元に伝える (空の結果としてキャッシュしない)。
+PROVIDER = make_provider(os.environ.get("BACKTESTER_PROVIDER", "yfinance"))
+
+def set_provider(provider):
+    global PROVIDER
+    PROVIDER = make_provider(provider) if isinstance(provider, str) else provider
+
+BULK_CHUNK_SIZE = 50   # 1リクエストあたりの銘柄数
+
+# 5分足の永続ストア (初回以降は最新の足だけを追加取得。Yahoo の60日制限より古い足も保持)
+BAR_STORE = ParquetBarStore(os.environ.get("BACKTESTER_BAR_STORE", ".bar_store"), max_bytes=int(os.environ.get("BACKTESTER_BAR_STORE_MAX_MB", "2048")) * 1024**2)
+# 5分足の取得開始日 (提供元の取得可能期間内に丸める)
+# 保存済みの足が start の日まで遡っていれば最終足の日の0時から、そうでなければ start から取得して保存済みの分と併合する
+def intraday_fetch_start(ticker, start):
+    limit = datetime.now() - timedelta(days=PROVIDER.intraday_limit_days) if PROVIDER.intraday_limit_days else None
+    if limit is not None: start = max(start, limit)
+    try: first, last = BAR_STORE.first_timestamp(ticker), BAR_STORE.last_timestamp(ticker)
+    except Exception: first = last = None
+    if last is not None and first.date() <= start.date():
+        start = last.tz_localize(None).normalize().to_pydatetime()
+        if limit is not None: start = max(start, limit)
+    return start
+
+# データ取得（5分足）。取り込み時に正規化した Bars を返す。取得に失敗した場合は ProviderError
+# _prefetch (Prefetch) に同じ (銘柄, 期間) の一括取得分があればそれを使う (先頭が _ の引数は st.cache_data のキーに含まれない)
+def fetch_intraday(ticker, start, end, _prefetch=None):
+    df = _fetch_intraday_frame(ticker, start, end, _prefetch)
+    with diagnostics.stage("ingest", ticker): return ingest_bars(df)
+
+def _fetch_intraday_frame(ticker, start, end, prefetch=None):
+    fresh = prefetch.pop(ticker, "5m", start, end) if prefetch is not None else None
+    if not PROVIDER.persist_bars:
+        if fresh is not None: return fresh
+        with diagnostics.stage("provider.intraday", ticker): return PROVIDER.intraday(ticker, start, end)
+    if fresh is None:
+        with diagnostics.stage("provider.intraday", ticker): fresh = PROVIDER.intraday(ticker, intraday_fetch_start(ticker, start), datetime.now())
+    try:
+        with diagnostics.stage("bar_store", ticker):
+            BAR_STORE.write(ticker, fresh); BAR_STORE.compact(ticker)
+            return BAR_STORE.read(ticker, start, datetime.now())
+    except OSError: return fresh
+
+# 日足から 前日終値 / 当日始値 / 前日までのATR(14) のマップを作成
+def build_daily_stats_maps(df):
+    p_map, o_map, a_map = {}, {}, {}
+    if df.empty: return p_map, o_map, a_map
+    if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
+    df.index = df.index.tz_localize('UTC').tz_convert('Asia/Tokyo') if df.index.tzinfo is None else df.index.tz_convert('Asia/Tokyo')
+    tr = pd.concat([df['High']-df['Low'], abs(df['High']-df['Close'].shift(1)), abs(df['Low']-df['Close'].shift(1))], axis=1).max(axis=1)
+    atr_prev = tr.rolling(window=14).mean().shift(1)
+    keys = df.index.strftime('%Y-%m-%d')   # 日付の文字列はまとめて1回だけ作る
+    p_map = {d: c for d, c in zip(keys, df['Close'].shift(1)) if pd.notna(c)}
+    o_map = {d: o for d, o in zip(keys, df['Open']) if pd.notna(o)}
+    a_map = {d: a for d, a in zip(keys, atr_prev) if pd.notna(a)}
+    return p_map, o_map, a_map
+
+# データ取得（日足、ATR 用に start の60日前から）。取得に失敗した場合は ProviderError
+def fetch_daily_bars(ticker, start, _prefetch=None):
+    fresh = _prefetch.pop(ticker, "1d", start) if _prefetch is not None else None
+    if fresh is not None: return fresh
+    d_start = start - timedelta(days=60)
+    with diagnostics.stage("provider.daily", ticker): return PROVIDER.daily(ticker, d_start, datetime.now())
+
+# ATR算出ロジックを含む関数。取得に失敗した場合は ProviderError
+def fetch_daily_stats_maps(ticker, start, _prefetch=None):
+    return build_daily_stats_maps(fetch_daily_bars(ticker, start, _prefetch))
+
+# --- 一括取得 (ランキング用) ---
+class Prefetch:
+    """
+    一括取得で先読みしたフレーム。1回のスキャン (bulk_prefetch を呼んだ処理) の間だけ持ち、終わったら clear() する。
+    キーは (銘柄, interval, start, end) で、fetch_* は自分の引数と同じキーのものだけを取り出す (取り出すと消える)。
+    日足の end は None (fetch_daily_bars は常に現在まで取得する)。取得スレッドから並行して取り出せる。
+    """
+
+    def __init__(self):
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock: return len(self._frames)
+
+    def put(self, ticker, interval, start, end, df):
+        with self._lock: self._frames[(ticker, interval, start, end)] = df
+
+    def pop(self, ticker, interval, start, end=None):
+        with self._lock: return self._frames.pop((ticker, interval, start, end), None)
+
+    def clear(self):
+        with self._lock: self._frames.clear()
+
+# transport(tickers, start, end, interval) -> 複数銘柄の MultiIndex 列フレーム (既定は提供元の bulk)
+def provider_bulk_transport(tickers, start, end, interval):
+    return PROVIDER.bulk(tickers, start, end, interval)
+
+# 複数銘柄フレームを銘柄ごとの単一列フレームに分割
+def split_multi_ticker_frame(raw, tickers):
+    frames = {}
+    if raw is None or raw.empty: return frames
+    if not isinstance(raw.columns, pd.MultiIndex):
+        if len(tickers) == 1: frames[tickers[0]] = raw.dropna(how='all')
+        return frames
+    lvl = 0 if set(tickers) & set(raw.columns.get_level_values(0)) else 1
+    for t in tickers:
+        if t not in raw.columns.get_level_values(lvl): continue
+        df = raw.xs(t, axis=1, level=lvl).dropna(how='all')
+        df.columns.name = None
+        if not df.empty: frames[t] = df
+    return frames
+
+def bulk_prefetch(tickers, start, end=None, chunk_size=BULK_CHUNK_SIZE, transport=None, intervals=("5m", "1d"), prefetch=None):
+    """intervals (5分足 "5m" / 日足 "1d") を chunk_size 銘柄ずつまとめて取得し、prefetch (Prefetch、なければ新しく作る) に入れる。
+    5分足は fetch_intraday(銘柄, start, end, _prefetch=...)、日足は fetch_daily_bars(銘柄, start, _prefetch=...) が受け取る。
+    戻り値: (prefetch, {'requests': リクエスト数, 'bytes': 解析したバイト数, 'tickers': 取得できた銘柄数, 'errors': 失敗したリクエスト数})
+    一括取得に対応していない提供元 (ローカルファイルなど) では何もしない。失敗したチャンクは銘柄ごとの取得に任せる。"""
+    prefetch = prefetch if prefetch is not None else Prefetch()
+    stats = {'requests': 0, 'bytes': 0, 'tickers': 0, 'errors': 0}
+    if transport is None:
+        if not PROVIDER.supports_bulk: return prefetch, stats
+        transport = provider_bulk_transport
+    for i in range(0, len(tickers), chunk_size):
+        chunk = list(tickers[i:i+chunk_size])
+        # 5分足は永続ストアに足りない分だけ (チャンク内で最も古い取得開始日から現在まで)。保存しない提供元では fetch_intraday と同じ期間
+        if "5m" not in intervals: i_range = None
+        elif PROVIDER.persist_bars: i_range = (min(intraday_fetch_start(t, start) for t in chunk), datetime.now())
+        else: i_range = (start, end)
+        jobs = (("5m", i_range, end), ("1d", (start - timedelta(days=60), datetime.now()), None))
+        for interval, fetch_range, key_end in jobs:
+            if interval not in intervals: continue
+            s, e = fetch_range
+            stats['requests'] += 1
+            try:
+                with diagnostics.stage(f"provider.bulk_{interval}"): raw = transport(chunk, s, e, interval)
+            except Exception: stats['errors'] += 1; continue
+            if raw is None or raw.empty: continue
+            stats['bytes'] += int(raw.memory_usage(deep=True).sum())
+            frames = split_multi_ticker_frame(raw, chunk)
+            for t, df in frames.items(): prefetch.put(t, interval, start, key_end, df)
+            if interval == "5m": stats['tickers'] += len(frames)
+    return prefetch, stats
+
+# 永続ストアのサイズ上限を適用 (バックテスト・スキャンの終了時に呼ぶ)
+def enforce_store_cap():
+    try: BAR_STORE.enforce_size_cap()
+    except Exception: pass
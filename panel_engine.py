@@ -0,0 +1,178 @@
+from datetime import time
+import numpy as np
+from indicator_cache import INDICATOR_CACHE, IND_COLS
+from bars import Bars
+from backtest_engine import run_ticker_simulation, _time_us, EXIT_TIME
+from trade_buffer import TradeBuffer, FLOAT_COLS, KNOWN_CATEGORIES
+import diagnostics
+
+# --- 銘柄 × 日 × 時間枠 のパネルによる一括シミュレーション ---
+# 全銘柄の場中 (09:00～15:00、両端含む) の5分足を 銘柄 × 日 × 時間枠 (5分刻み 73 枠) の配列に並べ、
+# 前日終値・始値・ATR は 銘柄 × 日 の行列にして、エントリー/決済判定を全銘柄・全日まとめて配列演算で行う。
+# 足のない枠は NaN (present が False) で、判定では「存在しない足」として扱う (配列エンジンと同じトレードになる)。
+# インジケーターは場外の足も含めた銘柄ごとの時系列で決まるので、INDICATOR_CACHE から銘柄ごとに取得してから並べる。
+# 時間枠に乗らない足 (5分刻みでない・重複・日の中で時刻が逆順) がある銘柄は、銘柄ごとの配列エンジンで計算する。
+
+SLOT_US = 5 * 60 * 1_000_000
+OPEN_US, CLOSE_US = _time_us(time(9, 0)), _time_us(time(15, 0))
+N_SLOTS = (CLOSE_US - OPEN_US) // SLOT_US + 1
+SLOT_TOD = OPEN_US + SLOT_US * np.arange(N_SLOTS)   # 時間枠の開始時刻 (0時からのマイクロ秒)
+EXIT_SLOTS = SLOT_TOD >= _time_us(EXIT_TIME)        # 時間切れで決済する枠
+PANEL_COLS = ('Close', 'High', 'Low', 'Volume', 'EMA5', 'RSI14', 'RSI14_P', 'MH', 'MH_P')
+REASON_CODE = {r: i for i, r in enumerate(KNOWN_CATEGORIES['Reason'])}
+
+
+def _cells(df):
+    """1銘柄の場中の足 → (足の位置, 日番号 (1970-01-01 からの日数) の一覧, 足ごとの日の位置, 足ごとの時間枠)。時間枠に乗らなければ None。"""
+    wall = df.index.tz_localize(None).as_unit('us').asi8   # 現地時刻 (normalize() と同じく日付・時刻は現地で数える)
+    day_code, tod = np.divmod(wall, 86_400_000_000)
+    sel = np.flatnonzero((tod >= OPEN_US) & (tod <= CLOSE_US))
+    sel = sel[np.argsort(day_code[sel], kind='stable')]   # session_arrays と同じ並び
+    slot, rem = np.divmod(tod[sel] - OPEN_US, SLOT_US)
+    days, day = np.unique(day_code[sel], return_inverse=True)
+    key = day * N_SLOTS + slot
+    if rem.any() or (np.diff(key) <= 0).any(): return None
+    return sel, days, day, slot
+
+
+def build_panel(items):
+    """
+    items: [(銘柄, インジケーター付きの5分足, (p_map, o_map, a_map))] → パネル (dict) と、時間枠に乗らなかった銘柄のリスト。
+    4番目に元の Bars があれば、時間枠 (Bars.cells())・時刻・OHLCV は Bars から取る (2番目はインジケーターの列だけでよい)。
+    パネル: 'tickers', 'dates' (全銘柄の日付の和集合、古い順)、PANEL_COLS と 'VWAP' の (銘柄, 日, 時間枠) 配列、
+    'ns' (足の UTC ns)、'present' (足があるか)、'pc' / 'do' / 'atr' (銘柄, 日) 行列 (日足マップにない日は NaN)、'atr_ok' (ATR 損切りに使えるか)。
+    """
+    cells = []; off_grid = []
+    for t, df, maps, *pre in items:
+        bars = pre[0] if pre else None
+        c = bars.cells() if bars is not None else _cells(df)
+        if c is None: off_grid.append(t)
+        else: cells.append((t, df, maps, bars, c))
+    day_nums = np.unique(np.concatenate([c[1] for *_, c in cells] or [np.zeros(0, dtype=np.int64)]))
+    dates = [str(d) for d in day_nums.astype('datetime64[D]')]
+    T, D = len(cells), len(dates)
+    P = {'tickers': [t for t, *_ in cells], 'dates': dates, 'ns': np.zeros((T, D, N_SLOTS), dtype=np.int64),
+         'present': np.zeros((T, D, N_SLOTS), dtype=bool), **{c: np.full((T, D, N_SLOTS), np.nan) for c in PANEL_COLS},
+         'pc': np.full((T, D), np.nan), 'do': np.full((T, D), np.nan), 'atr': np.full((T, D), np.nan), 'atr_ok': np.zeros((T, D), dtype=bool)}
+    for i, (t, df, (pc_map, co_map, a_map), bars, (sel, t_days, day, slot)) in enumerate(cells):
+        if not sel.size: continue
+        cols = np.searchsorted(day_nums, t_days); dc = cols[day]
+        P['present'][i, dc, slot] = True
+        if bars is None:
+            P['ns'][i, dc, slot] = df.index[sel].as_unit('ns').asi8
+            for c in PANEL_COLS: P[c][i, dc, slot] = df[c].to_numpy(dtype=np.float64)[sel]
+        else:
+            P['ns'][i, dc, slot] = bars.ns[sel]
+            for c in PANEL_COLS: P[c][i, dc, slot] = (df[c].to_numpy(dtype=np.float64) if c in IND_COLS else bars.cols[c])[sel]
+        for j in cols:
+            d = dates[j]
+            pc = pc_map.get(d); do = co_map.get(d); av = a_map.get(d)
+            if pc is not None: P['pc'][i, j] = pc
+            if do is not None: P['do'][i, j] = do
+            if av is not None: P['atr'][i, j] = av; P['atr_ok'][i, j] = bool(av)
+    # 日ごとの VWAP (足のない枠は 0 として足すので、配列エンジンの日ごとの累積和と同じ値)
+    vol = P['Volume']; v_nan = np.isnan(vol); pv = P['Close'] * vol; pv_nan = np.isnan(pv)
+    v_cum = np.cumsum(np.where(v_nan, 0.0, vol), axis=-1); v_cum[v_nan] = np.nan; v_cum[v_cum == 0] = np.nan
+    pv_cum = np.cumsum(np.where(pv_nan, 0.0, pv), axis=-1); pv_cum[pv_nan] = np.nan
+    P['VWAP'] = pv_cum / v_cum
+    return P, off_grid
+
+
+def panel_entries(P, params):
+    """
+    エントリー判定 (時間帯・VWAP・EMA・RSI・MACD・ギャップ範囲) → エントリーのあった (銘柄, 日) ごとのエントリー後の経路 (dict)。
+    'ti' / 'di' (パネルの位置)、'e' (エントリーの時間枠)、'C' / 'L' / 'present' (その日の (件数, 時間枠) 配列)、'after' (エントリー足より後の枠)、
+    't_high' (エントリー足からの高値の累積最大。以後の NaN は無視、エントリー足が NaN なら以後 NaN)、'entry_p'、'gap'、'atr' / 'atr_ok'。
+    決済パラメータによらないので、決済の設定だけを変えて何度も判定できる。エントリーがなければ None。
+    """
+    close, vwap = P['Close'], P['VWAP']
+    if not P['dates']: return None
+    in_window = (SLOT_TOD >= _time_us(params['start_t'])) & (SLOT_TOD <= _time_us(params['end_t']))
+    base = P['present'] & in_window
+    if params['u_vwap']: base &= close > vwap
+    if params['u_ema']: base &= close > P['EMA5']
+    if params['u_rsi']: base &= (P['RSI14'] > 45) & (P['RSI14'] > P['RSI14_P'])
+    if params['u_macd']: base &= P['MH'] > P['MH_P']
+    with np.errstate(divide='ignore', invalid='ignore'): gap = (P['do'] - P['pc']) / P['pc']
+    base &= ((gap >= params['g_min']) & (gap <= params['g_max']))[..., None]
+    ti, di = np.nonzero(base.any(axis=-1))
+    if not ti.size: return None
+    e = np.argmax(base[ti, di], axis=-1)
+    C, H = close[ti, di], P['High'][ti, di]
+    slot = np.arange(N_SLOTS); after = slot > e[:, None]
+    t_high = np.maximum.accumulate(np.where(slot < e[:, None], -np.inf, np.where(after & np.isnan(H), -np.inf, H)), axis=-1)
+    return {'ti': ti, 'di': di, 'e': e, 'C': C, 'L': P['Low'][ti, di], 'present': P['present'][ti, di], 'after': after, 't_high': t_high,
+            'entry_p': C[np.arange(ti.size), e] * 1.0003, 'gap': gap[ti, di], 'atr': P['atr'][ti, di], 'atr_ok': P['atr_ok'][ti, di]}
+
+
+def stop_rate(E, sl_fix, atr_mul, atr_min, u_atr):
+    """エントリーごとの損切り幅 (割合)。ATR 損切りなら max(atr_min, ATR / 建値 × atr_mul) (ATR がなければ |sl_fix|)。"""
+    sl_rec = np.full(len(E['e']), abs(sl_fix))
+    if not u_atr: return sl_rec
+    with np.errstate(invalid='ignore'): ratio = (E['atr'] / E['entry_p']) * atr_mul
+    return np.where(E['atr_ok'] & (E['entry_p'] > 0), np.where(ratio > atr_min, ratio, atr_min), sl_rec)   # max(atr_min, ratio) (NaN なら atr_min)
+
+
+def simulate_panel(P, params):
+    """パネル全体のエントリー/決済判定 → {銘柄: TradeBuffer} (トレードのない銘柄は空のバッファ)。"""
+    out = {t: TradeBuffer(capacity=1) for t in P['tickers']}
+    E = panel_entries(P, params)
+    if E is None: return out
+    ti, di, e, C, L, after, t_high, entry_p = (E[k] for k in ('ti', 'di', 'e', 'C', 'L', 'after', 't_high', 'entry_p'))
+    r = np.arange(ti.size); vwap = P['VWAP']
+    sl_rec = stop_rate(E, params['sl_fix'], params['atr_mul'], params['atr_min'], params['u_atr'])
+    stop_p = entry_p * (1 - sl_rec)
+
+    # 決済 (同じ足ならトレーリング → 損切り → 時間切れ の順)
+    trail_lv = t_high * (1 - params['ts_width'])
+    with np.errstate(invalid='ignore'):
+        hit_trail = after & (t_high >= entry_p[:, None] * (1 + params['ts_start'])) & (L <= trail_lv)
+        hit_stop = after & (L <= stop_p[:, None])
+    hit = hit_trail | hit_stop | (after & E['present'] & EXIT_SLOTS)
+    found = hit.any(axis=-1)
+    x = np.argmax(hit, axis=-1)
+    tr, st = hit_trail[r, x], hit_stop[r, x]
+    ex_p = np.where(tr, trail_lv[r, x] * 0.9997, np.where(st, stop_p * 0.9997, C[r, x] * 0.9997))
+    keep = found & (ex_p != 0)
+    reason = np.where(tr, REASON_CODE["トレーリング"], np.where(st, REASON_CODE["損切り"], REASON_CODE["時間切れ"]))
+
+    # 決済足の値でパターン分類 (get_trade_pattern と同じ条件)
+    g = E['gap']; cx, vx, ex, rx = C[r, x], vwap[ti, di][r, x], P['EMA5'][ti, di][r, x], P['RSI14'][ti, di][r, x]
+    check_vwap = np.where(np.isnan(vx), cx, vx)
+    pattern = np.select([(g <= -0.004) & (cx > check_vwap), (-0.003 <= g) & (g < 0.003) & (cx > ex), (g >= 0.005) & (rx >= 65), (g >= 0.003) & (cx > ex)],
+                        [KNOWN_CATEGORIES['Pattern'].index(p) for p in ("A：反転狙い", "D：上昇継続", "C：ブレイク", "B：押目上昇")],
+                        KNOWN_CATEGORIES['Pattern'].index("E：他タイプ"))
+
+    ns = P['ns'][ti, di]
+    cols = {'PnL': (ex_p - entry_p) / entry_p, 'In': entry_p, 'Out': ex_p, 'Gap(%)': g * 100, 'EntryVWAP': vwap[ti, di][r, e],
+            'PrevClose': P['pc'][ti, di], 'DayOpen': P['do'][ti, di], 'SL設定(%)': sl_rec * 100}
+    floats = np.stack([cols[c] for c in FLOAT_COLS])
+    ti, k = ti[keep], np.flatnonzero(keep)
+    if not ti.size: return out
+    bounds = np.flatnonzero(np.diff(ti)) + 1
+    for a, b in zip(np.r_[0, bounds], np.r_[bounds, ti.size]):
+        idx = k[a:b]
+        out[P['tickers'][ti[a]]].append_columns(P['tickers'][ti[a]], ns[idx, e[idx]], ns[idx, x[idx]], floats[:, idx], reason[idx], pattern[idx])
+    return out
+
+
+def panel_from_data(data):
+    """data: [(銘柄, 5分足, (p_map, o_map, a_map))] → build_panel の結果 (インジケーターは INDICATOR_CACHE から)。"""
+    items = []
+    for t, df, maps in data:
+        if df.empty: continue
+        with diagnostics.stage("indicators", t): ind = INDICATOR_CACHE.get(t, df)
+        items.append((t, ind, maps, df) if isinstance(df, Bars) else (t, ind, maps))
+    with diagnostics.stage("panel_build"): return build_panel(items)
+
+
+def simulate_universe(data, params):
+    """
+    data: [(銘柄, 5分足, (p_map, o_map, a_map))] → {銘柄: TradeBuffer} (data の順)。
+    パネルで一括計算し、時間枠に乗らない銘柄だけ run_ticker_simulation で計算する。トレードの内容は配列エンジンと同じ。
+    """
+    P, off_grid = panel_from_data(data)
+    with diagnostics.stage("panel_simulate"): bufs = simulate_panel(P, params)
+    for t, df, maps in data:
+        if t in off_grid: bufs[t] = run_ticker_simulation(t, df, *maps, params)
+    return {t: bufs.get(t, TradeBuffer(capacity=1)) for t, _, _ in data}
@@ -0,0 +1,137 @@
+import multiprocessing as mp
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from multiprocessing import shared_memory
+import numpy as np
+from backtest_engine import run_ticker_simulation
+from bars import Bars, ingest_bars
+
+# --- プロセス並列のランキングスキャン ---
+# 全銘柄の5分足を取り込み済みの形式 (Bars) の配列のまま1つの共有メモリ領域にまとめて置き、ワーカーは起動時に1回だけアタッチする。
+# 価格 float32 / 出来高 int32 などの型は取り込み時のままで、float64 の DataFrame には戻さない。
+# タスクで送るのは (銘柄, 配列の置き場所, Bars のメタ情報, 日足マップ, パラメータ) だけで、ワーカーは共有メモリ上のビュー
+# (コピーなし、読み取り専用) から Bars を組み立てる。
+# 共有メモリの並び: 銘柄ごとに Bars.arrays() の各配列 (先頭を 8 バイト境界に揃える)
+# プロセスプールはワーカー数が同じあいだスキャンをまたいで使い回し、ワーカー内の INDICATOR_CACHE / SESSION_MEMO を次のスキャンでも効かせる。
+# ワーカーはタスクで受け取った名前の共有メモリに (前回のスキャンと違うときだけ) アタッチし直す。
+
+ALIGN = 8
+
+_shm = None      # ワーカー側でアタッチした共有メモリ
+_pool = None     # (ワーカー数, ProcessPoolExecutor)
+_pool_lock = threading.Lock()
+
+
+def pack_frames(frames):
+    """{銘柄: 5分足 (DataFrame / Bars)} を共有メモリに詰める。(共有メモリ, {銘柄: (配列の置き場所, メタ情報)}) を返す。
+    配列の置き場所: {名前: (オフセット, 型, 形)}。"""
+    bars = {t: ingest_bars(df) for t, df in frames.items()}
+    layouts = {}; n = 0
+    for t, b in bars.items():
+        layouts[t] = {}
+        for name, a in b.arrays().items():
+            layouts[t][name] = (n, a.dtype.str, a.shape); n += -(-a.nbytes // ALIGN) * ALIGN
+    shm = shared_memory.SharedMemory(create=True, size=max(n, 1))
+    for t, b in bars.items():
+        for name, a in b.arrays().items(): _view(shm, layouts[t][name])[...] = a
+    return shm, {t: (layouts[t], b.meta()) for t, b in bars.items()}
+
+
+def _view(shm, place):
+    off, dtype, shape = place
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off)
+
+
+def _attach(shm_name):
+    global _shm
+    if _shm is not None and _shm.name == shm_name: return
+    if _shm is not None:
+        try: _shm.close()
+        except BufferError: pass   # 前回の配列のビューが残っていれば解放は GC に任せる
+    _shm = shared_memory.SharedMemory(name=shm_name)
+
+
+def get_pool(workers, renew=False):
+    """ワーカー数が同じなら前回のプロセスプールを返す (renew=True または数が変わったときは作り直す)。"""
+    global _pool
+    with _pool_lock:
+        if renew or _pool is None or _pool[0] != workers:
+            if _pool is not None: _pool[1].shutdown(cancel_futures=True)
+            ctx = mp.get_context('spawn')   # Streamlit のスレッドを fork しないよう spawn で起動
+            _pool = (workers, ProcessPoolExecutor(max_workers=workers, mp_context=ctx))
+        return _pool[1]
+
+
+def shutdown_pool():
+    """使い回しているプロセスプールを終了する (次のスキャンで作り直す)。"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None: _pool[1].shutdown(cancel_futures=True)
+        _pool = None
+
+
+def _completed(tasks, workers):
+    """tasks: [(関数, 引数...)] をプロセスプールで実行し、完了した順に結果を返すジェネレーター。
+    途中で閉じられた場合 (中止) は未着手の分を取り消し、実行中の分 (共有メモリを読んでいる) の終了を待つ。"""
+    try: futs = [get_pool(workers).submit(*task) for task in tasks]
+    except BrokenProcessPool:   # ワーカーが異常終了したプールは作り直す
+        futs = [get_pool(workers, renew=True).submit(*task) for task in tasks]
+    try:
+        for f in as_completed(futs): yield f.result()
+    finally:
+        for f in futs: f.cancel()
+        wait(futs)
+
+
+# 共有メモリ上の1銘柄分の配列 (コピーなしのビュー) から Bars を組み立てる
+def _bars(layout, meta):
+    arrays = {}
+    for name, place in layout.items():
+        a = _view(_shm, place); a.flags.writeable = False; arrays[name] = a
+    return Bars.from_arrays(meta, arrays)
+
+
+def _simulate_slice(shm_name, ticker, layout, meta, pc_map, co_map, a_map, params):
+    _attach(shm_name); counts = {}
+    return ticker, run_ticker_simulation(ticker, _bars(layout, meta), pc_map, co_map, a_map, params, memo_counts=counts), counts
+
+
+def parallel_simulate(jobs, params, workers, memo_counts=None):
+    """jobs: [(銘柄, 5分足, (p_map, o_map, a_map))]。完了した順に (銘柄, トレード) を返すジェネレーター。
+    日ごとの結果のメモは各ワーカープロセス内で有効 (プールを使い回すので次のスキャンでも、同じワーカーに当たった銘柄は再利用する)。
+    memo_counts (dict) には再利用/計算した日数を加算する。"""
+    if not jobs: return
+    shm, places = pack_frames({t: df for t, df, _ in jobs})
+    try:
+        tasks = [(_simulate_slice, shm.name, t, *places[t], *maps, params) for t, _, maps in jobs]
+        with closing(_completed(tasks, workers)) as results:
+            for t, trades, counts in results:
+                if memo_counts is not None:
+                    for k, v in counts.items(): memo_counts[k] = memo_counts.get(k, 0) + v
+                yield t, trades
+    finally:
+        shm.close(); shm.unlink()
+
+
+def _run_chunk(shm_name, fn, items, args):
+    _attach(shm_name)
+    return fn([(t, _bars(layout, meta), maps) for t, layout, meta, maps in items], *args)
+
+
+def parallel_chunks(jobs, fn, args, workers, n_chunks=None):
+    """
+    jobs: [(銘柄, 5分足, 日足マップ)] を共有メモリに載せて n_chunks 個 (既定はワーカー数の2倍) に分け、
+    各ワーカーで fn([(銘柄, 5分足 (Bars), 日足マップ)], *args) を実行する。完了した順に結果を返すジェネレーター。
+    fn はモジュールの関数 (spawn したプロセスから import できるもの) にすること。
+    """
+    if not jobs: return
+    shm, places = pack_frames({t: df for t, df, _ in jobs})
+    n_chunks = max(1, min(len(jobs), n_chunks or workers * 2))
+    chunks = [[(t, *places[t], maps) for t, _, maps in jobs[i::n_chunks]] for i in range(n_chunks)]
+    try:
+        with closing(_completed([(_run_chunk, shm.name, fn, items, args) for items in chunks], workers)) as results:
+            yield from results
+    finally:
+        shm.close(); shm.unlink()
@@ -0,0 +1,129 @@
+import os
+import pandas as pd
+
+# --- 相場データの提供元 ---
+# 共通の口: intraday(銘柄, start, end) -> 5分足 / daily(銘柄, start, end) -> 日足
+#   どちらも Open/High/Low/Close/Adj Close/Volume 列と東京時間 (tz 付き) のインデックスの DataFrame。
+#   期間内にデータがないだけなら空の DataFrame、取得そのものに失敗した場合は ProviderError を送出する
+#   (st.cache_data は例外をキャッシュしないので、失敗が空の結果として残らない)。
+# bulk(銘柄リスト, start, end, interval) は複数銘柄をまとめて取得できる提供元だけが持つ (supports_bulk)。
+
+TZ = 'Asia/Tokyo'
+BAR_COLS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+class ProviderError(Exception):
+    """提供元からの取得失敗 (「データなし」とは区別する)。"""
+
+    def __init__(self, ticker, message, provider=None):
+        super().__init__(f"{ticker}: {message}")
+        self.ticker = ticker; self.message = message; self.provider = provider
+
+
+class MarketDataProvider:
+    name = "base"
+    supports_bulk = False        # bulk() でまとめて取得できるか
+    persist_bars = False         # 5分足を永続ストアに保存して差分だけ取得するか
+    intraday_limit_days = None   # 5分足を取得できる日数 (None = 制限なし)
+
+    def intraday(self, ticker, start, end):
+        raise NotImplementedError
+
+    def daily(self, ticker, start, end):
+        raise NotImplementedError
+
+    def bulk(self, tickers, start, end, interval):
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Yahoo Finance (yfinance)。5分足は直近60日まで。"""
+    name = "yfinance"
+    supports_bulk = True
+    persist_bars = True
+    intraday_limit_days = 59
+
+    def _history(self, ticker, start, end, interval):
+        import yfinance as yf
+        from yfinance.exceptions import YFPricesMissingError
+        try:
+            df = yf.Ticker(ticker).history(start=start, end=end, interval=interval, auto_adjust=False, actions=False, raise_errors=True)
+        except YFPricesMissingError: return pd.DataFrame()   # 期間内にデータなし
+        except Exception as e: raise ProviderError(ticker, f"{type(e).__name__}: {e}", self.name) from e
+        return df
+
+    def intraday(self, ticker, start, end):
+        return self._history(ticker, start, end, "5m")
+
+    def daily(self, ticker, start, end):
+        return self._history(ticker, start, end, "1d")
+
+    def bulk(self, tickers, start, end, interval):
+        import yfinance as yf
+        return yf.download(tickers, start=start, end=end, interval=interval, group_by='ticker', progress=False, auto_adjust=False, threads=True)
+
+
+# 期間の端 (tz なしは東京時間とみなす)
+def _to_tokyo(t):
+    if t is None: return None
+    t = pd.Timestamp(t)
+    return t.tz_localize(TZ) if t.tzinfo is None else t.tz_convert(TZ)
+
+
+class LocalFileProvider(MarketDataProvider):
+    """
+    ローカルのファイルを再生する提供元 (ネットワーク・取得制限なし)。
+    レイアウト: <root>/5m/<銘柄>.parquet (または .csv) と <root>/1d/<銘柄>.parquet (または .csv)
+    インデックス (または Datetime / Date 列) が tz なしの場合は東京時間とみなす。
+    """
+    name = "local"
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, ticker, interval):
+        base = os.path.join(self.root, interval, ticker.replace('/', '_'))
+        for ext in ('.parquet', '.csv'):
+            if os.path.exists(base + ext): return base + ext
+        return None
+
+    def _read(self, ticker, start, end, interval):
+        path = self._path(ticker, interval)
+        if path is None: raise ProviderError(ticker, f"no {interval} file under {self.root}", self.name)
+        try:
+            df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+            ts_col = next((c for c in ('Datetime', 'Date', 'datetime', 'date') if c in df.columns), None)
+            if ts_col is not None: df = df.set_index(ts_col)
+            elif path.endswith('.csv'): df = df.set_index(df.columns[0])
+            idx = pd.DatetimeIndex(pd.to_datetime(df.index, utc=False) if not isinstance(df.index, pd.DatetimeIndex) else df.index)
+        except Exception as e: raise ProviderError(ticker, f"cannot read {path}: {e}", self.name) from e
+        df.index = idx.tz_localize(TZ) if idx.tz is None else idx.tz_convert(TZ)
+        df = df[[c for c in BAR_COLS if c in df.columns]].sort_index()
+        s, e = (_to_tokyo(t) for t in (start, end))
+        if interval == "1d":   # 日足は日付単位で比べる
+            s = s.normalize() if s is not None else None
+        return df.loc[s:e] if len(df) else df
+
+    def intraday(self, ticker, start, end):
+        return self._read(ticker, start, end, "5m")
+
+    def daily(self, ticker, start, end):
+        return self._read(ticker, start, end, "1d")
+
+    def save(self, ticker, intraday=None, daily=None, fmt="parquet"):
+        """5分足・日足をこの提供元のレイアウトで保存する (アーカイブ作成用)。"""
+        for interval, df in (("5m", intraday), ("1d", daily)):
+            if df is None: continue
+            os.makedirs(os.path.join(self.root, interval), exist_ok=True)
+            out = df.copy(); out.index.name = 'Datetime'
+            path = os.path.join(self.root, interval, ticker.replace('/', '_') + '.' + fmt)
+            if fmt == "parquet": out.to_parquet(path)
+            else: out.to_csv(path)
+
+
+def make_provider(spec):
+    """"yfinance" または "local:<ディレクトリ>" から提供元を作る。"""
+    spec = (spec or "yfinance").strip()
+    if spec == "yfinance": return YFinanceProvider()
+    if spec.startswith("local:"): return LocalFileProvider(spec[len("local:"):])
+    raise ValueError(f"unknown provider: {spec}")
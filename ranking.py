@@ -0,0 +1,269 @@
+import heapq
+import math
+import pandas as pd
+import market_data
+from backtest_engine import run_ticker_simulation, summarize_trades
+from trade_buffer import TradeBuffer
+from parallel_scan import parallel_simulate
+from panel_engine import simulate_universe
+from fetch_pipeline import run_pipeline, DEFAULT_CONCURRENCY, DEFAULT_RATE
+from universe import get_ticker_name
+from providers import ProviderError
+from robustness import bootstrap_table, DEFAULT_RESAMPLES
+import diagnostics
+
+# --- 個別バックテスト / ランキングスキャン (UI なしで呼べる形) ---
+# fetch_intraday / fetch_daily_stats_maps は差し替え可能 (UI からは st.cache_data で包んだものを渡す)。
+# 一括取得するスキャンでは、そのスキャンの Prefetch をキーワード引数 _prefetch で渡し、終わったら (打ち切り・例外でも) 空にする。
+# progress(label, 進捗 0～1) はスキャンの進行状況の通知先。
+# 取得は fetch_pipeline で concurrency 件まで並行 (rate 件/秒まで) し、thread_initializer は取得・計算スレッドの初期化に使う。
+# 取得に失敗した銘柄 (ProviderError) は「データなし」とは区別し、errors_out (list) に例外を追加して残りの銘柄を続ける。
+# 日ごとの結果は SESSION_MEMO で再利用し、memo_out (dict) を渡すと再利用/計算した日数 {'reused', 'computed'} を加算する。
+# diagnostics の記録先があれば 事前選別・ブートストラップなどの段階の時間も記録する。
+
+
+# 取得関数を包み、ProviderError を結果として返す
+def _catch_provider_error(fetch):
+    def wrapped(t):
+        try: return fetch(t)
+        except ProviderError as e: return e
+    return wrapped
+
+
+def run_backtest(tickers, start_date, end_date, params, fetch_intraday=None, fetch_daily_stats_maps=None, progress=None,
+                 concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, thread_initializer=None, timings_out=None, errors_out=None, memo_out=None):
+    """指定銘柄のトレード一覧 (DataFrame) を返す。取得は並行し、届いた銘柄から順にシミュレーションする。
+    timings_out (list) を渡すと銘柄ごとの所要時間 {'item', 'fetch', 'wait', 'compute'} を追加する。"""
+    fetch_intraday = fetch_intraday or market_data.fetch_intraday
+    fetch_daily_stats_maps = fetch_daily_stats_maps or market_data.fetch_daily_stats_maps
+    fetch = _catch_provider_error(lambda t: (fetch_intraday(t, start_date, end_date), fetch_daily_stats_maps(t, start_date)))
+    simulate = lambda t, data: data if isinstance(data, ProviderError) else run_ticker_simulation(t, data[0], *data[1], params, memo_counts=memo_out)
+    on_done = (lambda t, done, total: progress(f"Testing {t}...", done/total)) if progress else None
+    bufs, timings = run_pipeline(tickers, fetch, simulate, concurrency, rate, progress=on_done, thread_initializer=thread_initializer)
+    bufs, timings, errors = _split_errors(bufs, timings)
+    market_data.enforce_store_cap()
+    if timings_out is not None: timings_out.extend(timings)
+    if errors_out is not None: errors_out.extend(errors)
+    return TradeBuffer.concat(bufs).to_frame()
+
+
+def load_bars(tickers, start_date, end_date, fetch_intraday=None, fetch_daily_stats_maps=None, progress=None,
+              concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, thread_initializer=None, errors_out=None):
+    """グリッドサーチ・ウォークフォワード用に [(銘柄, 5分足 (Bars), 日足マップ)] を返す (5分足のない銘柄は除く)。先に一括取得する。"""
+    fetch_intraday = fetch_intraday or market_data.fetch_intraday
+    fetch_daily_stats_maps = fetch_daily_stats_maps or market_data.fetch_daily_stats_maps
+    tickers = list(tickers)
+    if progress: progress(f"Downloading {len(tickers)} tickers...", 0.0)
+    prefetch, _ = market_data.bulk_prefetch(tickers, start_date, end_date)
+    fetch = _catch_provider_error(lambda t: (fetch_intraday(t, start_date, end_date, _prefetch=prefetch),
+                                             fetch_daily_stats_maps(t, start_date, _prefetch=prefetch)))
+    on_done = (lambda t, done, total: progress(f"Loading {done}/{total}: {t}", done/total)) if progress else None
+    try: out, timings = run_pipeline(tickers, fetch, lambda t, d: d, concurrency, rate, progress=on_done, thread_initializer=thread_initializer)
+    finally: prefetch.clear()
+    out, _, errors = _split_errors(out, timings)
+    market_data.enforce_store_cap()
+    if errors_out is not None: errors_out.extend(errors)
+    return [(t, d[0], d[1]) for t, d in zip(tickers, out) if d is not None and not d[0].empty]
+
+
+# パイプラインの出力から取得失敗を取り出す (時間の記録は失敗した銘柄も残す)
+def _split_errors(out, timings):
+    errors = [r for r in out if isinstance(r, ProviderError)]
+    return [None if isinstance(r, ProviderError) else r for r in out], timings, errors
+
+
+# 最新足の日付をキーにした前日比
+def _change_pct(df_r, p_maps):
+    try:
+        d_close = df_r['Close'].dropna()
+        if d_close.empty: return 0.0
+        prev_p = p_maps.get(d_close.index[-1].strftime('%Y-%m-%d'))
+        return (d_close.iloc[-1] - prev_p) / prev_p if prev_p else 0.0
+    except Exception: return 0.0
+
+
+RANK_CI_COLS = ['勝率下限', 'PF下限', '期待値下限', '期待値上限', '最大DD', '最大DD上限']   # ランキングに加える信頼区間の列
+
+
+def ranking_rows(items, resamples=DEFAULT_RESAMPLES):
+    """[(銘柄, TradeBuffer, 前日比)] → ランキングの行 (dict) のリスト (トレードのない銘柄は除く)。
+    resamples > 0 なら信頼区間の列も加える (銘柄ごとの値は一緒に計算する銘柄によらない)。"""
+    items = [(t, buf, chg) for t, buf, chg in items if buf]
+    rows = [{'銘柄コード': t, '銘柄名': get_ticker_name(t), '前日比': chg, **summarize_trades(buf)} for t, buf, chg in items]
+    if rows and resamples:
+        with diagnostics.stage("bootstrap"): ci = bootstrap_table([(t, buf.column('PnL')) for t, buf, _ in items], n_resamples=resamples)
+        for row in rows: row.update(ci.loc[row['銘柄コード'], RANK_CI_COLS].to_dict())
+    return rows
+
+
+def rank_frame(rows, sort_by='期待値'):
+    """ランキングの行 → sort_by の降順の DataFrame (同値なら rows の順、NaN は最下位。TopK と同じ並び)。"""
+    df = pd.DataFrame(list(rows))
+    return df.sort_values(sort_by, ascending=False, kind='stable') if not df.empty else df
+
+
+class TopK:
+    """key の値が大きい上位 k 行を保つ (1行ごとに O(log k)、全体の並べ替えなし)。NaN は最下位、同値なら先に来た行を残す。"""
+
+    def __init__(self, k, key):
+        self.k = k; self.key = key
+        self._heap = []; self._seq = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, row):
+        v = row.get(self.key)
+        item = (-math.inf if v is None or v != v else v, -self._seq, row); self._seq += 1
+        if len(self._heap) < self.k: heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]: heapq.heapreplace(self._heap, item)
+
+    def rows(self):
+        return [r for *_, r in sorted(self._heap, key=lambda x: x[:2], reverse=True)]
+
+    def frame(self):
+        return pd.DataFrame(self.rows())
+
+
+# 日足だけで判定できる条件 (株価範囲・ギャップ範囲) による事前選別
+def daily_prefilter(daily, start_date, end_date, params):
+    """
+    日足から 日足マップ・期間内で残す日数 / 除外する日数・除外理由 を求める。
+    株価 (最新の終値) が範囲外なら 'price'、期間内にギャップ範囲内の日がなければ 'gap'、日足がなければ 'no_data'。
+    ギャップ範囲外の日 (前日終値のない日を含む) はシミュレーションでもトレードが出ないので、除外する日数に数える。
+    """
+    d = daily.copy()
+    maps = market_data.build_daily_stats_maps(d)
+    res = {'maps': maps, 'sessions': 0, 'skipped_sessions': 0, 'reason': None}
+    close = d['Close'].dropna() if not d.empty else d
+    if close.empty: res['reason'] = 'no_data'; return res
+    if not (params['p_min'] <= close.iloc[-1] <= params['p_max']): res['reason'] = 'price'; return res
+    p_map, o_map, _ = maps
+    lo, hi = start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+    for date_str, do in o_map.items():
+        if not lo <= date_str <= hi: continue
+        pc = p_map.get(date_str)
+        if pc is not None and params['g_min'] <= (do - pc) / pc <= params['g_max']: res['sessions'] += 1
+        else: res['skipped_sessions'] += 1
+    if not res['sessions']: res['reason'] = 'gap'
+    return res
+
+
+# 2段階の所要時間を銘柄ごとに足し合わせる (入力順)
+def _merge_timings(first, second):
+    by_item = {t['item']: dict(t) for t in first}
+    for t in second:
+        for k in ('fetch', 'wait', 'compute'): by_item[t['item']][k] += t[k]
+    return list(by_item.values())
+
+
+def scan_ranking(tickers, start_date, end_date, params, workers=1, fetch_intraday=None, fetch_daily_bars=None, progress=None, trades_out=None,
+                 concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, thread_initializer=None, timings_out=None, errors_out=None, memo_out=None,
+                 sort_by='期待値', resamples=DEFAULT_RESAMPLES, on_done=None, should_stop=None, engine=None):
+    """
+    全銘柄をスキャンしてランキング (sort_by の降順) を返す。trades_out (list) を渡すと銘柄ごとの TradeBuffer を追加する。
+    先に日足だけを取得して株価範囲・ギャップ範囲で銘柄を選別し、残った銘柄だけ5分足を取得してシミュレーションする。
+    ワーカー数 1 なら取得と並行して届いた銘柄から逐次シミュレーションし、2 以上なら全銘柄の取得後にプロセス並列で実行する。
+    engine="panel" なら全銘柄の取得後に 銘柄 × 日 × 時間枠 のパネルで一括シミュレーションする (workers は使わない。結果は同じ)。
+    取得に失敗した銘柄はランキングから外し、errors_out (list) を渡すとその ProviderError を追加する。
+    resamples 回のブートストラップで 勝率・PF・期待値の下限 / 期待値の上限 / 最大DD とその上限 (95%) の列を加える (0 なら加えない)。
+    sort_by には '期待値下限' などの下限の列も指定できる。
+    on_done(銘柄, ランキングの行 or None) は銘柄の結果が確定するたびに呼ばれる (選別で除外・データなし・トレードなしは None、
+    取得に失敗した銘柄は呼ばれない)。確定した銘柄を除いて呼び直せば、中断したスキャンを続きから再開できる。
+    should_stop() が真を返すと残りの銘柄を打ち切り、それまでの結果でランキングを返す (統計の 'cancelled' が True)。
+    戻り値: (ランキング DataFrame, 統計 {'requests', 'bytes', 'tickers', 'errors' (一括取得),
+             'skipped_price', 'skipped_gap', 'skipped_no_data' (事前選別で除外した銘柄数), 'sessions', 'skipped_sessions' (残した / 除外した日数),
+             'cancelled' (打ち切ったか)})
+    """
+    fetch_intraday = fetch_intraday or market_data.fetch_intraday
+    fetch_daily_bars = fetch_daily_bars or market_data.fetch_daily_bars
+    tickers = list(tickers)
+    stop = should_stop or (lambda: False)
+    results = {}; change_pcts = {}; rows = {}
+    batch = workers > 1 or engine == "panel"   # 全銘柄を読み込んでからまとめて計算するか
+    completed = {'pre': 0, 'load': 0, 'parallel': 0}   # 各段階で処理を終えた銘柄数 (打ち切りの判定用)
+
+    # 結果の確定 (on_done を渡された場合はその場でランキングの行を作って通知する)
+    def finish(t, buf=None, chg=0.0):
+        if buf is not None: results[t] = buf; change_pcts[t] = chg
+        if on_done is None: return
+        if buf: rows[t] = (ranking_rows([(t, buf, chg)], resamples) or [None])[0]
+        on_done(t, rows.get(t))
+
+    # 0. 日足の一括取得と事前選別 (5分足より軽い日足だけで、株価範囲外の銘柄とギャップ範囲外の日を除く)
+    if progress: progress(f"Downloading daily bars: {len(tickers)} tickers...", 0.0)
+    prefetch, stats = market_data.bulk_prefetch(tickers, start_date, end_date, intervals=("1d",))
+    fetch_daily = _catch_provider_error(lambda t: fetch_daily_bars(t, start_date, _prefetch=prefetch))
+    def check(t, d):
+        if isinstance(d, ProviderError): return d
+        with diagnostics.stage("prefilter", t): return daily_prefilter(d, start_date, end_date, params)
+    on_pre = (lambda t, done, total: progress(f"Filtering {done}/{total}: {t}", done/total)) if progress else None
+    def on_checked(t, r):
+        completed['pre'] += 1
+        if isinstance(r, dict) and r['reason']: finish(t)
+    try: pre, pre_timings = run_pipeline(tickers, fetch_daily, check, concurrency, rate, progress=on_pre, thread_initializer=thread_initializer,
+                                         on_result=on_checked, should_stop=stop)
+    finally: prefetch.clear()   # 受け取られなかった日足 (キャッシュにあった銘柄など) を残さない
+    pre, pre_timings, errors = _split_errors(pre, pre_timings)
+    for k in ('skipped_price', 'skipped_gap', 'skipped_no_data', 'sessions', 'skipped_sessions'): stats[k] = 0
+    daily_maps = {}
+    for t, r in zip(tickers, pre):
+        if r is None: continue
+        stats['sessions'] += r['sessions']; stats['skipped_sessions'] += r['skipped_sessions']
+        if r['reason']: stats['skipped_' + r['reason']] += 1
+        else: daily_maps[t] = r['maps']
+    stats['cancelled'] = completed['pre'] < len(tickers)
+    survivors = [t for t in tickers if t in daily_maps] if not stats['cancelled'] else []
+
+    # 1. 残った銘柄の5分足を一括取得 (BULK_CHUNK_SIZE 銘柄ずつまとめてダウンロード)
+    if progress and survivors: progress(f"Downloading {len(survivors)} tickers...", 0.0)
+    for k, v in market_data.bulk_prefetch(survivors, start_date, end_date, intervals=("5m",), prefetch=prefetch)[1].items(): stats[k] += v
+
+    def load(t):
+        # 2. データ取得と空チェック
+        df_r = fetch_intraday(t, start_date, end_date, _prefetch=prefetch)
+        if df_r.empty: return None
+        # 3. 株価範囲のフィルタリング (最新の5分足でも確認)・前日比
+        current_price = df_r['Close'].iloc[-1]
+        if not (params['p_min'] <= current_price <= params['p_max']): return None
+        maps = daily_maps[t]
+        return df_r, maps, _change_pct(df_r, maps[0])
+    load = _catch_provider_error(load)
+
+    # 4. シミュレーション実行 (ワーカー数 1 なら届いた銘柄から逐次、2 以上なら読み込み後にプロセス並列、パネルなら読み込み後に一括)
+    def simulate(t, data):
+        if data is None or isinstance(data, ProviderError) or batch: return data
+        df_r, maps, chg = data
+        return run_ticker_simulation(t, df_r, *maps, params, memo_counts=memo_out), chg
+    def on_result(t, r):
+        completed['load'] += 1
+        if r is None: finish(t)
+        elif not batch and not isinstance(r, ProviderError): finish(t, *r)
+    label = "Loading" if batch else "Scanning"
+    on_progress = (lambda t, done, total: progress(f"{label} {done}/{total}: {t}", done/total)) if progress else None
+    try: out, timings = run_pipeline(survivors, load, simulate, concurrency, rate, progress=on_progress, thread_initializer=thread_initializer,
+                                     on_result=on_result, should_stop=stop)
+    finally: prefetch.clear()
+    out, timings, load_errors = _split_errors(out, timings)
+    errors += load_errors
+    stats['cancelled'] |= completed['load'] < len(survivors)
+    if batch and not stats['cancelled']:
+        jobs = [(t, data[0], data[1]) for t, data in zip(survivors, out) if data]
+        chg = {t: data[2] for t, data in zip(survivors, out) if data}
+        with diagnostics.stage("simulate_panel" if engine == "panel" else "simulate_parallel"):
+            sims = simulate_universe(jobs, params).items() if engine == "panel" else parallel_simulate(jobs, params, workers, memo_out)
+            for done, (t, t_trades) in enumerate(sims, 1):
+                if progress: progress(f"Scanning {done}/{len(jobs)}: {t}", done/len(jobs))
+                finish(t, t_trades, chg[t]); completed['parallel'] += 1
+                if stop(): break
+        stats['cancelled'] = completed['parallel'] < len(jobs)
+    market_data.enforce_store_cap()
+    if timings_out is not None: timings_out.extend(_merge_timings(pre_timings, timings))
+    if errors_out is not None: errors_out.extend(errors)
+    if trades_out is not None:
+        trades_out.extend(results[t] for t in tickers if t in results)
+
+    # 5. 集計 (完了順によらず銘柄リストの順で並べる。on_done で作った行はそのまま使う)
+    rest = [(t, results[t], change_pcts[t]) for t in tickers if t in results and t not in rows]
+    rows.update({r['銘柄コード']: r for r in ranking_rows(rest, resamples)})
+    return rank_frame([rows[t] for t in tickers if rows.get(t)], sort_by), stats
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+# --- テキストレポート (サマリー / 詳細ログ タブのコピー用テキスト) ---
+
+
+def build_summary_report(summary, ticker_names, s_date, e_date):
+    """サマリータブの BACKTEST REPORT。summary は analytics.compute_analytics の銘柄ごとの集計。"""
+    report = []
+    report.append("=================\n BACKTEST REPORT \n=================")
+    report.append(f"\nPeriod: {s_date.strftime('%Y-%m-%d')} - {e_date.strftime('%Y-%m-%d')}\n")
+    for t, r in summary.iterrows():
+        t_name = ticker_names.get(t, t)
+        report.append(f">>> TICKER: {t} | {t_name}")
+        # 指定された順番でフォーマット
+        report.append(f"トレード数: {int(r['回数'])} | 勝率: {r['勝率']:.1%} | 利益平均: {r['利益平均']:+.2%} | 損失平均: {r['損失平均']:+.2%} | PF: {r['PF']:.2f} | 期待値: {r['期待値']:+.2%}\n")
+    return "\n".join(report)
+
+
+LOG_CHUNK_ROWS = 5000   # 詳細ログを書き出すときに1度に整形する行数
+
+
+def log_order(res_df):
+    """詳細ログの並び (銘柄の登場順、銘柄内は新しい順) の行位置の配列。"""
+    keys = res_df[['Ticker', 'Entry']].reset_index(drop=True)
+    parts = [tdf.sort_values('Entry', ascending=False).index.to_numpy() for _, tdf in keys.groupby('Ticker', sort=False, observed=True)]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+
+def filter_trades(res_df, tickers=None, date_range=None, reasons=None):
+    """銘柄・エントリー日 (date_range = (開始日, 終了日)、両端含む)・決済理由で絞り込む行のマスク (None の条件は絞り込まない)。"""
+    m = np.ones(len(res_df), dtype=bool)
+    if tickers: m &= res_df['Ticker'].isin(tickers).to_numpy()
+    if reasons: m &= res_df['Reason'].isin(reasons).to_numpy()
+    if date_range:
+        d = res_df['Entry'].dt.tz_localize(None).to_numpy()   # 東京時間の日時
+        m &= (d >= np.datetime64(pd.Timestamp(date_range[0]))) & (d < np.datetime64(pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)))
+    return m
+
+
+def _log_rows(tdf):
+    """取引行の文字列のリスト。行の整形は列の配列をまとめて回す (iterrows の行ごとの Series 生成を避ける)。"""
+    # VWAP乖離の計算
+    vwap = tdf['EntryVWAP'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'): vwap_dev = ((tdf['In'].to_numpy(dtype=float) - vwap) / vwap) * 100
+    lines = []
+    cols = zip(tdf['Entry'].dt.strftime('%Y-%m-%d %H:%M'), tdf['PrevClose'], tdf['DayOpen'], tdf['Pattern'], tdf['PnL'], tdf['Gap(%)'],
+               tdf['In'], tdf['Out'], vwap, vwap_dev, tdf['Reason'])
+    for entry_str, pc, do, pattern, pnl, gap, p_in, p_out, v, dev, reason in cols:
+        vwap_str = f"{int(round(v))} (乖離 {dev:+.2f}%)" if pd.notna(v) and v != 0 else "- (乖離 -)"
+        # 買・売の金額を int() で切り捨て整形
+        lines.append(
+            f"{entry_str} | "
+            f"前終値：{int(pc)} | 始値：{int(do)} | "
+            f"{pattern} | "
+            f"PnL: {pnl:+.2%} | Gap: {gap:+.2f}% | "
+            f"買：{int(p_in)} | 売：{int(p_out)} | "
+            f"VWAP: {vwap_str} | "
+            f"{reason}"
+        )
+    return lines
+
+
+def iter_trade_log(tdf, ticker_names, chunk_rows=LOG_CHUNK_ROWS):
+    """
+    並び替え済みのトレード (log_order の順など) の詳細ログを chunk_rows 行ずつ整形して文字列で返すジェネレーター。
+    同じ銘柄が続く区間ごとに見出しを付ける。つなげると build_trade_log と同じテキストになる。
+    """
+    codes = pd.Categorical(tdf['Ticker']).codes
+    bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    first = True
+    for a, b in zip(np.r_[0, bounds], np.r_[bounds, len(tdf)]):
+        if a == b: continue
+        t = tdf['Ticker'].iloc[a]
+        blocks = [[f"[{t}] {ticker_names.get(t, t)} 取引履歴", "-" * 80]]
+        blocks += (_log_rows(tdf.iloc[c:min(c + chunk_rows, b)]) for c in range(a, b, chunk_rows))
+        blocks.append(["\n"])
+        for lines in blocks:
+            yield ("" if first else "\n") + "\n".join(lines); first = False
+
+
+def build_trade_log(res_df, ticker_names):
+    """詳細ログタブの取引履歴 (銘柄ごと・新しい順) の全文。"""
+    return "".join(iter_trade_log(res_df.iloc[log_order(res_df)], ticker_names))
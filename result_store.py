@@ -0,0 +1,139 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from analytics import frame_fingerprint
+
+# --- 結果セットの省メモリ保存 (セッション間で共有) ---
+# セッションごとに持つ結果 (トレード一覧・ランキング・探索結果) を列ごとの配列で保存する:
+#   文字列 (object / str / カテゴリー) 列はカテゴリーのコード (int8 / int16 ...) + カテゴリー、
+#   日時列は UTC の int64 (ns) + タイムゾーン名、float32_cols に指定した列は float32、その他は元の型のまま。
+# 中身のハッシュが同じ結果は RESULT_STORE で1つだけ持ち、複数のセッションから同じものを参照する
+# (どのセッションからも参照されなくなれば解放される)。結果セットは変更しない (frame() は毎回新しい DataFrame を返す)。
+# SessionResults はセッション内の結果セットを名前で持ち、合計サイズが上限を超えたら古いものから捨てる。
+
+# float32 にする列 (値の表示・切り捨て表示だけに使う列。損益・約定価格・ギャップ・VWAP は集計や区分の境界に使うので float64 のまま)
+TRADE_FLOAT32_COLS = ('PrevClose', 'DayOpen', 'SL設定(%)')
+# 探索結果では価格に対する割合のパラメータ列だけ (回数・勝率・PF・期待値は並べ替え・比較に使うので元の型のまま)
+SWEEP_FLOAT32_COLS = ('g_min', 'g_max', 'ts_start', 'ts_width', 'sl_fix', 'atr_mul', 'atr_min')
+SESSION_RESULTS_MB = int(os.environ.get("BACKTESTER_SESSION_RESULTS_MB", "256"))
+
+
+def _code_dtype(n):
+    for dt in (np.int8, np.int16, np.int32):
+        if n < np.iinfo(dt).max: return dt
+    return np.int64
+
+
+class CompactFrame:
+    """DataFrame を列ごとの省メモリな配列で持つ (変更不可)。key は元の DataFrame の中身のハッシュ。"""
+
+    def __init__(self, df, key=None, float32_cols=()):
+        self.key = key or frame_fingerprint(df)
+        self.columns = pd.Index(df.columns)
+        self.index = df.index if not isinstance(df.index, pd.RangeIndex) else None   # RangeIndex は長さだけで復元できる
+        self._n = len(df); self._cols = {}
+        for c in df.columns:
+            s = df[c]
+            if isinstance(s.dtype, (pd.CategoricalDtype, pd.StringDtype)) or s.dtype == object:
+                cat = pd.Categorical(s)
+                self._cols[c] = ('cat', cat.codes.astype(_code_dtype(len(cat.categories))), cat.categories, cat.ordered)
+            elif isinstance(s.dtype, pd.DatetimeTZDtype):
+                self._cols[c] = ('time', s.array.asi8.copy(), str(s.dt.tz))
+            elif c in float32_cols and s.dtype == np.float64:
+                self._cols[c] = ('f32', s.to_numpy(dtype=np.float32))
+            else:
+                self._cols[c] = ('raw', s.to_numpy(copy=True))
+        self.nbytes = sum(_col_nbytes(v) for v in self._cols.values()) + (self.index.memory_usage(deep=True) if self.index is not None else 0)
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def empty(self):
+        return self._n == 0 or len(self.columns) == 0
+
+    def frame(self, columns=None, rows=None):
+        """
+        元の列の型 (文字列列はカテゴリー、日時は tz 付き、float32 の列は float64) の DataFrame。
+        columns / rows (行位置の配列) を渡すとその列・行だけを戻す (.iloc[rows] と同じ。表示するページの分だけ戻す用)。
+        """
+        data = {}; columns = self.columns if columns is None else pd.Index(columns)
+        for c in columns:
+            kind, arr, *meta = self._cols[c]
+            if rows is not None: arr = arr[rows]
+            if kind == 'cat': data[c] = pd.Categorical.from_codes(arr, categories=meta[0], ordered=meta[1])
+            elif kind == 'time': data[c] = pd.DatetimeIndex(arr.view('datetime64[ns]')).tz_localize('UTC').tz_convert(meta[0])
+            elif kind == 'f32': data[c] = arr.astype(np.float64)
+            else: data[c] = arr
+        if rows is None: index = self.index if self.index is not None else pd.RangeIndex(self._n)
+        else: index = self.index[rows] if self.index is not None else pd.Index(np.asarray(rows, dtype=np.int64))
+        return pd.DataFrame(data, columns=columns, index=index)
+
+
+def _col_nbytes(col):
+    kind, arr, *meta = col
+    return arr.nbytes + (int(meta[0].memory_usage(deep=True)) if kind == 'cat' else 0)
+
+
+class ResultStore:
+    """中身のハッシュ → CompactFrame (参照がなくなれば消える)。同じ中身の結果は1つにまとめる。"""
+
+    def __init__(self):
+        self._entries = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.shared = 0   # 既存の結果を共有した回数
+
+    def put(self, df, float32_cols=()):
+        key = frame_fingerprint(df) + "".join(f"|{c}" for c in float32_cols if c in df.columns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None: self.shared += 1; return entry
+            entry = self._entries[key] = CompactFrame(df, key, float32_cols)
+            return entry
+
+    def stats(self):
+        with self._lock: entries = list(self._entries.values())
+        return {'entries': len(entries), 'bytes': sum(e.nbytes for e in entries), 'shared': self.shared}
+
+
+RESULT_STORE = ResultStore()
+
+
+class SessionResults:
+    """1セッションの結果セット (名前 → CompactFrame)。合計サイズが max_bytes を超えたら古い結果セットから捨てる (最新の1つは残す)。"""
+
+    def __init__(self, max_bytes=SESSION_RESULTS_MB * 1024**2, store=None):
+        self.max_bytes = max_bytes
+        self.store = store or RESULT_STORE
+        self._items = OrderedDict()
+        self.evicted = []   # 上限で捨てた結果セットの名前 (古い順)
+
+    def __contains__(self, name):
+        return name in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def nbytes(self):
+        return sum(e.nbytes for e in self._items.values())
+
+    def put(self, name, df, float32_cols=()):
+        entry = self.store.put(df, float32_cols)
+        self._items.pop(name, None); self._items[name] = entry
+        while self.nbytes > self.max_bytes and len(self._items) > 1:
+            old, _ = self._items.popitem(last=False); self.evicted.append(old)
+        return entry
+
+    def get(self, name):
+        return self._items.get(name)
+
+    def frame(self, name):
+        entry = self._items.get(name)
+        return entry.frame() if entry is not None else None
+
+    def pop(self, name):
+        return self._items.pop(name, None)
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+# --- ブートストラップによる成績の信頼区間 ---
+# トレードの損益列から復元抽出を n_resamples 回行い、勝率・PF・期待値・最大ドローダウンの分布の分位点を信頼区間とする。
+# 抽出は添字行列 (抽出回数, トレード数) で一度に行う。トレード数が同じ銘柄は同じ添字行列を使い、
+# 1銘柄分の要素数が CHUNK_ELEMS を超える場合は抽出回数の方向に分ける (ポートフォリオ全体のトレードでもメモリを抑える)。
+# 最大ドローダウン = 抽出した順に損益 (割合) を足した累積損益の、それまでの最高値 (開始時の 0 を含む) からの最大の下落幅。
+# 乱数は (seed, トレード数) ごとに作るので、ある系列の信頼区間は一緒に計算する他の系列によらない (1銘柄ずつ求めても同じ値)。
+
+DEFAULT_RESAMPLES = 10_000
+DEFAULT_CI = 0.95
+CHUNK_ELEMS = 4_000_000
+PF_NO_LOSS = 9.99   # 損失なしの PF (summarize_pnl と同じ)
+METRICS = ['勝率', 'PF', '期待値', '最大DD']
+
+
+def _metrics(s):
+    """損益 (..., トレード数) → 勝率・PF・期待値・最大DD の配列 (4, ...)。"""
+    g_win = np.maximum(s, 0.0).sum(-1); g_loss = np.minimum(s, 0.0).sum(-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pf = np.where(g_loss != 0, g_win / np.abs(g_loss), PF_NO_LOSS)
+    cum = np.cumsum(s, axis=-1)
+    peak = np.maximum.accumulate(np.maximum(cum, 0.0), axis=-1)
+    return np.stack([(s > 0).mean(-1), pf, s.mean(-1), (peak - cum).max(-1)])
+
+
+def _resample(P, n_resamples, rng):
+    """P: (銘柄, トレード数) → 抽出ごとの指標 (4, 銘柄, 抽出回数)。全銘柄で同じ添字行列を使う。
+    指標は銘柄ごとに (抽出回数, トレード数) で求める (3次元のまま合計すると、まとめた銘柄数で最下位ビットが変わるため)。"""
+    k, n = P.shape
+    rows = max(1, CHUNK_ELEMS // n)
+    out = np.empty((4, k, n_resamples))
+    for a in range(0, n_resamples, rows):
+        b = min(a + rows, n_resamples)
+        idx = rng.integers(0, n, size=(b - a, n))
+        for j in range(k): out[:, j, a:b] = _metrics(P[j][idx])
+    return out
+
+
+def bootstrap_table(groups, n_resamples=DEFAULT_RESAMPLES, ci=DEFAULT_CI, seed=0):
+    """
+    groups: [(名前, 損益の配列 (時系列順))] → 名前ごとの 回数 と 各指標の 点推定・下限・上限 の DataFrame (名前がインデックス)。
+    NaN の損益は除く。点推定の最大DDは元の順序での値。n_resamples が 0 なら点推定だけ (下限・上限は NaN)。
+    """
+    q = [(1 - ci) / 2, 1 - (1 - ci) / 2]
+    names = [g for g, _ in groups]
+    series = {g: np.asarray(p, dtype=np.float64) for g, p in groups}
+    series = {g: p[~np.isnan(p)] for g, p in series.items()}
+    res = pd.DataFrame(index=pd.Index(names), columns=['回数'] + [f"{m}{s}" for m in METRICS for s in ('', '下限', '上限')], dtype=np.float64)
+    by_len = {}
+    for g in names: by_len.setdefault(len(series[g]), []).append(g)
+    for n, gs in by_len.items():
+        res.loc[gs, '回数'] = n
+        if n == 0: continue
+        P = np.stack([series[g] for g in gs])
+        point = _metrics(P)
+        if n_resamples > 0: lo, hi = np.quantile(_resample(P, n_resamples, np.random.default_rng([seed, n])), q, axis=-1)
+        else: lo = hi = np.full_like(point, np.nan)
+        for i, m in enumerate(METRICS):
+            res.loc[gs, m] = point[i]; res.loc[gs, f"{m}下限"] = lo[i]; res.loc[gs, f"{m}上限"] = hi[i]
+    res['回数'] = res['回数'].astype(int)
+    return res
+
+
+def bootstrap_trades(res_df, n_resamples=DEFAULT_RESAMPLES, ci=DEFAULT_CI, seed=0, portfolio="全体"):
+    """トレード一覧 → 銘柄ごと (登場順) と全体 (portfolio 行、全銘柄のトレードをエントリー順に並べたもの) の信頼区間。"""
+    if res_df.empty: return bootstrap_table([], n_resamples, ci, seed)
+    df = res_df.sort_values('Entry', kind='stable')
+    tickers = pd.unique(res_df['Ticker'])
+    groups = [(t, df.loc[df['Ticker'] == t, 'PnL'].to_numpy()) for t in tickers] + [(portfolio, df['PnL'].to_numpy())]
+    return bootstrap_table(groups, n_resamples, ci, seed)
+
+
+def display_ci(tab, names=None):
+    """信頼区間の表を表示用の文字列の表にする (点推定 [下限 ～ 上限])。"""
+    names = names or {}
+    fmt = {'勝率': '{:.1%}', 'PF': '{:.2f}', '期待値': '{:+.2%}', '最大DD': '{:.2%}'}
+    out = pd.DataFrame({'銘柄': [f"{t} {names[t]}" if t in names and names[t] != t else str(t) for t in tab.index],
+                        'トレード数': tab['回数'].astype(str).to_numpy()})
+    for m, f in fmt.items():
+        out[m] = [f"{f.format(v)} [{f.format(lo)} ～ {f.format(hi)}]" if n else "-"
+                  for v, lo, hi, n in zip(tab[m], tab[f"{m}下限"], tab[f"{m}上限"], tab['回数'])]
+    return out
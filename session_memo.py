@@ -0,0 +1,65 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# --- (銘柄, 日) 単位のシミュレーション結果のメモ ---
+# 1日の結果 (1日1トレードまで) は、その日の場中の足・インジケーター値・前日終値/始値/ATR と
+# 判定用パラメータだけで決まる。これらをキーにして日ごとの結果 (トレード or なし) を覚えておき、
+# 期間の延長・銘柄の追加・新しい1日の追加による再実行では、新しい日と中身が変わった日だけを計算する。
+# インジケーター値はキーの一部なので、期間の始点が変わって値が変わった日 (ウォームアップ区間) は再計算される。
+# SESSION_MEMO は複数のセッション・スレッドで共有するので、参照・追加・削除はロックの中で行う (compute() はロックの外)。
+
+# 1日の結果に影響するパラメータ (ギャップ範囲は日ごとの事前判定、days / 株価範囲は銘柄の選別にだけ使う)
+SESSION_PARAM_KEYS = ('start_t', 'end_t', 'u_vwap', 'u_ema', 'u_rsi', 'u_macd', 'ts_start', 'ts_width', 'sl_fix', 'u_atr', 'atr_mul', 'atr_min')
+
+
+def params_digest(params):
+    return hashlib.blake2b(repr([(k, params[k]) for k in SESSION_PARAM_KEYS]).encode(), digest_size=12).digest()
+
+
+def session_matrix(S):
+    """日ごとのハッシュ用に、判定に使う列を行方向に並べた配列 (行 a:b が1日分の連続領域になる)。"""
+    return np.column_stack([S['ns'].view(np.float64), S['Close'], S['High'], S['Low'], S['VWAP'],
+                            S['EMA5'], S['RSI14'], S['RSI14_P'], S['MH'], S['MH_P']])
+
+
+def session_digest(M, a, b):
+    return hashlib.blake2b(M[a:b].tobytes(), digest_size=16).digest()
+
+
+class SessionMemo:
+    """キー → 1日分の結果 (append の引数のタプル、トレードなしは None) の LRU (件数で上限管理、スレッドセーフ)。"""
+
+    def __init__(self, max_entries=200_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0; self.misses = 0
+
+    def __len__(self):
+        with self._lock: return len(self._entries)
+
+    def stats(self):
+        with self._lock: return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def clear(self):
+        with self._lock: self._entries.clear()
+
+    def lookup(self, key, compute, counts=None):
+        """key の結果を返す。なければ compute() で求めて記録する。counts (dict) の 'reused' / 'computed' を加算する。"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key); self.hits += 1
+                if counts is not None: counts['reused'] = counts.get('reused', 0) + 1
+                return self._entries[key]
+        value = compute()
+        with self._lock:
+            self._entries[key] = value; self._entries.move_to_end(key); self.misses += 1
+            if counts is not None: counts['computed'] = counts.get('computed', 0) + 1
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+        return value
+
+
+SESSION_MEMO = SessionMemo(max_entries=int(os.environ.get("BACKTESTER_SESSION_MEMO_ENTRIES", "200000")))
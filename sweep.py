@@ -0,0 +1,218 @@
+import itertools
+from datetime import time
+import numpy as np
+import pandas as pd
+from indicator_cache import INDICATOR_CACHE
+from bars import Bars
+from backtest_engine import session_arrays, _time_us, _post_entry_high, EXIT_TIME
+
+# --- パラメータ探索 (グリッドサーチ) ---
+# 銘柄ごとにインジケーター・VWAP・日足マップの前処理を1回だけ行い、
+# エントリー条件 (VWAP/EMA/RSI/MACD の on/off 16通り) は足ごとのビットマスクで判定する。
+# 決済パラメータ (トレイリング・損切り) はエントリー足ごとに全組み合わせをまとめて配列計算し、
+# 「エントリー組み合わせ × 日」の出現回数行列との積で全組み合わせの集計を一度に求める。
+
+ENTRY_FLAGS = ['u_vwap', 'u_ema', 'u_rsi', 'u_macd']   # ビット 0..3
+ALL_MASKS = list(range(16))
+
+
+def mask_to_flags(m):
+    return {f: bool(m >> i & 1) for i, f in enumerate(ENTRY_FLAGS)}
+
+
+def flags_to_mask(params):
+    return sum(1 << i for i, f in enumerate(ENTRY_FLAGS) if params[f])
+
+
+# "0.2, 0.5" (列挙) または "0.2:1.0:0.1" (開始:終了:刻み、終了を含む) を数値リストに変換
+def parse_grid(text, scale=1.0):
+    vals = []
+    for tok in str(text).split(','):
+        tok = tok.strip()
+        if not tok: continue
+        if ':' in tok:
+            a, b, step = (float(x) for x in tok.split(':'))
+            n = int(np.floor((b - a) / step + 1e-9)) + 1
+            vals.extend(round(a + k * step, 10) for k in range(max(n, 0)))
+        else: vals.append(float(tok))
+    return sorted(set(v * scale for v in vals))
+
+
+# "09:00, 09:15" または "09:00-09:30/5" (開始-終了/刻み分) を time のリストに変換
+def parse_time_grid(text):
+    out = []
+    for tok in str(text).split(','):
+        tok = tok.strip()
+        if not tok: continue
+        if '-' in tok:
+            rng, _, step = tok.partition('/')
+            a, b = (pd.Timestamp(x.strip()).hour * 60 + pd.Timestamp(x.strip()).minute for x in rng.split('-'))
+            out.extend(time(m // 60, m % 60) for m in range(a, b + 1, int(step or 5)))
+        else:
+            ts = pd.Timestamp(tok); out.append(time(ts.hour, ts.minute))
+    return sorted(set(out))
+
+
+def grid_from_spec(spec, params):
+    """
+    {'ts_start': "0.003:0.009:0.001", 'start_t': "09:00-09:30/5", 'masks': "all", ...} からグリッドを作る (割合は小数)。
+    値は parse_grid / parse_time_grid の書式の文字列か数値のリスト。指定のないキーは params の値1つだけ。
+    """
+    grid = {}
+    for k in ('start_t', 'end_t', 'g_min', 'g_max', 'ts_start', 'ts_width', 'sl_fix', 'atr_mul', 'atr_min'):
+        v = spec.get(k)
+        if v is None: grid[k] = [params[k]]
+        elif k in ('start_t', 'end_t'): grid[k] = parse_time_grid(v if isinstance(v, str) else ",".join(v))
+        else: grid[k] = parse_grid(v) if isinstance(v, str) else sorted(set(float(x) for x in v))
+    m = spec.get('masks')
+    grid['masks'] = ALL_MASKS if m == "all" else [flags_to_mask(params)] if m is None else [int(x) for x in m]
+    return grid
+
+
+def prepare_ticker(ticker, df, pc_map, co_map, a_map):
+    """銘柄ごとの前処理 (インジケーター・場中配列・条件ビット・日ごとのギャップ/ATR)。"""
+    if df.empty: return None
+    S = session_arrays(INDICATOR_CACHE.get(ticker, df), df if isinstance(df, Bars) else None)
+    if S is None: return None
+    close = S['Close']
+    bits = ((close > S['VWAP']).astype(np.uint8)
+            | (close > S['EMA5']).astype(np.uint8) << 1
+            | ((S['RSI14'] > 45) & (S['RSI14'] > S['RSI14_P'])).astype(np.uint8) << 2
+            | (S['MH'] > S['MH_P']).astype(np.uint8) << 3)
+    days = []
+    for k, d in enumerate(S['dates']):
+        pc = pc_map.get(d); do = co_map.get(d)
+        if pc is None or do is None: continue
+        days.append((k, (do - pc) / pc, a_map.get(d)))
+    if not days: return None
+    day_k = np.array([k for k, _, _ in days])
+    day_of_bar = np.repeat(np.arange(len(S['starts'])), S['ends'] - S['starts'])
+    S.update({'bits': bits, 'day_k': day_k, 'gap': np.array([g for _, g, _ in days]),
+              'atr': {k: a for k, _, a in days}, 'day_of_bar': day_of_bar,
+              'key': day_of_bar * 86_400_000_000 + S['tod'], 'n': len(close)})
+    return S
+
+
+# 各バー以降で条件 m を満たす最初のバー (同じ日の中になければ n)
+def _next_pass(S, m):
+    n = S['n']
+    pos = np.where((S['bits'] & m) == m, np.arange(n), n)
+    nxt = np.minimum.accumulate(pos[::-1])[::-1]
+    day_end = np.repeat(S['ends'], S['ends'] - S['starts'])
+    return np.where(nxt < day_end, nxt, n)
+
+
+def _entry_bars(S, m, start_t, end_t, nxt):
+    """対象日 (day_k) ごとのエントリー足。エントリーなしは -1。"""
+    n = S['n']; k = S['day_k']
+    first = np.searchsorted(S['key'], k * 86_400_000_000 + _time_us(start_t), side='left')
+    e = np.where(first < n, nxt[np.minimum(first, n - 1)], n)
+    ok = (e < n) & (e < S['ends'][k])
+    ok &= S['tod'][np.minimum(e, n - 1)] <= _time_us(end_t)
+    return np.where(ok, e, -1)
+
+
+def _exit_pnl(S, e, atr, ts_s, ts_w, sl_fix, atr_mul, atr_min, u_atr):
+    """エントリー足 e の決済損益を決済パラメータの全組み合わせについて計算。(損益, 決済ありフラグ) を返す。"""
+    b = S['ends'][S['day_of_bar'][e]]
+    entry_p = S['Close'][e] * 1.0003
+    if u_atr and atr and entry_p > 0: sl_rec = np.maximum(atr_min, (atr/entry_p)*atr_mul)
+    else: sl_rec = np.abs(sl_fix)
+    stop_p = entry_p * (1 - sl_rec)
+
+    t_high = _post_entry_high(S['High'][e:b])[None, :]
+    l_post = S['Low'][e+1:b][None, :]
+    trail_lv = t_high * (1 - ts_w[:, None])
+    hit_trail = (t_high >= entry_p * (1 + ts_s[:, None])) & (l_post <= trail_lv)
+    hit_stop = l_post <= stop_p[:, None]
+    hit = hit_trail | hit_stop | (S['tod'][e+1:b] >= _time_us(EXIT_TIME))[None, :]
+    pnl = np.full(len(ts_s), np.nan)
+    if hit.shape[1] == 0: return pnl, np.zeros(len(ts_s), dtype=bool)
+    j = np.argmax(hit, axis=1); rows = np.arange(len(ts_s))
+    ex_p = np.where(hit_trail[rows, j], trail_lv[rows, j] * 0.9997,
+                    np.where(hit_stop[rows, j], stop_p * 0.9997, S['Close'][e+1+j] * 0.9997))
+    found = hit[rows, j]
+    pnl[found] = (ex_p[found] - entry_p) / entry_p
+    return pnl, found
+
+
+def sweep_combos(grid, base_params):
+    """グリッドから (エントリー組み合わせのリスト, 決済パラメータの配列 {'ts_start', 'ts_width', 'sl_fix', 'atr_mul', 'atr_min'}) を作る。"""
+    entry_combos = list(itertools.product(grid['masks'], grid['start_t'], grid['end_t'], grid['g_min'], grid['g_max']))
+    stop_grid = itertools.product(grid['sl_fix'], grid['atr_mul'], grid['atr_min']) if base_params['u_atr'] else [(v, base_params['atr_mul'], base_params['atr_min']) for v in grid['sl_fix']]
+    exit_combos = list(itertools.product(grid['ts_start'], grid['ts_width'], stop_grid))
+    X = {'ts_start': np.array([c[0] for c in exit_combos]), 'ts_width': np.array([c[1] for c in exit_combos]),
+         'sl_fix': np.array([c[2][0] for c in exit_combos]), 'atr_mul': np.array([c[2][1] for c in exit_combos]), 'atr_min': np.array([c[2][2] for c in exit_combos])}
+    return entry_combos, X
+
+
+ACC_KEYS = ('cnt', 'n_pnl', 'wins', 'g_win', 'g_loss')   # 決済数・損益ありの数・勝ち数・総利益・総損失 (足し合わせられる集計)
+
+
+def sweep_stats(data, grid, base_params, segments=None, n_seg=1):
+    """
+    全組み合わせの集計を区間ごとに求める。segments: {日付文字列: 区間番号} (None なら全日を区間 0、含まれない日は対象外)。
+    戻り値: {ACC_KEYS の各名前: (区間, エントリー組み合わせ, 決済組み合わせ) の配列}。区間どうし・銘柄どうしで足し合わせられる。
+    """
+    u_atr = base_params['u_atr']
+    entry_combos, X = sweep_combos(grid, base_params)
+    ts_s, ts_w, sl_fix, atr_mul, atr_min = (X[k] for k in ('ts_start', 'ts_width', 'sl_fix', 'atr_mul', 'atr_min'))
+    n_e, n_x = len(entry_combos), len(ts_s)
+    acc = {k: np.zeros((n_seg, n_e, n_x)) for k in ACC_KEYS}
+    for ticker, df, (pc_map, co_map, a_map) in data:
+        S = prepare_ticker(ticker, df, pc_map, co_map, a_map)
+        if S is None: continue
+        seg = np.zeros(len(S['day_k']), dtype=np.int64) if segments is None else np.array([segments.get(S['dates'][k], -1) for k in S['day_k']], dtype=np.int64)
+        if not (seg >= 0).any(): continue
+        nxt = {m: _next_pass(S, m) for m in set(grid['masks'])}
+        # エントリー組み合わせごとの対象日のエントリー足 → (区間, 組み合わせ) ごとの一意なエントリー足の出現回数
+        entries = np.empty((n_e, len(S['day_k'])), dtype=np.int64)
+        for ci, (m, st_t, en_t, g_lo, g_hi) in enumerate(entry_combos):
+            e = _entry_bars(S, m, st_t, en_t, nxt[m])
+            entries[ci] = np.where((S['gap'] >= g_lo) & (S['gap'] <= g_hi) & (seg >= 0), e, -1)
+        uniq, inv = np.unique(entries, return_inverse=True)
+        inv = inv.reshape(entries.shape)
+        occ = np.zeros((n_seg, n_e, len(uniq)))
+        np.add.at(occ, (np.tile(np.maximum(seg, 0), n_e), np.repeat(np.arange(n_e), entries.shape[1]), inv.ravel()), 1)
+        # 一意なエントリー足ごとに決済パラメータ全組み合わせの損益
+        pnl = np.full((len(uniq), n_x), np.nan); traded = np.zeros((len(uniq), n_x), dtype=bool)
+        for ui, e in enumerate(uniq):
+            if e < 0: continue
+            pnl[ui], traded[ui] = _exit_pnl(S, int(e), S['atr'][S['day_of_bar'][e]], ts_s, ts_w, sl_fix, atr_mul, atr_min, u_atr)
+        valid = ~np.isnan(pnl); p0 = np.where(valid, pnl, 0.0)
+        acc['cnt'] += occ @ traded; acc['n_pnl'] += occ @ valid; acc['wins'] += occ @ (p0 > 0)
+        acc['g_win'] += occ @ np.where(p0 > 0, p0, 0.0); acc['g_loss'] += occ @ np.where(valid & (p0 <= 0), p0, 0.0)
+    return acc
+
+
+def acc_metrics(cnt, n_pnl, wins, g_win, g_loss):
+    """集計から 勝率・PF (損失なしは 9.99)・期待値。"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return wins / cnt, np.where(g_loss != 0, g_win / np.abs(g_loss), 9.99), (g_win + g_loss) / n_pnl
+
+
+def combo_params(entry_combos, X, ei, xi):
+    """組み合わせ番号 (エントリー ei, 決済 xi) の配列 → パラメータ列の dict。"""
+    E = pd.DataFrame(entry_combos, columns=['mask', 'start_t', 'end_t', 'g_min', 'g_max'])
+    return {'start_t': E['start_t'].to_numpy()[ei], 'end_t': E['end_t'].to_numpy()[ei],
+            **{f: (E['mask'].to_numpy()[ei] >> i & 1).astype(bool) for i, f in enumerate(ENTRY_FLAGS)},
+            'g_min': E['g_min'].to_numpy()[ei], 'g_max': E['g_max'].to_numpy()[ei],
+            **{k: X[k][xi] for k in ('ts_start', 'ts_width', 'sl_fix', 'atr_mul', 'atr_min')}}
+
+
+def run_sweep(data, grid, base_params):
+    """
+    data: [(銘柄, 5分足, (p_map, o_map, a_map))]
+    grid: {'masks', 'start_t', 'end_t', 'g_min', 'g_max', 'ts_start', 'ts_width', 'sl_fix', 'atr_mul', 'atr_min'} の各リスト
+    戻り値: 組み合わせごとの 回数・勝率・PF・期待値 (全銘柄合算) の DataFrame
+    """
+    entry_combos, X = sweep_combos(grid, base_params)
+    acc = {k: v[0] for k, v in sweep_stats(data, grid, base_params).items()}
+    win_rate, pf, exp = acc_metrics(**acc)
+    n_x = len(X['ts_start'])
+    ei, xi = np.divmod(np.arange(len(entry_combos) * n_x), n_x)
+    out = pd.DataFrame({
+        **combo_params(entry_combos, X, ei, xi),
+        '回数': acc['cnt'].ravel().astype(int), '勝率': win_rate.ravel(), 'PF': pf.ravel(), '期待値': exp.ravel(),
+    })
+    return out[out['回数'] > 0].sort_values('期待値', ascending=False).reset_index(drop=True)
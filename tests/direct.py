@@ -0,0 +1,24 @@
+import numpy as np
+from backtest_engine import run_ticker_simulation
+from trade_buffer import summarize_pnl
+
+# 一括計算 (グリッドサーチ・応答曲面・ウォークフォワード) の比較対象: 同じパラメータで銘柄ごとに run_ticker_simulation を実行した結果
+
+
+def direct_pnl(data, params):
+    """data: [(銘柄, 5分足, 日足マップ)] の全銘柄のトレードの損益 (銘柄順に連結)。"""
+    return np.concatenate([run_ticker_simulation(t, df, *maps, params).column('PnL') for t, df, maps in data] or [np.zeros(0)])
+
+
+def direct_metrics(data, params):
+    """全銘柄合算の 回数・勝率・PF・期待値 (トレードがなければ回数 0 だけ)。"""
+    pnl = direct_pnl(data, params)
+    return summarize_pnl(pnl) if len(pnl) else {'回数': 0}
+
+
+def assert_metrics_match(row, expected, label=''):
+    """集計の行 (回数・勝率・PF・期待値) が直接計算した値と一致すること (合計の順序による丸め誤差だけ許す)。"""
+    assert row['回数'] == expected['回数'], label
+    if not expected['回数']: return
+    for k in ('勝率', 'PF', '期待値'):
+        assert np.isclose(row[k], expected[k], rtol=1e-9, atol=1e-12, equal_nan=True), f"{label} {k}: {row[k]} != {expected[k]}"
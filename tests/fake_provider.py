@@ -0,0 +1,43 @@
+import random
+import threading
+import time
+from bars import ingest_bars
+from benchmark import make_synthetic_ticker
+from market_data import build_daily_stats_maps
+from providers import ProviderError
+
+
+class FakeProvider:
+    """
+    ネットワークの代わりに、一定の遅延のあとで合成データを返す取得関数の組 (オフラインのテスト用)。
+    fetch_intraday / fetch_daily_stats_maps は market_data の同名関数と同じ引数・戻り値。
+    fail に含まれる銘柄は ProviderError を送出する。同時実行数の最大値 (max_in_flight) と各リクエストの開始時刻 (starts) を記録する。
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, n_days=59, seed=0, fail=()):
+        self.latency = latency; self.jitter = jitter; self.n_days = n_days; self.seed = seed; self.fail = set(fail)
+        self.in_flight = 0; self.max_in_flight = 0; self.starts = []
+        self._lock = threading.Lock(); self._data = {}
+
+    def _request(self, ticker):
+        with self._lock:
+            self.in_flight += 1; self.max_in_flight = max(self.max_in_flight, self.in_flight); self.starts.append(time.monotonic())
+        try: time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        finally:
+            with self._lock: self.in_flight -= 1
+        if ticker in self.fail: raise ProviderError(ticker, "fake failure", "fake")
+
+    def synthetic(self, ticker):
+        """銘柄の (5分足, 日足)。"""
+        with self._lock:
+            if ticker not in self._data:
+                self._data[ticker] = make_synthetic_ticker(self.n_days, seed=self.seed * 100_003 + sum(map(ord, ticker)))
+            return self._data[ticker]
+
+    def fetch_intraday(self, ticker, start, end, _prefetch=None):
+        self._request(ticker)
+        return ingest_bars(self.synthetic(ticker)[0])
+
+    def fetch_daily_stats_maps(self, ticker, start, _prefetch=None):
+        self._request(ticker)
+        return build_daily_stats_maps(self.synthetic(ticker)[1].copy())
@@ -0,0 +1,90 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from analytics import compute_analytics, display_table, frame_fingerprint
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from benchmark import make_synthetic_universe
+from market_data import build_daily_stats_maps
+
+# 結果タブの集計 (compute_analytics) が、銘柄ごとに pd.cut / groupby で計算していた従来のタブの表と同じであることの確認
+
+
+@pytest.fixture(scope='module')
+def res_df():
+    params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05)
+    frames = [run_ticker_simulation(t, i, *build_daily_stats_maps(d.copy()), params).to_frame()
+              for t, (i, d) in make_synthetic_universe(5, 20, seed=21).items()]
+    df = pd.concat(frames, ignore_index=True)
+    df.loc[3, 'PnL'] = np.nan; df.loc[5, 'EntryVWAP'] = np.nan   # 損益・VWAP の欠けた行も含める
+    return df
+
+
+def _old_range(tdf, col, lo, hi, step, name):
+    """従来のタブ: 銘柄ごとの最小/最大から区切りを作り pd.cut で区分した表。"""
+    tdf[name] = pd.cut(tdf[col], bins=np.arange(lo, hi + step, step))
+    s = tdf.groupby(name, observed=True).agg(Count=('PnL', 'count'), WinRate=('PnL', lambda x: (x > 0).mean()), AvgPnL=('PnL', 'mean')).reset_index()
+    s['Label'] = s[name].apply(lambda i: f"{i.left:.1f}% ～ {i.right:.1f}%")
+    return s
+
+
+def _old_tables(tdf):
+    tdf = tdf.copy()
+    min_g, max_g = np.floor(tdf['Gap(%)'].min()), np.ceil(tdf['Gap(%)'].max())
+    gap = _old_range(tdf, 'Gap(%)', min_g, max_g, 0.5, 'GapRange')
+    tdf['VWAP_Diff'] = (tdf['In'] - tdf['EntryVWAP']) / tdf['EntryVWAP'] * 100
+    min_v, max_v = np.floor(tdf['VWAP_Diff'].min() * 2) / 2, np.ceil(tdf['VWAP_Diff'].max() * 2) / 2
+    vwap = _old_range(tdf, 'VWAP_Diff', min_v, max_v, 0.2, 'VwapRange')
+    tdf['TimeRange'] = tdf['Entry'].apply(lambda dt: f"{dt.strftime('%H:%M')}～{(dt + timedelta(minutes=5)).strftime('%H:%M')}")
+    time = tdf.groupby('TimeRange').agg(Count=('PnL', 'count'), WinRate=('PnL', lambda x: (x > 0).mean()), AvgPnL=('PnL', 'mean')).reset_index()
+    time['Label'] = time['TimeRange']
+    pattern = tdf.groupby('Pattern', observed=True).agg(Count=('PnL', 'count'), WinRate=('PnL', lambda x: (x > 0).mean()), AvgPnL=('PnL', 'mean')).reset_index()
+    pattern['Label'] = pattern['Pattern']
+    return {'gap_range': gap, 'vwap_range': vwap, 'time': time, 'pattern': pattern}
+
+
+def test_tables_match_per_ticker_pd_cut(res_df):
+    ana = compute_analytics(res_df)
+    assert ana['tickers'] == list(res_df['Ticker'].unique())
+    for t in ana['tickers']:
+        old = _old_tables(res_df[res_df['Ticker'] == t])
+        for name, tbl in old.items():
+            pd.testing.assert_frame_equal(display_table(ana['by_ticker'][t][name], '区分'), display_table(tbl, '区分'), obj=f'{t} {name}')
+        # 勝ちパターン: 勝率が最も高い区分 (同率なら先頭)
+        best = ana['by_ticker'][t]['best']
+        g, v, tm = (old[k].loc[old[k]['WinRate'].idxmax()] for k in ('gap_range', 'vwap_range', 'time'))
+        assert (best['gap_left'], best['gap_right'], best['gap_win']) == pytest.approx((g['GapRange'].left, g['GapRange'].right, g['WinRate']))
+        assert (best['vwap_left'], best['vwap_right'], best['vwap_win']) == pytest.approx((v['VwapRange'].left, v['VwapRange'].right, v['WinRate']))
+        assert (best['time'], best['time_win']) == (tm['Label'], tm['WinRate'])
+
+
+def test_overall_and_summary(res_df):
+    ana = compute_analytics(res_df)
+    pnl = res_df['PnL']
+    ov = ana['overall']
+    assert ov['count'] == len(res_df) and ov['win_rate'] == pytest.approx((pnl > 0).mean())
+    assert ov['pf'] == pytest.approx(pnl[pnl > 0].sum() / abs(pnl[pnl <= 0].sum()))
+    assert ov['expectancy'] == pytest.approx(pnl.mean())
+    s = ana['summary']
+    assert list(s.index) == ana['tickers']
+    for t, tdf in res_df.groupby('Ticker', sort=False):
+        wins, losses = tdf[tdf['PnL'] > 0]['PnL'], tdf[tdf['PnL'] <= 0]['PnL']
+        row = s.loc[t]
+        assert row['回数'] == len(tdf) and row['勝率'] == pytest.approx(len(wins) / len(tdf))
+        assert row['利益平均'] == pytest.approx(wins.mean() if len(wins) else 0)
+        assert row['損失平均'] == pytest.approx(losses.mean() if len(losses) else 0)
+        assert row['PF'] == pytest.approx(wins.sum() / abs(losses.sum()) if len(losses) and losses.sum() else np.inf)
+        assert row['期待値'] == pytest.approx(tdf['PnL'].mean())
+
+
+def test_empty_frame():
+    ana = compute_analytics(pd.DataFrame())
+    assert ana['tickers'] == [] and ana['overall'] is None and ana['by_ticker'] == {}
+
+
+def test_fingerprint_follows_contents(res_df):
+    fp = frame_fingerprint(res_df)
+    assert frame_fingerprint(res_df.copy()) == fp
+    changed = res_df.copy(); changed.loc[0, 'PnL'] += 1e-9
+    assert frame_fingerprint(changed) != fp
+    assert frame_fingerprint(res_df.rename(columns={'PnL': 'pnl'})) != fp
@@ -0,0 +1,34 @@
+import os
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from benchmark import make_synthetic_universe
+from market_data import build_daily_stats_maps
+from result_store import TRADE_FLOAT32_COLS, SessionResults
+
+# 結果タブは選択中のタブの中身だけを作ること (ネットワークなし。保存済みの結果セットから表示する)
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+@pytest.fixture(scope='module')
+def results():
+    params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05)
+    frames = [run_ticker_simulation(t, i, *build_daily_stats_maps(d.copy()), params).to_frame()
+              for t, (i, d) in make_synthetic_universe(3, 10, seed=5).items()]
+    res = SessionResults(); res.put('res_df', pd.concat(frames, ignore_index=True), TRADE_FLOAT32_COLS)
+    return res
+
+
+@pytest.mark.parametrize('selected', [0, 1, 5])
+def test_only_selected_tab_renders(results, selected):
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.session_state['results'] = results
+    at.run()
+    labels = [t.label for t in at.tabs]
+    if selected:
+        at.session_state['result_tab'] = labels[selected]; at.run()
+    assert not at.exception
+    filled = [i for i, t in enumerate(at.tabs) if len(t.children)]
+    assert filled == [selected]
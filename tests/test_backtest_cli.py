@@ -0,0 +1,64 @@
+import json
+import os
+import pandas as pd
+import pytest
+import market_data
+import backtest_cli
+from bar_store import ParquetBarStore
+from benchmark import make_synthetic_universe
+from providers import LocalFileProvider
+
+# コマンドライン版を保存済みのファイル (過去の期間) に対して実行し、出力が空でないこと (ネットワークなし)
+
+PARAMS = {"end_t": "10:30", "g_min": -0.05, "g_max": 0.05, "p_min": 0, "p_max": 100000, "days": 30}
+
+
+@pytest.fixture
+def archive(monkeypatch, tmp_path):
+    root = str(tmp_path / "archive")
+    universe = make_synthetic_universe(5, 25, seed=4)
+    for t, (intraday, daily) in universe.items(): LocalFileProvider(root).save(t, intraday, daily)
+    monkeypatch.setattr(market_data, "PROVIDER", market_data.PROVIDER)   # --provider の切り替えをテストの後で戻す
+    monkeypatch.setattr(market_data, "BAR_STORE", ParquetBarStore(str(tmp_path / "store")))
+    with open(tmp_path / "params.json", "w", encoding="utf-8") as f: json.dump(PARAMS, f)
+    last = next(iter(universe.values()))[0].index[-1].strftime('%Y-%m-%d')
+    base = ["--provider", f"local:{root}", "--params", str(tmp_path / "params.json"), "--tickers", ",".join(universe), "--out", str(tmp_path / "out")]
+    return base, last, str(tmp_path / "out")
+
+
+def _run(capsys, argv):
+    assert backtest_cli.main(argv) == 0
+    return [line for line in capsys.readouterr().out.splitlines() if line]
+
+
+@pytest.mark.parametrize('command, extra, outputs', [
+    ('backtest', ['--trade-log'], ['trades.csv', 'summary.csv', 'trade_log.txt']),
+    ('rank', ['--resamples', '100'], ['trades.csv', 'ranking.csv']),
+    ('rank', ['--engine', 'panel', '--resamples', '0', '--format', 'parquet'], ['trades.parquet', 'ranking.parquet']),
+    ('surface', [], ['surface.csv']),
+])
+def test_commands_write_non_empty_outputs(archive, capsys, command, extra, outputs):
+    base, last, out = archive
+    paths = _run(capsys, [command, *base, "--end", last, *extra])
+    assert [os.path.basename(p) for p in paths] == outputs
+    for p in paths:
+        if p.endswith('.txt'):
+            with open(p, encoding="utf-8") as f: assert f.read().strip()
+        else: assert len(pd.read_parquet(p) if p.endswith('.parquet') else pd.read_csv(p)) > 0
+    if command == 'surface': assert (pd.read_csv(paths[0])['回数'] > 0).any()
+
+
+def test_live_replay_writes_signals(archive, capsys):
+    base, last, out = archive
+    paths = _run(capsys, ["live", *base, "--replay-date", last])
+    assert [os.path.basename(p) for p in paths[-1:]] == ['live_trades.csv']
+    signals = [line for line in paths[:-1] if ' entry ' in line or ' exit ' in line]
+    assert signals and len(pd.read_csv(paths[-1])) > 0
+
+
+def test_start_and_end_select_the_period(archive, capsys):
+    base, last, out = archive
+    _run(capsys, ["backtest", *base, "--start", "2026-02-16", "--end", "2026-02-20"])
+    entries = pd.to_datetime(pd.read_csv(os.path.join(out, "trades.csv"))['Entry'], utc=True).dt.tz_convert('Asia/Tokyo')
+    assert len(entries) and entries.dt.strftime('%Y-%m-%d').between('2026-02-16', '2026-02-20').all()
+    with pytest.raises(SystemExit): backtest_cli.main(["backtest", *base, "--start", "2026-02-20", "--end", "2026-02-16"])
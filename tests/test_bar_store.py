@@ -0,0 +1,91 @@
+import os
+from datetime import datetime
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import market_data
+from bar_store import ParquetBarStore
+from benchmark import make_synthetic_ticker
+from providers import LocalFileProvider
+
+# 5分足の永続ストア: 保存済みの範囲より広い期間を求められたら、古い足を取り直して併合すること
+
+
+class StoringFileProvider(LocalFileProvider):
+    """ローカルファイルを永続ストア経由で返す提供元。5分足の取得期間を記録する。"""
+    name = "storing-file"
+    persist_bars = True
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.intraday_calls = []
+
+    def intraday(self, ticker, start, end):
+        self.intraday_calls.append((ticker, start)); return super().intraday(ticker, start, end)
+
+
+END = datetime(2026, 3, 31)
+
+
+@pytest.fixture
+def provider(monkeypatch, tmp_path):
+    root = str(tmp_path / "archive")
+    intraday, daily = make_synthetic_ticker(40, seed=7)
+    LocalFileProvider(root).save("9000.T", intraday, daily)
+    prov = StoringFileProvider(root)
+    monkeypatch.setattr(market_data, "PROVIDER", prov)
+    monkeypatch.setattr(market_data, "BAR_STORE", ParquetBarStore(str(tmp_path / "store")))
+    return prov, intraday
+
+
+def _days(bars):
+    return bars.index.normalize().unique()
+
+
+def test_wider_request_backfills_older_bars(provider):
+    prov, intraday = provider
+    days = intraday.index.normalize().unique()
+    narrow = days[-10].tz_localize(None).to_pydatetime()
+    wide = days[0].tz_localize(None).to_pydatetime()
+    assert len(_days(market_data.fetch_intraday("9000.T", narrow, END))) == 10
+    bars = market_data.fetch_intraday("9000.T", wide, END)
+    assert len(bars) == len(intraday) and len(_days(bars)) == len(days)
+    assert prov.intraday_calls == [("9000.T", narrow), ("9000.T", wide)]
+    # 保存済みの範囲に収まる期間なら、最終足の日からの差分だけを取得する
+    again = market_data.fetch_intraday("9000.T", wide, END)
+    assert len(again) == len(intraday)
+    assert prov.intraday_calls[-1] == ("9000.T", days[-1].tz_localize(None).to_pydatetime())
+
+
+def test_store_first_and_last_timestamp(tmp_path):
+    store = ParquetBarStore(str(tmp_path))
+    assert store.first_timestamp("9000.T") is None and store.last_timestamp("9000.T") is None
+    intraday, _ = make_synthetic_ticker(5, seed=1)
+    store.write("9000.T", intraday)
+    assert store.first_timestamp("9000.T") == intraday.index[0] and store.last_timestamp("9000.T") == intraday.index[-1]
+    pd.testing.assert_frame_equal(store.read("9000.T"), intraday[store.read("9000.T").columns], check_freq=False)
+
+
+def test_read_sub_range_of_compacted_month(monkeypatch, tmp_path):
+    store = ParquetBarStore(str(tmp_path))
+    intraday, _ = make_synthetic_ticker(40, seed=2)
+    store.write("9000.T", intraday)
+    assert store.compact("9000.T", today=datetime(2026, 12, 1)) > 0
+    days = intraday.index.normalize().unique()
+    s, e = days[20], days[23]
+    path = next(p for first, last, p in store._partitions("9000.T") if first <= s.date() <= last)
+    assert os.path.basename(path).startswith("month=")
+    meta = pq.ParquetFile(path).metadata
+    assert meta.num_row_groups > 1
+    calls = []
+    read_parquet = pd.read_parquet
+    monkeypatch.setattr(pd, "read_parquet", lambda p, **kw: calls.append(kw.get('filters')) or read_parquet(p, **kw))
+    got = store.read("9000.T", s.to_pydatetime(), e.to_pydatetime())
+    expected = intraday[(intraday.index >= s) & (intraday.index < e + pd.Timedelta(days=1))]
+    pd.testing.assert_frame_equal(got, expected[got.columns], check_freq=False)
+    # 範囲の時刻 (UTC) で絞り込み、範囲にかからない行グループは読まない
+    (lo, hi), = {tuple(v for _, _, v in f) for f in calls}
+    assert lo == s.tz_convert('UTC') and hi == (e + pd.Timedelta(days=1)).tz_convert('UTC')
+    ts = meta.schema.to_arrow_schema().get_field_index("Datetime")
+    stats = [meta.row_group(i).column(ts).statistics for i in range(meta.num_row_groups)]
+    assert sum(st.max >= lo and st.min < hi for st in stats) < meta.num_row_groups
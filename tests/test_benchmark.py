@@ -0,0 +1,36 @@
+import copy
+import pandas as pd
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from bars import ingest_bars
+from benchmark import STAGES, check_regression, make_synthetic_universe, run_benchmark, run_pipeline
+from indicator_cache import INDICATOR_CACHE
+from market_data import build_daily_stats_maps
+from trade_buffer import TradeBuffer
+
+# ベンチマーク: 計測する経路が本番 (Bars 入力) と同じ結果になること、回帰の判定が遅くなった段階だけを挙げること
+
+PARAMS = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05)
+
+
+def test_pipeline_matches_production_path():
+    universe = make_synthetic_universe(3, 10, seed=2)
+    res = run_pipeline(universe, PARAMS, dict.fromkeys(STAGES, 0.0))
+    INDICATOR_CACHE.clear()
+    expected = TradeBuffer.concat([run_ticker_simulation(t, ingest_bars(i), *build_daily_stats_maps(d.copy()), PARAMS)
+                                   for t, (i, d) in universe.items()]).to_frame()
+    assert len(res) > 0
+    pd.testing.assert_frame_equal(res, expected, check_exact=True)
+
+
+def test_check_regression_flags_slowdown_only():
+    result = run_benchmark(2, 5, repeat=1)
+    assert list(result['stages']) == STAGES and result['config']['trades'] > 0
+    assert check_regression(result, result) == []   # 基準が変わらなければ何も挙げない
+    slower = copy.deepcopy(result)
+    slower['stages']['indicators']['median'] = result['stages']['indicators']['median'] * 2 + 0.05
+    assert check_regression(slower, result) == [('indicators', result['stages']['indicators']['median'], slower['stages']['indicators']['median'])]
+    # 割合では遅くても差が min_abs 未満なら計測誤差として無視し、基準にない段階は比べない
+    tiny = {'stages': {'report': {'median': 0.001}, 'new_stage': {'median': 1.0}}}
+    base = {'stages': {'report': {'median': 0.0005}}}
+    assert check_regression(tiny, base) == []
+    assert check_regression(tiny, base, min_abs=0) == [('report', 0.0005, 0.001)]
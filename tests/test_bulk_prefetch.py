@@ -0,0 +1,99 @@
+from datetime import datetime
+import pandas as pd
+import pytest
+import market_data
+from bar_store import ParquetBarStore
+from backtest_engine import DEFAULT_PARAMS
+from benchmark import make_synthetic_universe
+from providers import LocalFileProvider
+from ranking import scan_ranking, load_bars
+
+# 一括取得 (bulk_prefetch) をネットワークなしで確認する: ローカルファイルの提供元に bulk() を足した偽の転送で缶詰のフレームを返す
+
+
+class BulkFileProvider(LocalFileProvider):
+    """ローカルファイルを yfinance.download(group_by='ticker') と同じ MultiIndex 列のフレームで返す提供元。銘柄ごとの取得回数を数える。"""
+    name = "bulk-file"
+    supports_bulk = True
+
+    def __init__(self, root, persist_bars=False):
+        super().__init__(root)
+        self.persist_bars = persist_bars
+        self.single_calls = []; self.bulk_calls = []
+
+    def intraday(self, ticker, start, end):
+        self.single_calls.append((ticker, "5m")); return super().intraday(ticker, start, end)
+
+    def daily(self, ticker, start, end):
+        self.single_calls.append((ticker, "1d")); return super().daily(ticker, start, end)
+
+    def bulk(self, tickers, start, end, interval):
+        self.bulk_calls.append((tuple(tickers), start, end, interval))
+        return pd.concat({t: self._read(t, start, end, interval) for t in tickers}, axis=1)
+
+
+START, END = datetime(2026, 1, 5), datetime(2026, 3, 31)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    root = str(tmp_path / "archive")
+    saver = LocalFileProvider(root)
+    universe = make_synthetic_universe(7, 30, seed=5)
+    for t, (intraday, daily) in universe.items(): saver.save(t, intraday, daily)
+    return root, list(universe)
+
+
+@pytest.fixture
+def use_provider(monkeypatch, tmp_path):
+    monkeypatch.setattr(market_data, "BAR_STORE", ParquetBarStore(str(tmp_path / "store")))
+    def use(provider):
+        monkeypatch.setattr(market_data, "PROVIDER", provider)
+        return provider
+    return use
+
+
+def test_bulk_prefetch_counts_and_keys(archive, use_provider):
+    root, tickers = archive
+    prov = use_provider(BulkFileProvider(root))
+    prefetch, stats = market_data.bulk_prefetch(tickers, START, END, chunk_size=3)
+    assert stats['requests'] == 6 and stats['errors'] == 0   # 3 チャンク × (5分足, 日足)
+    assert stats['tickers'] == len(tickers) and stats['bytes'] > 0
+    assert len(prov.bulk_calls) == 6 and len(prefetch) == 2 * len(tickers)
+    # 期間の違う呼び出しには渡さない
+    t = tickers[0]
+    assert prefetch.pop(t, "1d", datetime(2026, 2, 1)) is None
+    other = market_data.fetch_daily_bars(t, datetime(2026, 2, 1), _prefetch=prefetch)
+    assert prov.single_calls == [(t, "1d")] and other.index[0] >= pd.Timestamp("2025-12-03", tz="Asia/Tokyo")
+    # 同じ期間なら一括取得分を使い、取り出すと消える
+    df = market_data.fetch_daily_bars(t, START, _prefetch=prefetch)
+    pd.testing.assert_frame_equal(df, LocalFileProvider(root).daily(t, START - pd.Timedelta(days=60), datetime.now()))
+    bars = market_data.fetch_intraday(t, START, END, _prefetch=prefetch)
+    assert len(bars) == 30 * 60 and prov.single_calls == [(t, "1d")]
+    assert prefetch.pop(t, "5m", START, END) is None and len(prefetch) == 2 * len(tickers) - 2
+    prefetch.clear(); assert len(prefetch) == 0
+
+
+def test_failed_chunk_is_counted(archive, use_provider):
+    root, tickers = archive
+    use_provider(BulkFileProvider(root))
+    def transport(chunk, s, e, interval):
+        if tickers[0] in chunk: raise ConnectionError("boom")
+        return market_data.PROVIDER.bulk(chunk, s, e, interval)
+    prefetch, stats = market_data.bulk_prefetch(tickers, START, END, chunk_size=4, transport=transport)
+    assert stats['errors'] == 2 and stats['tickers'] == len(tickers) - 4
+    assert all(prefetch.pop(t, "1d", START) is None for t in tickers[:4])
+
+
+@pytest.mark.parametrize("persist", [False, True])
+def test_scan_with_bulk_matches_single_fetches(archive, use_provider, persist):
+    root, tickers = archive
+    params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05, p_min=0, p_max=1e9)
+    use_provider(LocalFileProvider(root))
+    expected, _ = scan_ranking(tickers, START, END, params, resamples=0)
+    prov = use_provider(BulkFileProvider(root, persist_bars=persist))
+    got, stats = scan_ranking(tickers, START, END, params, resamples=0)
+    pd.testing.assert_frame_equal(got, expected)
+    assert not expected.empty and prov.single_calls == [] and stats['tickers'] == len(tickers)
+    data = load_bars(tickers, START, END)
+    assert [t for t, _, _ in data] == tickers and prov.single_calls == []
@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from benchmark import make_synthetic_ticker
+from bars import ingest_bars
+from indicator_cache import IndicatorCache, IND_COLS, compute_indicators, normalize_bars
+from session_memo import SessionMemo
+
+# 複数スレッドから同時に使うキャッシュ (上限を超えて溜まらない・壊れないこと)
+
+
+def test_indicator_cache_concurrent_eviction():
+    frames = [make_synthetic_ticker(5, seed=i)[0] for i in range(12)]
+    one = int(compute_indicators(normalize_bars(frames[0])).memory_usage(deep=True).sum())
+    cache = IndicatorCache(max_bytes=4 * one)
+    def work(i):
+        df = frames[i % len(frames)]
+        ref = compute_indicators(normalize_bars(df))
+        if i % 2: pd.testing.assert_frame_equal(cache.get(f"{i % len(frames)}.T", ingest_bars(df)), ref[IND_COLS].reset_index(drop=True))
+        else: pd.testing.assert_frame_equal(cache.get(f"{i % len(frames)}.T", df), ref)
+    with ThreadPoolExecutor(8) as ex: list(ex.map(work, range(400)))
+    st = cache.stats()
+    assert st['hits'] + st['misses'] + st['extends'] == 400
+    assert st['bytes'] == sum(e[3] for e in cache._entries.values()) <= cache.max_bytes
+    assert set(cache._latest.values()) <= set(cache._entries)
+
+
+def test_session_memo_concurrent_lookup():
+    memo = SessionMemo(max_entries=50)
+    counts = {}
+    keys = np.random.default_rng(0).integers(0, 80, 4000)
+    def work(i):
+        k = int(keys[i])
+        assert memo.lookup(k, lambda: (k, k * 2) if k % 3 else None, counts) == ((k, k * 2) if k % 3 else None)
+    with ThreadPoolExecutor(8) as ex: list(ex.map(work, range(4000)))
+    st = memo.stats()
+    assert st['hits'] + st['misses'] == 4000 == counts.get('reused', 0) + counts['computed']
+    assert st['hits'] > 0
+    assert len(memo) <= 50
@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+import diagnostics
+from fetch_pipeline import run_pipeline
+
+# 診断の記録: 入れ子の段階・パイプラインのスレッドへの引き継ぎ・キャッシュのヒット / ミス・JSON Lines・サンプリングプロファイル
+
+
+def test_nested_stages_and_frames(tmp_path):
+    assert diagnostics.current() is None
+    with diagnostics.stage("unbound"): pass   # 記録先がなければ何もしない
+    with diagnostics.diagnosed("unit", directory=str(tmp_path)) as rec:
+        assert diagnostics.current() is rec
+        for t in ("9000.T", "9001.T"):
+            with diagnostics.stage("outer"):
+                with diagnostics.stage("inner", t): time.sleep(0.01)
+        diagnostics.add("manual", 0.5, "9001.T")
+    assert diagnostics.current() is None and rec.wall > 0
+    assert rec.stages["outer"][0] == rec.stages["inner"][0] == 2 and rec.stages["outer"][1] >= rec.stages["inner"][1] >= 0.02
+    assert "unbound" not in rec.stages
+    sf = rec.stage_frame()
+    assert list(sf['段階']) == ["manual", "outer", "inner"] and (sf['回数'] == [1, 2, 2]).all()
+    assert sf['ms/回'].iloc[0] == 500.0
+    tf = rec.ticker_frame()
+    assert list(tf['銘柄']) == ["9001.T", "9000.T"] and tf.loc[0, 'manual'] == 0.5 and tf.loc[1, 'manual'] == 0.0
+    assert (tf['合計'] == tf['inner'] + tf['manual']).all()
+
+
+def test_binding_carries_into_pipeline_threads():
+    def fetch(t):
+        with diagnostics.stage("fetch.inner", t): return threading.current_thread().name
+    def simulate(t, data):
+        with diagnostics.stage("simulate.inner", t): return (data, threading.current_thread().name)
+    items = [f"{9000 + i}.T" for i in range(6)]
+    rec = diagnostics.Recorder("pipeline")
+    with diagnostics.recording(rec):
+        results, _ = run_pipeline(items, fetch, simulate, concurrency=3)
+    assert all(f.startswith("fetch") and s.startswith("simulate") for f, s in results)
+    for k in ("fetch.inner", "simulate.inner", "pipeline.fetch", "pipeline.wait", "pipeline.compute"):
+        assert rec.stages[k][0] == len(items)
+    assert {t for t, k in rec.tickers if k == "fetch.inner"} == set(items)
+    # 記録先のない実行では取得・計算スレッドも記録しない
+    run_pipeline(items, fetch, simulate, concurrency=3)
+    assert rec.stages["fetch.inner"][0] == len(items)
+
+
+def _dict_memo(fn):
+    memo = {}
+    def wrapper(*args):
+        if args not in memo: memo[args] = fn(*args)
+        return memo[args]
+    return wrapper
+
+
+def test_counted_cache_reports_miss_then_hit():
+    calls = []
+    def square(x):
+        calls.append(x); return x * x
+    f = diagnostics.counted_cache("square", _dict_memo, square)
+    assert f(3) == 9   # 記録先がなくてもキャッシュは効く (この呼び出しは数えない)
+    rec = diagnostics.Recorder()
+    with diagnostics.recording(rec):
+        assert [f(3), f(4), f(4), f(3)] == [9, 16, 16, 9]
+    assert calls == [3, 4] and rec.cache == {"square": [3, 1]}
+    cf = rec.cache_frame()
+    assert cf.loc[0, 'ヒット率'] == 0.75
+
+
+def _busy(stop):
+    while not stop.is_set(): sum(range(1000))
+
+
+def test_jsonl_round_trip_and_profile(tmp_path):
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy, args=(stop,), name="busy_1")
+    with diagnostics.diagnosed("profiled", profile=True, directory=str(tmp_path)) as rec:
+        worker.start()
+        with diagnostics.stage("load", "9000.T"): time.sleep(0.1)
+        rec.count_cache("fetch", hit=True)
+        stop.set(); worker.join()
+    path = diagnostics.default_jsonl_path(str(tmp_path))
+    with open(path, encoding="utf-8") as f: rows = [json.loads(line) for line in f]
+    assert rows == rec.records()
+    assert [r['type'] for r in rows] == ['run', 'stage', 'ticker', 'cache', 'profile']
+    assert rows[0]['label'] == "profiled" and rows[1]['stage'] == "load" and rows[2]['ticker'] == "9000.T"
+    assert {r['run'] for r in rows} == {rec.run_id}
+    # folded 形式: "スレッド;呼び出し元;...;関数 回数" (スレッド番号は除く)
+    with open(rows[-1]['path'], encoding="utf-8") as f: folded = f.read()
+    assert folded == rec.profiler.folded() and rec.profiler.n_samples > 0
+    lines = [line.rsplit(" ", 1) for line in folded.splitlines()]
+    assert all(n.isdigit() for _, n in lines)
+    assert any(k.startswith("busy;") and k.endswith("test_diagnostics.py:_busy") for k, _ in lines)
+    # 2回目の実行は同じファイルに追記する
+    with diagnostics.diagnosed("again", directory=str(tmp_path)): pass
+    with open(path, encoding="utf-8") as f: assert len(f.readlines()) == len(rows) + 1
@@ -0,0 +1,68 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from benchmark import make_synthetic_ticker
+from market_data import build_daily_stats_maps
+from bars import ingest_bars
+
+# 配列エンジン (vector) と従来の iterrows ループ (loop) が同じトレードを出すことの確認
+
+
+def _extended(df):
+    """15:00 以降 (15:05～15:25) の足を足した5分足 (場中の絞り込みで落ちること)。"""
+    days = df.index.normalize().unique()
+    idx = (days.repeat(5) + pd.to_timedelta(np.tile([905, 910, 915, 920, 925], len(days)), unit='min'))
+    tail = pd.DataFrame({c: np.repeat(df[c].groupby(df.index.normalize()).last().to_numpy(), 5) for c in df.columns}, index=idx)
+    return pd.concat([df, tail]).sort_index().rename_axis(df.index.name)
+
+
+def _zero_volume(df):
+    """2日目の出来高をすべて 0 にした5分足 (VWAP が NaN になる日)。"""
+    df = df.copy(); days = df.index.normalize()
+    df.loc[days == days.unique()[1], 'Volume'] = 0.0
+    return df
+
+
+CASES = {
+    'plain': lambda: make_synthetic_ticker(15, seed=1),
+    'nan_bars': lambda: make_synthetic_ticker(15, seed=2, nan_rate=0.05),
+    'extended_1525': lambda: (lambda i, d: (_extended(i), d))(*make_synthetic_ticker(15, seed=3)),
+    'zero_volume': lambda: (lambda i, d: (_zero_volume(i), d))(*make_synthetic_ticker(15, seed=4)),
+}
+
+# エントリー条件 4つ × ATR 損切りの有無 (ギャップの範囲はトレードが出るように広げる)
+FLAGS = list(itertools.product([False, True], repeat=5))
+
+# 決済ルール (ts_start, ts_width, sl_fix): 既定値 / 同じ足で建値・損切り・トレーリングが重なる狭い幅 / 大引けまで持ち越す広い幅 / 開始より広いトレーリング幅
+EXITS = {
+    'default': (0.005, 0.002, -0.005),
+    'tight': (0.001, 0.001, -0.001),
+    'wide': (0.03, 0.01, -0.03),
+    'wide_trail': (0.002, 0.008, -0.004),
+}
+
+
+def _params(u_vwap, u_ema, u_rsi, u_macd, u_atr, exits=EXITS['default']):
+    ts_start, ts_width, sl_fix = exits
+    return dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05, u_vwap=u_vwap, u_ema=u_ema, u_rsi=u_rsi, u_macd=u_macd, u_atr=u_atr,
+                ts_start=ts_start, ts_width=ts_width, sl_fix=sl_fix)
+
+
+@pytest.mark.parametrize('exits', sorted(EXITS))
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_vector_matches_loop(case, exits):
+    intraday, daily = CASES[case]()
+    maps = build_daily_stats_maps(daily.copy())
+    n_trades = 0
+    for flags in FLAGS:
+        params = _params(*flags, exits=EXITS[exits])
+        loop = run_ticker_simulation('9000.T', intraday, *maps, params, engine='loop').to_frame()
+        vec = run_ticker_simulation('9000.T', intraday, *maps, params, engine='vector').to_frame()
+        pd.testing.assert_frame_equal(vec, loop, check_exact=True, obj=f'{case} {exits} {flags}')
+        # 取り込み済みの Bars でも同じ
+        vec_b = run_ticker_simulation('9000.T', ingest_bars(intraday), *maps, params, engine='vector').to_frame()
+        pd.testing.assert_frame_equal(vec_b, loop, check_exact=True, obj=f'{case} {exits} {flags} (Bars)')
+        n_trades += len(loop)
+    assert n_trades > 0
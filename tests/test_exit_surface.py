@@ -0,0 +1,39 @@
+import pytest
+from backtest_engine import DEFAULT_PARAMS
+from benchmark import make_synthetic_universe
+from market_data import build_daily_stats_maps
+from exit_surface import EXIT_KEYS, exit_surface, record_paths, surface_slice
+from direct import assert_metrics_match, direct_metrics
+
+# 記録したエントリー後の値動きから求めた応答曲面の各セルが、そのセルの決済パラメータで直接シミュレーションした結果と同じであることの確認
+
+GRID = {'ts_start': [0.002, 0.005, 0.01], 'ts_width': [0.001, 0.003], 'sl_fix': [-0.003, -0.008], 'atr_mul': [1.0, 2.0], 'atr_min': [0.002, 0.006]}
+
+
+@pytest.fixture(scope='module')
+def data():
+    return [(t, i, build_daily_stats_maps(d.copy())) for t, (i, d) in make_synthetic_universe(4, 15, seed=21).items()]
+
+
+@pytest.mark.parametrize('u_atr', [False, True])
+def test_surface_cells_match_direct_runs(data, u_atr):
+    params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05, u_rsi=False, u_atr=u_atr)
+    paths, off_grid = record_paths(data, params)
+    assert paths is not None and off_grid == []
+    surf = exit_surface(paths, GRID, u_atr)
+    n_stops = len(GRID['sl_fix']) * (len(GRID['atr_mul']) * len(GRID['atr_min']) if u_atr else 1)
+    assert len(surf) == len(GRID['ts_start']) * len(GRID['ts_width']) * n_stops and (surf['回数'] > 0).all()
+    for row in surf.to_dict('records'):
+        cell = {k: row[k] for k in EXIT_KEYS}
+        assert_metrics_match(row, direct_metrics(data, dict(params, **cell)), cell)
+    # スライスは固定した値の行だけ
+    sl = surface_slice(surf, {'sl_fix': -0.003})
+    assert len(sl) == len(surf) // len(GRID['sl_fix']) and (sl['sl_fix'] == -0.003).all()
+
+
+def test_no_entries_gives_empty_counts(data):
+    params = dict(DEFAULT_PARAMS, g_min=0.5, g_max=0.6)   # ギャップ範囲に入る日がない
+    paths, _ = record_paths(data, params)
+    assert paths is None
+    surf = exit_surface(paths, GRID)
+    assert (surf['回数'] == 0).all()
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from datetime import datetime
+import pandas as pd
+import pytest
+import market_data
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from bar_store import ParquetBarStore
+from benchmark import make_synthetic_universe
+from fake_provider import FakeProvider
+from fetch_pipeline import TokenBucket, run_pipeline, summarize_timings
+from providers import LocalFileProvider, ProviderError
+from ranking import run_backtest
+from trade_buffer import TradeBuffer
+
+# 取得とシミュレーションを重ねるパイプライン (fetch_pipeline.run_pipeline) をネットワークなしで確認する
+
+TICKERS = [f"{1000 + i}.T" for i in range(12)]
+START, END = datetime(2026, 1, 5), datetime(2026, 3, 31)
+PARAMS = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05)
+
+
+def test_results_in_input_order_and_bounded_concurrency():
+    fp = FakeProvider(latency=0.03, jitter=0.02, n_days=5)
+    done = []
+    out, timings = run_pipeline(TICKERS, lambda t: fp.fetch_intraday(t, None, None), lambda t, d: (t, len(d)), concurrency=3,
+                                on_result=lambda t, r: done.append(t))
+    assert out == [(t, 5 * 60) for t in TICKERS]
+    assert [t['item'] for t in timings] == TICKERS and sorted(done) == sorted(TICKERS)
+    assert fp.max_in_flight <= 3
+    s = summarize_timings(timings)
+    assert s['items'] == len(TICKERS) and s['fetch'] > 0 and s['compute'] > 0
+
+
+def test_should_stop_cancels_the_rest():
+    done = []
+    out, timings = run_pipeline(TICKERS, lambda t: time.sleep(0.01) or t, lambda t, d: d, concurrency=2,
+                                on_result=lambda t, r: done.append(t), should_stop=lambda: len(done) >= 3)
+    assert len(done) == 3
+    assert [r for r in out if r is not None] == [t for t in TICKERS if t in done]
+    assert len(timings) == len(TICKERS)
+
+
+def test_fetch_exception_propagates():
+    def fetch(t):
+        if t == TICKERS[4]: raise RuntimeError("boom")
+        return t
+    with pytest.raises(RuntimeError, match="boom"):
+        run_pipeline(TICKERS, fetch, lambda t, d: d, concurrency=3)
+
+
+def test_provider_errors_reported_not_raised():
+    fp = FakeProvider(latency=0.0, jitter=0.0, n_days=10, fail={TICKERS[1], TICKERS[5]})
+    timings, errors = [], []
+    df = run_backtest(TICKERS, START, END, PARAMS, fp.fetch_intraday, fp.fetch_daily_stats_maps, concurrency=4,
+                      timings_out=timings, errors_out=errors)
+    assert sorted(e.ticker for e in errors) == [TICKERS[1], TICKERS[5]] and all(isinstance(e, ProviderError) for e in errors)
+    assert len(timings) == len(TICKERS)   # 失敗した銘柄の時間も残す
+    assert not df.empty and not set(df['Ticker']) & {TICKERS[1], TICKERS[5]}
+
+
+def test_rate_limit():
+    fp = FakeProvider(latency=0.0, jitter=0.0, n_days=5)
+    run_pipeline(TICKERS[:8], lambda t: fp._request(t), lambda t, d: d, concurrency=8, rate=20, burst=2)
+    st = sorted(fp.starts)
+    assert st[-1] - st[0] >= (8 - 2) / 20 * 0.9   # burst 分を除いて 1/20 秒ごと
+
+
+def test_token_bucket_refill(monkeypatch):
+    now = [0.0]; slept = []
+    real_sleep = asyncio.sleep
+    async def fake_sleep(d):   # 時計を進めるだけ
+        slept.append(d); now[0] += d; await real_sleep(0)
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    async def run():
+        bucket = TokenBucket(rate=4, burst=2, clock=lambda: now[0])
+        for _ in range(2): await bucket.acquire()
+        assert bucket.tokens == 0 and slept == []
+        now[0] += 0.5   # 0.5 秒で 2 個補充
+        for _ in range(2): await bucket.acquire()
+        assert slept == []
+        await bucket.acquire()
+    asyncio.run(run())
+    assert slept == [pytest.approx(0.25)]
+
+
+def test_run_backtest_with_local_files(tmp_path, monkeypatch):
+    universe = make_synthetic_universe(5, 20, seed=3)
+    saver = LocalFileProvider(str(tmp_path / "archive"))
+    for t, (intraday, daily) in universe.items(): saver.save(t, intraday, daily)
+    monkeypatch.setattr(market_data, "PROVIDER", saver)
+    monkeypatch.setattr(market_data, "BAR_STORE", ParquetBarStore(str(tmp_path / "store")))
+    got = run_backtest(list(universe), START, END, PARAMS, concurrency=3, rate=50)
+    want = TradeBuffer.concat([run_ticker_simulation(t, intraday, *market_data.build_daily_stats_maps(daily.copy()), PARAMS)
+                               for t, (intraday, daily) in universe.items()]).to_frame()
+    assert not want.empty
+    pd.testing.assert_frame_equal(got, want)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+from bars import ingest_bars
+from benchmark import make_synthetic_ticker
+from indicator_cache import IndicatorCache, IND_COLS, compute_indicators, normalize_bars
+
+# 末尾に足が増えた・最終足が更新された場合の追加計算が、全体を計算し直した結果とビット単位で一致すること
+
+N_OLD = 300
+
+
+def _cases():
+    full, _ = make_synthetic_ticker(6, seed=21)
+    full = full.iloc[:N_OLD + 40].copy()
+    revised = full.copy(); revised.iloc[N_OLD - 1, revised.columns.get_loc('Close')] *= 1.01
+    gap = full.copy(); gap.iloc[N_OLD - 2:N_OLD + 2, gap.columns.get_loc('Close')] = np.nan
+    return {
+        'append': (full.iloc[:N_OLD], full),                  # 保存済みの足の後ろに追加
+        'revise_last': (full.iloc[:N_OLD], revised),           # 保存済みの最終足が更新された
+        'nan_junction': (gap.iloc[:N_OLD], gap),               # 境目の前後の終値が NaN
+    }
+
+
+@pytest.mark.parametrize('ingest', [False, True], ids=['frame', 'bars'])
+@pytest.mark.parametrize('case', ['append', 'revise_last', 'nan_junction'])
+def test_extend_matches_full_recompute(case, ingest):
+    old, new = _cases()[case]
+    wrap = ingest_bars if ingest else (lambda df: df.copy())
+    cache = IndicatorCache()
+    cache.get('9000.T', wrap(old))
+    got = cache.get('9000.T', wrap(new))
+    assert cache.stats()['extends'] == 1 and cache.stats()['entries'] == 1
+    ref = compute_indicators(normalize_bars(new.copy()))
+    if ingest: ref = ref[IND_COLS].reset_index(drop=True)
+    pd.testing.assert_frame_equal(got, ref, check_exact=True)
+    # 追加計算した版からさらに追加計算しても同じ
+    more, _ = make_synthetic_ticker(6, seed=21)
+    more = pd.concat([new, more.iloc[N_OLD + 40:N_OLD + 60]])
+    got = cache.get('9000.T', wrap(more))
+    assert cache.stats()['extends'] == 2
+    ref = compute_indicators(normalize_bars(more.copy()))
+    if ingest: ref = ref[IND_COLS].reset_index(drop=True)
+    pd.testing.assert_frame_equal(got, ref, check_exact=True)
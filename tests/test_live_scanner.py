@@ -0,0 +1,96 @@
+import itertools
+from datetime import time
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from benchmark import make_synthetic_ticker, run_live_benchmark
+from live_scanner import LiveScanner, ReplayFeed, TickerStream, run_feed
+from market_data import build_daily_stats_maps
+from providers import LocalFileProvider
+from trade_buffer import TradeBuffer
+
+# ライブのシグナル検出 (live_scanner) を保存済みの足の再生で確認する:
+# 再生で出たトレードがバックテストと一致すること、銘柄ごとの状態の大きさが履歴の長さによらないこと
+
+N_DAYS = 25
+GRID = [dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05, u_vwap=f[0], u_ema=f[1], u_rsi=f[2], u_macd=f[3], u_atr=f[0], end_t=time(10, 0))
+        for f in itertools.product([False, True], repeat=4)]
+GRID.append(dict(DEFAULT_PARAMS, ts_start=0.001, ts_width=0.001, start_t=time(9, 30), end_t=time(14, 0), g_min=-1, g_max=1,
+                 u_vwap=False, u_ema=False, u_rsi=False, u_macd=False))
+
+
+@pytest.fixture(scope="module")
+def recorded(tmp_path_factory):
+    """LocalFileProvider のアーカイブに保存して読み戻した5分足 (記録済みのセッション) と日足マップ。"""
+    prov = LocalFileProvider(str(tmp_path_factory.mktemp("archive")))
+    tickers = [f"{9000 + i}.T" for i in range(6)]
+    for i, t in enumerate(tickers):
+        prov.save(t, *make_synthetic_ticker(N_DAYS, seed=i, nan_rate=0.05 if i % 3 == 0 else 0.0))
+    return {t: (prov.intraday(t, None, None), build_daily_stats_maps(prov.daily(t, None, None))) for t in tickers}
+
+
+def _sorted(df, tickers):
+    order = {t: i for i, t in enumerate(tickers)}
+    df = df.iloc[np.lexsort((df['Entry'].to_numpy(), df['Ticker'].astype(str).map(order).to_numpy()))].reset_index(drop=True)
+    for c in ('Ticker', 'Reason', 'Pattern'): df[c] = df[c].astype(str)
+    return df
+
+
+@pytest.mark.parametrize("gi", range(len(GRID)))
+def test_replay_matches_backtest(recorded, gi):
+    params = GRID[gi]; tickers = list(recorded)
+    days = sorted(set(recorded[tickers[0]][0].index.normalize()))
+    k = [1, 5, 12, 20][gi % 4]
+    replay_day, last_hist = days[k], days[k - 1]
+    end = replay_day + pd.Timedelta(days=1)
+    scanner = LiveScanner(params)
+    for t, (df, maps) in recorded.items(): scanner.add(t, maps, df[df.index < replay_day])
+    n = run_feed(scanner, ReplayFeed({t: df[df.index < end] for t, (df, _) in recorded.items()}, start=replay_day.tz_localize(None)))
+    assert n == sum(((df.index >= replay_day) & (df.index < end)).sum() for df, _ in recorded.values())
+
+    # バックテストは同じ足 (再生した日まで) で計算し、warm_up で流した最後の履歴日以降のトレードを比べる
+    ref = TradeBuffer.concat([run_ticker_simulation(t, df[df.index < end], *maps, params) for t, (df, maps) in recorded.items()]).to_frame()
+    ref = _sorted(ref[ref['Entry'] >= last_hist], tickers)
+    got = _sorted(scanner.trades.to_frame(), tickers)
+    pd.testing.assert_frame_equal(got, ref, check_exact=True)
+    assert len(ref) > 0
+
+    # エントリーのシグナル = トレードのエントリー + 引けまで決済されなかった建玉
+    entries = sorted((sg['ticker'], sg['time']) for sg in scanner.signals if sg['kind'] == 'entry')
+    open_pos = [(t, s.pos['entry_ts']) for t, s in scanner.streams.items() if s.pos is not None]
+    assert entries == sorted(list(zip(ref['Ticker'], ref['Entry'])) + open_pos)
+    exits = [sg for sg in scanner.signals if sg['kind'] == 'exit']
+    assert [(sg['ticker'], sg['time'], sg['reason']) for sg in sorted(exits, key=lambda s: (tickers.index(s['ticker']), s['time']))] == \
+        list(zip(ref['Ticker'], ref['Exit'], ref['Reason']))
+
+
+def _footprint(stream):
+    """TickerStream が持つ値の個数 (入れ子の dict も数える)。足が増えても増えないこと。"""
+    def count(v): return sum(count(x) for x in v.values()) + len(v) if isinstance(v, dict) else len(v) if isinstance(v, (list, tuple, np.ndarray)) else 1
+    return count({k: v for k, v in vars(stream).items() if k not in ('pc_map', 'co_map', 'a_map', 'params')})
+
+
+def test_stream_state_is_fixed_size():
+    params = dict(DEFAULT_PARAMS, g_min=-1, g_max=1)
+    sizes = {}
+    for n_days in (5, 60, 200):
+        intraday, daily = make_synthetic_ticker(n_days + 2, seed=3)
+        days = intraday.index.normalize().unique()
+        s = TickerStream("9000.T", build_daily_stats_maps(daily.copy()), params)
+        s.warm_up(intraday[intraday.index < days[-2]])
+        seen = set()
+        for ts, r in intraday[intraday.index >= days[-2]].iterrows():
+            s.update(ts, r.Open, r.High, r.Low, r.Close, r.Volume)
+            seen.add(_footprint(s))
+        assert s.bars == len(intraday)
+        sizes[n_days] = seen
+    # 状態の大きさは建玉の有無でだけ変わり、履歴の長さには依存しない
+    assert sizes[5] == sizes[60] == sizes[200] and len(sizes[5]) <= 2
+
+
+def test_update_cost_does_not_grow_with_history():
+    # 計測の揺れを避けるため 3 回の最小値で比べ、倍率には余裕を持たせる
+    runs = [run_live_benchmark((5, 200), seed=1) for _ in range(3)]
+    short, long = min(r[5] for r in runs), min(r[200] for r in runs)
+    assert long < 4 * short
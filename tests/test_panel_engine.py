@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from bars import ingest_bars
+from benchmark import make_synthetic_ticker, make_synthetic_universe
+from market_data import build_daily_stats_maps
+from panel_engine import panel_from_data, simulate_universe
+
+# 銘柄 × 日 × 時間枠 のパネルで一括計算したトレードが、銘柄ごとの run_ticker_simulation と同じであることの確認
+
+PARAMS = {
+    'default': dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05),
+    'no_filters': dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05, u_vwap=False, u_ema=False, u_rsi=False, u_macd=False),
+    'fixed_stop': dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05, u_atr=False, ts_start=0.002, ts_width=0.001, sl_fix=-0.003),
+    'narrow_gap': dict(DEFAULT_PARAMS, g_min=-0.005, g_max=0.005, u_rsi=False),
+}
+
+
+def _universe():
+    universe = make_synthetic_universe(6, 15, seed=11)
+    universe['9100.T'] = make_synthetic_ticker(15, seed=12, nan_rate=0.05)   # 足の欠けた銘柄
+    intraday, daily = make_synthetic_ticker(15, seed=13)
+    universe['9101.T'] = (intraday[intraday.index.minute % 10 == 0], daily)   # 10分おきの足しかない銘柄
+    off = intraday.copy(); off.index = off.index + pd.Timedelta(minutes=2)
+    universe['9102.T'] = (off, daily)   # 5分刻みからずれた銘柄 (時間枠に乗らない)
+    return [(t, i, build_daily_stats_maps(d.copy())) for t, (i, d) in universe.items()]
+
+
+@pytest.mark.parametrize('ingest', [False, True], ids=['frame', 'bars'])
+@pytest.mark.parametrize('name', sorted(PARAMS))
+def test_panel_matches_per_ticker(name, ingest):
+    params = PARAMS[name]
+    data = [(t, ingest_bars(i) if ingest else i, maps) for t, i, maps in _universe()]
+    P, off_grid = panel_from_data(data)
+    assert off_grid == ['9102.T'] and P['tickers'] == [t for t, _, _ in data if t != '9102.T']
+    got = simulate_universe(data, params)
+    assert list(got) == [t for t, _, _ in data]
+    n_trades = 0
+    for t, intraday, maps in data:
+        expected = run_ticker_simulation(t, intraday, *maps, params).to_frame()
+        pd.testing.assert_frame_equal(got[t].to_frame(), expected, check_exact=True, obj=f'{name} {t}')
+        n_trades += len(expected)
+    assert n_trades > 0
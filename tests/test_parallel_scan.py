@@ -0,0 +1,113 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import market_data
+import parallel_scan
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from bar_store import ParquetBarStore
+from benchmark import make_synthetic_ticker, make_synthetic_universe
+from market_data import build_daily_stats_maps
+from bars import ingest_bars
+from indicator_cache import IndicatorCache, IND_COLS
+from parallel_scan import pack_frames, parallel_simulate, parallel_chunks
+from providers import LocalFileProvider
+from ranking import scan_ranking
+from sweep import ACC_KEYS, grid_from_spec, sweep_stats
+from trade_buffer import TradeBuffer
+
+# プロセス並列 (共有メモリに置いた Bars の配列) が1プロセスで計算した結果と一致すること、プロセスプールをスキャンをまたいで使い回すこと
+
+
+def _jobs(n=5, days=12):
+    jobs = []
+    for i in range(n):
+        intraday, daily = make_synthetic_ticker(days, seed=i, nan_rate=0.05 if i % 2 else 0.0)
+        jobs.append((f"{9000 + i}.T", intraday if i == 0 else ingest_bars(intraday), build_daily_stats_maps(daily.copy())))
+    return jobs
+
+
+def test_pack_frames_keeps_compact_arrays():
+    jobs = _jobs(3)
+    shm, places = pack_frames({t: df for t, df, _ in jobs})
+    try:
+        for t, df, _ in jobs:
+            layout, meta = places[t]
+            for name, a in ingest_bars(df).arrays().items():
+                off, dtype, shape = layout[name]
+                assert off % 8 == 0 and dtype == a.dtype.str and shape == a.shape
+                assert np.array_equal(np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off), a, equal_nan=True)
+            assert meta['digest'] == ingest_bars(df).digest
+    finally:
+        shm.close(); shm.unlink()
+
+
+def test_parallel_simulate_matches_sequential():
+    jobs = _jobs(); params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05)
+    ref = TradeBuffer.concat([run_ticker_simulation(t, df, *maps, params) for t, df, maps in jobs]).to_frame()
+    got = dict(parallel_simulate(jobs, params, workers=2))
+    got = TradeBuffer.concat([got[t] for t, _, _ in jobs]).to_frame()
+    assert len(ref)
+    pd.testing.assert_frame_equal(got, ref, check_exact=True)
+
+
+def test_parallel_chunks_matches_sequential():
+    jobs = _jobs(); grid = grid_from_spec({'g_min': [-0.05], 'g_max': [0.05], 'ts_start': [0.003, 0.005], 'masks': 'all'}, DEFAULT_PARAMS)
+    ref = sweep_stats(jobs, grid, DEFAULT_PARAMS)
+    acc = None
+    for part in parallel_chunks(jobs, sweep_stats, (grid, DEFAULT_PARAMS), workers=2):
+        acc = part if acc is None else {k: acc[k] + part[k] for k in ACC_KEYS}
+    for k in ACC_KEYS: np.testing.assert_allclose(acc[k], ref[k], rtol=1e-12)
+
+
+def test_cache_keeps_indicator_columns_only():
+    cache = IndicatorCache()
+    intraday, _ = make_synthetic_ticker(8, seed=3)
+    ind = cache.get('9003.T', ingest_bars(intraday))
+    assert list(ind.columns) == IND_COLS and isinstance(ind.index, pd.RangeIndex)
+    full = cache.get('9003.T', intraday)   # DataFrame で渡しても同じエントリー (足の列は保存しない)
+    assert cache.stats()['entries'] == 1 and cache.stats()['hits'] == 1
+    pd.testing.assert_frame_equal(full[IND_COLS].reset_index(drop=True), ind)
+    assert all(list(e[0].columns) == IND_COLS for e in cache._entries.values())
+
+
+def test_pool_is_reused_across_scans():
+    jobs = _jobs(3); params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05, ts_start=0.0045)   # ほかのテストとメモを共有しない値
+    parallel_scan.shutdown_pool()
+    first, second = {}, {}
+    a = dict(parallel_simulate(jobs, params, workers=1, memo_counts=first))
+    pool = parallel_scan.get_pool(1)
+    b = dict(parallel_simulate(jobs, params, workers=1, memo_counts=second))
+    assert parallel_scan.get_pool(1) is pool   # 同じワーカー数なら作り直さない
+    # ワーカーが1つなら、2回目のスキャンは1回目に計算した日をすべて再利用する
+    assert first.get('computed', 0) > 0 and second == {'reused': first['computed']}
+    for t, _, _ in jobs: pd.testing.assert_frame_equal(a[t].to_frame(), b[t].to_frame(), check_exact=True)
+    assert parallel_scan.get_pool(2) is not pool
+    parallel_scan.shutdown_pool()
+
+
+def test_closing_a_scan_early_keeps_the_pool_usable():
+    jobs = _jobs(); params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05)
+    sims = parallel_simulate(jobs, params, workers=2)
+    next(sims); sims.close()   # 中止: 共有メモリを解放してもプールは次のスキャンで使える
+    got = dict(parallel_simulate(jobs, params, workers=2))
+    assert sorted(got) == sorted(t for t, _, _ in jobs)
+
+
+def test_process_pool_scan_matches_sequential_order(monkeypatch, tmp_path):
+    root = str(tmp_path / "archive")
+    universe = make_synthetic_universe(6, 12, seed=6)
+    for t, (intraday, daily) in universe.items(): LocalFileProvider(root).save(t, intraday, daily)
+    monkeypatch.setattr(market_data, "PROVIDER", LocalFileProvider(root))
+    monkeypatch.setattr(market_data, "BAR_STORE", ParquetBarStore(str(tmp_path / "store")))
+    start = next(iter(universe.values()))[0].index[0].tz_localize(None).normalize().to_pydatetime()
+    params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05, p_min=0, p_max=100_000)
+    tickers = list(universe)[::-1]   # 完了順ではなく渡した銘柄の順に並ぶこと
+    runs = {}
+    for workers in (1, 2):
+        trades = []
+        rank_df, _ = scan_ranking(tickers, start, datetime(2026, 3, 31), params, workers=workers, trades_out=trades, resamples=100)
+        runs[workers] = rank_df, TradeBuffer.concat(trades).to_frame()
+    assert len(runs[1][0]) >= 3
+    pd.testing.assert_frame_equal(runs[2][0], runs[1][0], check_exact=True)
+    pd.testing.assert_frame_equal(runs[2][1], runs[1][1], check_exact=True)
+    assert list(pd.unique(runs[2][1]['Ticker'].astype(str))) == [t for t in tickers if t in set(runs[1][1]['Ticker'].astype(str))]
@@ -0,0 +1,78 @@
+from datetime import datetime
+import pandas as pd
+import pytest
+import market_data
+from bar_store import ParquetBarStore
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from benchmark import make_synthetic_ticker
+from providers import LocalFileProvider
+from ranking import daily_prefilter, scan_ranking
+
+# 日足の事前選別: 除外した銘柄・日の数え方と、選別してもトレードの出る日は落とさないこと (選別なしで全銘柄を計算した結果と同じ)
+
+PARAMS = dict(DEFAULT_PARAMS, g_min=-0.01, g_max=0.005, u_rsi=False)
+END = datetime(2026, 3, 31)
+
+
+def _no_gap_days(intraday, daily):
+    """どの日も前日終値から 5% 上で寄り付く日足 (期間内にギャップ範囲内の日がない銘柄)。"""
+    daily = daily.copy(); daily['Open'] = daily['Close'].shift(1).fillna(daily['Open']) * 1.05
+    return intraday, daily
+
+
+UNIVERSE = {
+    '9000.T': lambda: make_synthetic_ticker(20, seed=1, price=1500),
+    '9001.T': lambda: make_synthetic_ticker(20, seed=2, price=200),      # 株価範囲より安い
+    '9002.T': lambda: make_synthetic_ticker(20, seed=3, price=3000),
+    '9003.T': lambda: _no_gap_days(*make_synthetic_ticker(20, seed=4, price=2500)),
+    '9004.T': lambda: make_synthetic_ticker(20, seed=5, price=30000),    # 株価範囲より高い
+    '9005.T': lambda: make_synthetic_ticker(20, seed=6, price=800),
+}
+
+
+@pytest.fixture
+def universe(monkeypatch, tmp_path):
+    root = str(tmp_path / "archive"); data = {}
+    for t, make in UNIVERSE.items():
+        data[t] = make(); LocalFileProvider(root).save(t, *data[t])
+    monkeypatch.setattr(market_data, "PROVIDER", LocalFileProvider(root))
+    monkeypatch.setattr(market_data, "BAR_STORE", ParquetBarStore(str(tmp_path / "store")))
+    start = data['9000.T'][0].index[0].tz_localize(None).normalize().to_pydatetime()
+    return data, start
+
+
+def _unfiltered(tickers, start, params):
+    """選別なし: 全銘柄の5分足を取得し、最新の5分足の株価だけで絞ってシミュレーションする (事前選別の導入前のスキャン)。"""
+    out = {}
+    for t in tickers:
+        bars = market_data.fetch_intraday(t, start, END)
+        if bars.empty or not params['p_min'] <= bars['Close'].iloc[-1] <= params['p_max']: continue
+        out[t] = run_ticker_simulation(t, bars, *market_data.fetch_daily_stats_maps(t, start), params)
+    return out
+
+
+def test_prefilter_keeps_every_traded_session(universe):
+    data, start = universe
+    tickers = list(UNIVERSE)
+    trades = []
+    ranked, stats = scan_ranking(tickers, start, END, PARAMS, trades_out=trades, resamples=0)
+    expected = {t: buf for t, buf in _unfiltered(tickers, start, PARAMS).items() if len(buf)}
+    got = {buf.to_frame()['Ticker'].iloc[0]: buf for buf in trades if len(buf)}
+    assert sorted(got) == sorted(expected) and len(expected) >= 2
+    for t in expected: pd.testing.assert_frame_equal(got[t].to_frame(), expected[t].to_frame(), obj=t)
+    assert list(ranked['銘柄コード']) == sorted(expected, key=lambda t: -expected[t].summary()['期待値'])
+    # 除外の内訳
+    assert (stats['skipped_price'], stats['skipped_gap'], stats['skipped_no_data']) == (2, 1, 0)
+    assert stats['sessions'] > 0 and stats['skipped_sessions'] > 0 and not stats['cancelled']
+
+
+def test_daily_prefilter_counts(universe):
+    data, start = universe
+    res = daily_prefilter(data['9000.T'][1], start, END, PARAMS)
+    days = data['9000.T'][1].loc[start.strftime('%Y-%m-%d'):]
+    gap = ((days['Open'] - data['9000.T'][1]['Close'].shift(1).loc[days.index]) / data['9000.T'][1]['Close'].shift(1).loc[days.index])
+    in_range = ((gap >= PARAMS['g_min']) & (gap <= PARAMS['g_max'])).sum()
+    assert res['reason'] is None and res['sessions'] == in_range and res['sessions'] + res['skipped_sessions'] == len(days)
+    assert daily_prefilter(data['9001.T'][1], start, END, PARAMS)['reason'] == 'price'
+    assert daily_prefilter(data['9003.T'][1], start, END, PARAMS)['reason'] == 'gap'
+    assert daily_prefilter(data['9000.T'][1].iloc[:0], start, END, PARAMS)['reason'] == 'no_data'
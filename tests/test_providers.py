@@ -0,0 +1,55 @@
+from datetime import datetime
+import pandas as pd
+import pytest
+import market_data
+from bar_store import ParquetBarStore
+from benchmark import make_synthetic_universe
+from providers import LocalFileProvider, ProviderError, make_provider
+from ranking import load_bars
+
+# 提供元の切り替えと取得失敗の扱い (ネットワークなし)
+
+START, END = datetime(2026, 1, 5), datetime(2026, 3, 31)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    root = str(tmp_path / "archive")
+    universe = make_synthetic_universe(3, 20, seed=3)
+    for t, (intraday, daily) in universe.items(): LocalFileProvider(root).save(t, intraday, daily)
+    return root, list(universe)
+
+
+def test_unknown_ticker_raises_provider_error(archive):
+    root, tickers = archive
+    prov = LocalFileProvider(root)
+    with pytest.raises(ProviderError) as e: prov.intraday("0000.T", START, END)
+    assert e.value.ticker == "0000.T" and e.value.provider == "local"
+    with pytest.raises(ProviderError): prov.daily("0000.T", START, END)
+    assert len(prov.intraday(tickers[0], START, END)) == 20 * 60
+
+
+def test_tz_aware_period_matches_naive(archive):
+    root, tickers = archive
+    prov = LocalFileProvider(root)
+    naive = prov.intraday(tickers[0], datetime(2026, 2, 10), None)
+    assert len(naive) and naive.index[0] >= pd.Timestamp("2026-02-10", tz="Asia/Tokyo")
+    pd.testing.assert_frame_equal(prov.intraday(tickers[0], pd.Timestamp("2026-02-10", tz="Asia/Tokyo"), None), naive)
+    pd.testing.assert_frame_equal(prov.intraday(tickers[0], pd.Timestamp("2026-02-09 15:00", tz="UTC"), None), naive)   # 東京 2/10 0:00
+    end = pd.Timestamp("2026-02-20 06:00", tz="UTC")
+    pd.testing.assert_frame_equal(prov.intraday(tickers[0], START, end), prov.intraday(tickers[0], START, datetime(2026, 2, 20, 15)))
+    pd.testing.assert_frame_equal(prov.daily(tickers[0], pd.Timestamp("2026-02-10 09:30", tz="Asia/Tokyo"), None), prov.daily(tickers[0], datetime(2026, 2, 10), None))
+
+
+def test_load_bars_skips_failed_tickers(archive, monkeypatch, tmp_path):
+    root, tickers = archive
+    monkeypatch.setattr(market_data, "BAR_STORE", ParquetBarStore(str(tmp_path / "store")))
+    monkeypatch.setattr(market_data, "PROVIDER", make_provider(f"local:{root}"))
+    errors = []
+    data = load_bars([tickers[0], "0000.T", tickers[1]], START, END, errors_out=errors)
+    assert [t for t, _, _ in data] == tickers[:2]
+    assert [e.ticker for e in errors] == ["0000.T"] and all(isinstance(e, ProviderError) for e in errors)
+
+
+def test_make_provider_rejects_unknown_spec():
+    with pytest.raises(ValueError): make_provider("ftp:somewhere")
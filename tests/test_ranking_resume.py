@@ -0,0 +1,87 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+import market_data
+from bar_store import ParquetBarStore
+from backtest_engine import DEFAULT_PARAMS
+from benchmark import make_synthetic_universe
+from providers import LocalFileProvider
+from ranking import TopK, rank_frame, scan_ranking
+
+# ランキングの途中経過 (上位 k 件) と、中止したスキャンを続きから再開した結果が1回で全銘柄をスキャンした結果と同じであること
+
+PARAMS = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05, p_min=0, p_max=100_000)
+END = datetime(2026, 3, 31)
+RESAMPLES = 200
+
+
+def test_topk_matches_rank_frame_head():
+    rng = np.random.default_rng(0)
+    values = rng.choice([0.001, 0.002, 0.003, np.nan, None], size=60)   # 同値と NaN / None を多く含める
+    rows = [{'銘柄コード': f"{9000 + i}.T", '期待値': v} for i, v in enumerate(values)]
+    for k in (1, 5, 20, 59, 60, 80):
+        top = TopK(k, '期待値')
+        for row in rows: top.push(row)
+        assert len(top) == min(k, len(rows))
+        expected = rank_frame(rows).head(k)
+        assert list(top.frame()['銘柄コード']) == list(expected['銘柄コード'])
+
+
+@pytest.fixture
+def archive(monkeypatch, tmp_path):
+    root = str(tmp_path / "archive")
+    universe = make_synthetic_universe(8, 15, seed=9)
+    for t, (intraday, daily) in universe.items(): LocalFileProvider(root).save(t, intraday, daily)
+    monkeypatch.setattr(market_data, "PROVIDER", LocalFileProvider(root))
+    monkeypatch.setattr(market_data, "BAR_STORE", ParquetBarStore(str(tmp_path / "store")))
+    start = next(iter(universe.values()))[0].index[0].tz_localize(None).normalize().to_pydatetime()
+    return root, universe, start
+
+
+def _scan(tickers, start, partial, **kw):
+    """アプリと同じ再開の手順: 確定していない銘柄だけをスキャンし、on_done の行を partial に貯める。"""
+    def on_done(t, row):
+        partial['done'].add(t)
+        if row: partial['rows'][t] = row
+    remaining = [t for t in tickers if t not in partial['done']]
+    errors = []
+    _, stats = scan_ranking(remaining, start, END, PARAMS, on_done=on_done, errors_out=errors, resamples=RESAMPLES, concurrency=2, **kw)
+    return stats, errors
+
+
+def _merged(tickers, partial):
+    return rank_frame([partial['rows'][t] for t in tickers if t in partial['rows']]).reset_index(drop=True)
+
+
+def test_stop_and_resume_equals_full_scan(archive):
+    _, universe, start = archive
+    tickers = list(universe)
+    full, _ = scan_ranking(tickers, start, END, PARAMS, resamples=RESAMPLES)
+    assert len(full) >= 3
+    partial = {'done': set(), 'rows': {}}
+    stats, _ = _scan(tickers, start, partial, should_stop=lambda: len(partial['done']) >= 3)
+    assert stats['cancelled'] and 3 <= len(partial['done']) < len(tickers)
+    stats, _ = _scan(tickers, start, partial)
+    assert not stats['cancelled'] and partial['done'] == set(tickers)
+    pd.testing.assert_frame_equal(_merged(tickers, partial), full.reset_index(drop=True), check_exact=True)
+
+
+def test_failed_fetches_are_retried_on_resume(archive):
+    root, universe, start = archive
+    tickers = list(universe) + ["0000.T", "0001.T"]
+    full, _ = scan_ranking(list(universe), start, END, PARAMS, resamples=RESAMPLES)
+    # 0000.T は日足も5分足もない (日足の取得で失敗)、0001.T は日足だけある (5分足の取得で失敗)
+    intraday, daily = next(iter(universe.values()))
+    LocalFileProvider(root).save("0001.T", daily=daily)
+    partial = {'done': set(), 'rows': {}}
+    stats, errors = _scan(tickers, start, partial)
+    assert not stats['cancelled'] and partial['done'] == set(universe)
+    assert sorted(e.ticker for e in errors) == ["0000.T", "0001.T"]
+    # 取得できるようになってから再開すると、失敗した銘柄だけを取り直す
+    LocalFileProvider(root).save("0000.T", *universe[tickers[1]]); LocalFileProvider(root).save("0001.T", intraday)
+    stats, errors = _scan(tickers, start, partial)
+    assert not errors and partial['done'] == set(tickers)
+    expected, _ = scan_ranking(tickers, start, END, PARAMS, resamples=RESAMPLES)
+    pd.testing.assert_frame_equal(_merged(tickers, partial), expected.reset_index(drop=True), check_exact=True)
+    assert {"0000.T", "0001.T"} <= set(expected['銘柄コード']) and set(full['銘柄コード']) < set(expected['銘柄コード'])
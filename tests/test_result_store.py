@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from benchmark import make_synthetic_universe
+from market_data import build_daily_stats_maps
+from result_store import SWEEP_FLOAT32_COLS, TRADE_FLOAT32_COLS, CompactFrame, ResultStore, SessionResults
+from sweep import grid_from_spec, run_sweep
+
+# 省メモリ保存した結果セットを戻すと、保存前の DataFrame と同じ値になること
+
+
+@pytest.fixture(scope='module')
+def res_df():
+    params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05)
+    frames = [run_ticker_simulation(t, i, *build_daily_stats_maps(d.copy()), params).to_frame()
+              for t, (i, d) in make_synthetic_universe(4, 15, seed=5).items()]
+    df = pd.concat(frames, ignore_index=True)
+    df.loc[1, 'PnL'] = np.nan; df.loc[2, 'Ticker'] = None   # 欠けた値も含める
+    return df
+
+
+def _plain(df):
+    """文字列・カテゴリー列を object にそろえる (保存後は文字列列がカテゴリーになるため)。"""
+    return df.astype({c: object for c in df.columns if df[c].dtype == object or isinstance(df[c].dtype, (pd.CategoricalDtype, pd.StringDtype))})
+
+
+def test_round_trip_equals_original(res_df):
+    cf = CompactFrame(res_df, float32_cols=TRADE_FLOAT32_COLS)
+    out = cf.frame()
+    assert len(cf) == len(res_df) and cf.key and not cf.empty
+    assert isinstance(out['Ticker'].dtype, pd.CategoricalDtype) and cf._cols['Ticker'][1].dtype == np.int8
+    exact = [c for c in res_df.columns if c not in TRADE_FLOAT32_COLS]
+    pd.testing.assert_frame_equal(_plain(out[exact]), _plain(res_df[exact]), check_exact=True)
+    # float32 にした列は表示用なので float32 の精度で一致すればよい
+    for c in TRADE_FLOAT32_COLS:
+        assert out[c].dtype == np.float64
+        np.testing.assert_allclose(out[c], res_df[c], rtol=1e-6)
+    assert cf.nbytes < res_df.memory_usage(deep=True).sum()
+
+
+def test_sweep_keeps_metric_and_count_dtypes():
+    data = [(t, i, build_daily_stats_maps(d.copy())) for t, (i, d) in make_synthetic_universe(3, 10, seed=5).items()]
+    grid = grid_from_spec({'masks': [0, 15], 'g_min': [-0.05, -0.005], 'g_max': [0.05], 'ts_start': [0.003, 0.008], 'sl_fix': [-0.004, -0.01]}, DEFAULT_PARAMS)
+    sdf = run_sweep(data, grid, DEFAULT_PARAMS)
+    assert len(sdf) and set(SWEEP_FLOAT32_COLS) <= set(sdf.columns)
+    cf = CompactFrame(sdf, float32_cols=SWEEP_FLOAT32_COLS)
+    out = cf.frame()
+    # 回数 (整数)・勝率・PF・期待値 とフラグ・時刻の列は元の型・値のまま (期待値順の並びも変わらない)
+    exact = [c for c in sdf.columns if c not in SWEEP_FLOAT32_COLS]
+    pd.testing.assert_frame_equal(_plain(out[exact]), _plain(sdf[exact]), check_exact=True)
+    assert out['回数'].dtype == sdf['回数'].dtype and out['期待値'].dtype == np.float64
+    for c in SWEEP_FLOAT32_COLS: np.testing.assert_allclose(out[c], sdf[c], rtol=1e-6)
+
+
+def test_round_trip_columns_rows_and_index(res_df):
+    cf = CompactFrame(res_df)
+    rows = np.array([5, 0, 3])
+    pd.testing.assert_frame_equal(_plain(cf.frame(['PnL', 'Ticker'], rows)), _plain(res_df[['PnL', 'Ticker']].iloc[rows]), check_index_type=False)
+    ranked = res_df.groupby('Ticker')[['PnL']].mean().sort_values('PnL')   # RangeIndex 以外のインデックス
+    pd.testing.assert_frame_equal(CompactFrame(ranked).frame(), ranked, check_exact=True)
+    assert CompactFrame(res_df.iloc[:0]).frame().empty
+
+
+def test_same_contents_are_shared_and_sessions_capped(res_df):
+    store = ResultStore()
+    a, b = SessionResults(store=store), SessionResults(store=store)
+    assert a.put('res', res_df) is b.put('res', res_df.copy()) and store.shared == 1
+    pd.testing.assert_frame_equal(_plain(a.frame('res')), _plain(res_df), check_exact=True)
+    small = SessionResults(max_bytes=a.nbytes + 1, store=store)
+    small.put('old', res_df); small.put('new', res_df.iloc[:10])
+    assert small.evicted == ['old'] and 'new' in small and len(small) == 1
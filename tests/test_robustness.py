@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+from robustness import METRICS, bootstrap_table, bootstrap_trades
+from ranking import RANK_CI_COLS, ranking_rows
+from trade_buffer import TradeBuffer, summarize_pnl
+
+# ブートストラップの信頼区間: 乱数の種が同じなら同じ値、抽出 0 回なら点推定だけ
+
+
+def _pnl(n, seed):
+    return np.random.default_rng(seed).normal(0.001, 0.01, n)
+
+
+def _buffer(ticker, pnl):
+    buf = TradeBuffer()
+    for k, p in enumerate(pnl): buf.append(ticker, k, k + 1, p, 100.0, 100.0 * (1 + p), "時間切れ", "E：他タイプ", 0.0, 100.0, 100.0, 100.0, 0.5)
+    return buf
+
+
+def test_seeded_bootstrap_is_deterministic():
+    groups = [('a', _pnl(40, 1)), ('b', _pnl(40, 2)), ('c', _pnl(25, 3))]
+    t1 = bootstrap_table(groups, n_resamples=500, seed=7)
+    t2 = bootstrap_table(groups, n_resamples=500, seed=7)
+    pd.testing.assert_frame_equal(t1, t2)
+    assert not t1.equals(bootstrap_table(groups, n_resamples=500, seed=8))
+    # 系列の値は一緒に計算する他の系列によらない
+    same_len = [(g, _pnl(37, k)) for k, g in enumerate('xyz')]   # トレード数が同じ系列はまとめて抽出する
+    together = bootstrap_table(groups + same_len, n_resamples=500, seed=7)
+    for g, p in groups + same_len:
+        pd.testing.assert_frame_equal(bootstrap_table([(g, p)], n_resamples=500, seed=7), together.loc[[g]], check_exact=True)
+    for m in METRICS: assert (t1[f"{m}下限"] <= t1[f"{m}上限"]).all()
+
+
+def test_point_estimates_match_summary():
+    pnl = np.r_[_pnl(30, 4), np.nan]
+    tab = bootstrap_table([('a', pnl)], n_resamples=200)
+    s = summarize_pnl(pnl[:-1])
+    assert tab.loc['a', '回数'] == 30
+    for m in ('勝率', 'PF', '期待値'): assert np.isclose(tab.loc['a', m], s[m])
+    assert tab.loc['a', '期待値下限'] <= tab.loc['a', '期待値'] <= tab.loc['a', '期待値上限']
+
+
+def test_zero_resamples_gives_point_estimates_only():
+    groups = [('a', _pnl(30, 5)), ('b', np.zeros(0))]
+    tab = bootstrap_table(groups, n_resamples=0)
+    pd.testing.assert_series_equal(tab.loc['a', METRICS], bootstrap_table(groups, n_resamples=100).loc['a', METRICS])
+    assert tab[[f"{m}{s}" for m in METRICS for s in ('下限', '上限')]].isna().all().all()
+    assert tab.loc['b', '回数'] == 0
+    # ランキングは信頼区間の列を加えない
+    items = [('9000.T', _buffer('9000.T', _pnl(10, 6)), 0.01)]
+    assert not set(RANK_CI_COLS) & set(ranking_rows(items, resamples=0)[0])
+    assert set(RANK_CI_COLS) <= set(ranking_rows(items, resamples=100)[0])
+
+
+def test_bootstrap_trades_adds_portfolio_row():
+    df = pd.concat([_buffer(t, _pnl(20, k)).to_frame() for k, t in enumerate(['9000.T', '9001.T'])])
+    tab = bootstrap_trades(df, n_resamples=100, portfolio="全体")
+    assert list(tab.index) == ['9000.T', '9001.T', '全体'] and tab.loc['全体', '回数'] == 40
+    assert bootstrap_trades(df.iloc[:0], n_resamples=100).empty
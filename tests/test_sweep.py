@@ -0,0 +1,45 @@
+import itertools
+from datetime import time
+import pytest
+from backtest_engine import DEFAULT_PARAMS
+from benchmark import make_synthetic_universe
+from market_data import build_daily_stats_maps
+from sweep import grid_from_spec, mask_to_flags, parse_grid, parse_time_grid, run_sweep
+from direct import assert_metrics_match, direct_metrics
+
+# グリッドサーチの各組み合わせの集計が、その組み合わせで直接シミュレーションした結果と同じであることの確認
+
+KEYS = ('start_t', 'end_t', 'g_min', 'g_max', 'ts_start', 'ts_width', 'sl_fix', 'atr_mul', 'atr_min')
+
+
+@pytest.fixture(scope='module')
+def data():
+    return [(t, i, build_daily_stats_maps(d.copy())) for t, (i, d) in make_synthetic_universe(4, 12, seed=31).items()]
+
+
+@pytest.mark.parametrize('u_atr', [False, True])
+def test_sweep_matches_direct_runs(data, u_atr):
+    base = dict(DEFAULT_PARAMS, u_atr=u_atr)
+    grid = {'masks': [0, 5, 15], 'start_t': [time(9, 0), time(9, 10)], 'end_t': [time(9, 30)], 'g_min': [-0.05, -0.005], 'g_max': [0.05],
+            'ts_start': [0.003, 0.008], 'ts_width': [0.002], 'sl_fix': [-0.004, -0.01], 'atr_mul': [1.0, 2.0], 'atr_min': [0.004]}
+    sdf = run_sweep(data, grid, base)
+    assert sdf['期待値'].is_monotonic_decreasing
+    got = {tuple(r[k] for k in ('u_vwap', 'u_ema', 'u_rsi', 'u_macd') + KEYS): r for r in sdf.to_dict('records')}
+    stops = itertools.product(grid['sl_fix'], grid['atr_mul'], grid['atr_min']) if u_atr else [(v, base['atr_mul'], base['atr_min']) for v in grid['sl_fix']]
+    combos = list(itertools.product(grid['masks'], grid['start_t'], grid['end_t'], grid['g_min'], grid['g_max'], grid['ts_start'], grid['ts_width'], stops))
+    n_traded = 0
+    for m, *vals, (sl, am, amin) in combos:
+        params = dict(base, **mask_to_flags(m), **dict(zip(KEYS, vals + [sl, am, amin])))
+        expected = direct_metrics(data, params)
+        key = tuple(params[k] for k in ('u_vwap', 'u_ema', 'u_rsi', 'u_macd') + KEYS)
+        if not expected['回数']: assert key not in got; continue   # トレードのない組み合わせは出力しない
+        assert_metrics_match(got.pop(key), expected, key); n_traded += 1
+    assert not got and n_traded > 0
+
+
+def test_grid_parsing():
+    assert parse_grid("0.3:0.6:0.1") == [0.3, 0.4, 0.5, 0.6]
+    assert parse_grid("0.5, 0.2, 0.5", 0.01) == [0.002, 0.005]
+    assert parse_time_grid("09:00-09:10/5, 09:30") == [time(9, 0), time(9, 5), time(9, 10), time(9, 30)]
+    grid = grid_from_spec({'ts_start': "0.3,0.5", 'masks': "all"}, DEFAULT_PARAMS)
+    assert grid['ts_start'] == [0.3, 0.5] and len(grid['masks']) == 16 and grid['sl_fix'] == [DEFAULT_PARAMS['sl_fix']]
@@ -0,0 +1,61 @@
+import pickle
+import numpy as np
+import pandas as pd
+from trade_buffer import CAT_COLS, COLUMNS, FLOAT_COLS, TradeBuffer
+
+# 列指向のトレードバッファ: to_frame() が従来の「1トレード = 1 dict のリスト」から作った DataFrame と同じであることの確認
+
+REASONS = ["トレーリング", "損切り", "時間切れ"]
+PATTERNS = ["A：反転狙い", "B：押目上昇", "C：ブレイク", "D：上昇継続", "E：他タイプ", "X：未知"]   # 既知でないカテゴリーも混ぜる
+
+
+def _dict_trades(n, seed, ticker):
+    """従来のエンジンが返していた形のトレード (dict のリスト)。"""
+    rng = np.random.default_rng(seed)
+    entry = (pd.Timestamp('2026-02-02 09:05', tz='Asia/Tokyo') + pd.to_timedelta(rng.integers(0, 40, n) * 1440 + rng.integers(0, 10, n) * 5, unit='min')).as_unit('ns')
+    trades = []
+    for k in range(n):
+        in_p = rng.uniform(500, 5000); out_p = in_p * (1 + rng.normal(0, 0.01)); pc = in_p * 0.99
+        trades.append({'Ticker': ticker, 'Entry': entry[k], 'Exit': entry[k] + pd.Timedelta(minutes=int(rng.integers(5, 300))),
+                       'PnL': (out_p - in_p) / in_p, 'In': in_p, 'Out': out_p, 'Reason': REASONS[rng.integers(3)], 'Pattern': PATTERNS[rng.integers(6)],
+                       'Gap(%)': rng.normal(0, 1), 'EntryVWAP': np.nan if k % 7 == 0 else in_p * 0.998, 'PrevClose': pc, 'DayOpen': pc * 1.001, 'SL設定(%)': 0.5})
+    return trades
+
+
+def _buffer(trades):
+    buf = TradeBuffer(capacity=1)
+    for tr in trades:
+        buf.append(tr['Ticker'], tr['Entry'].value, tr['Exit'].value, *(tr[c] for c in ('PnL', 'In', 'Out', 'Reason', 'Pattern', 'Gap(%)', 'EntryVWAP', 'PrevClose', 'DayOpen', 'SL設定(%)')))
+    return buf
+
+
+def _as_objects(df):
+    return df.astype({c: object for c in CAT_COLS})
+
+
+def test_to_frame_matches_list_of_dicts():
+    trades = _dict_trades(50, 1, '9000.T') + _dict_trades(30, 2, '9001.T')
+    got = _buffer(trades).to_frame()
+    expected = pd.DataFrame(trades)
+    assert list(got.columns) == COLUMNS and all(isinstance(got[c].dtype, pd.CategoricalDtype) for c in CAT_COLS)
+    pd.testing.assert_frame_equal(_as_objects(got), _as_objects(expected), check_exact=True)
+
+
+def test_to_frame_uses_buffer_memory():
+    buf = _buffer(_dict_trades(20, 3, '9000.T'))
+    df = buf.to_frame()
+    assert all(np.shares_memory(df[c].to_numpy(), buf.floats) for c in FLOAT_COLS)
+
+
+def test_concat_and_pickle_round_trip():
+    a, b = _dict_trades(10, 4, '9000.T'), _dict_trades(15, 5, '9001.T')
+    both = TradeBuffer.concat([_buffer(a), None, _buffer(b)])
+    pd.testing.assert_frame_equal(_as_objects(both.to_frame()), _as_objects(pd.DataFrame(a + b)), check_exact=True)
+    restored = pickle.loads(pickle.dumps(both))
+    pd.testing.assert_frame_equal(restored.to_frame(), both.to_frame(), check_exact=True)
+    assert [t for t, _ in both.summary_by_ticker()] == ['9000.T', '9001.T']
+
+
+def test_empty_buffer_has_the_columns():
+    df = TradeBuffer().to_frame()
+    assert df.empty and list(df.columns) == COLUMNS
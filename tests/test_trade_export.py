@@ -0,0 +1,49 @@
+import io
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from benchmark import make_synthetic_universe
+from market_data import build_daily_stats_maps
+from report import build_trade_log
+from trade_buffer import TradeBuffer
+from trade_export import downloads, write_frame, write_trade_log
+
+# トレード一覧・詳細ログの書き出し: 分割して書いた結果が従来の一括の書き出しと同じで、
+# ダウンロードボタンに渡す関数の戻り値を st.download_button がそのまま受け取れること
+
+
+@pytest.fixture(scope="module")
+def trades():
+    universe = make_synthetic_universe(6, 30, seed=2)
+    params = dict(DEFAULT_PARAMS, g_min=-0.05, g_max=0.05)
+    df = TradeBuffer.concat([run_ticker_simulation(t, i, *build_daily_stats_maps(d.copy()), params) for t, (i, d) in universe.items()]).to_frame()
+    assert len(df) > 20
+    return df, {t: f"銘柄{t}" for t in universe}
+
+
+def _expected(df, names, kind):
+    if kind == "txt": return build_trade_log(df, names).encode("utf-8")
+    if kind == "csv": return df.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
+    return None
+
+
+@pytest.mark.parametrize("empty", [False, True])
+def test_download_callables_are_supported(trades, empty):
+    df, names = trades
+    df = df.iloc[:0] if empty else df
+    for kind, label, data, file_name, mime in downloads(lambda: df, names):
+        body, _ = convert_data_to_bytes_and_infer_mime(data(), unsupported_error=RuntimeError(f"{kind}: unsupported type"))
+        if kind == "parquet": pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(body)), pd.read_parquet(io.BytesIO(df.to_parquet(index=False))))
+        else: assert body == _expected(df, names, kind)
+
+
+def test_chunked_writes_match_single_pass(trades, tmp_path):
+    df, names = trades
+    for fmt in ("csv", "parquet"):
+        write_frame(df, str(tmp_path / f"a.{fmt}"), fmt=fmt, chunk_rows=7)
+        df.to_csv(tmp_path / "ref.csv", index=False, encoding="utf-8-sig") if fmt == "csv" else df.to_parquet(tmp_path / "ref.parquet", index=False)
+    assert (tmp_path / "a.csv").read_bytes() == (tmp_path / "ref.csv").read_bytes()
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "a.parquet"), pd.read_parquet(tmp_path / "ref.parquet"))
+    buf = io.BytesIO(); write_trade_log(df, names, buf, chunk_rows=5)
+    assert buf.getvalue().decode("utf-8") == build_trade_log(df, names)
@@ -0,0 +1,79 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_engine import DEFAULT_PARAMS, run_ticker_simulation
+from benchmark import make_synthetic_universe
+from market_data import build_daily_stats_maps
+from sweep import mask_to_flags
+from trade_buffer import summarize_pnl
+from walk_forward import make_folds, run_walk_forward, session_dates
+
+# ウォークフォワード: 学習と検証の窓が重ならず、検証の成績は学習期間で選んだパラメータのものであることの確認
+
+GRID = {'masks': [0, 15], 'start_t': [DEFAULT_PARAMS['start_t']], 'end_t': [DEFAULT_PARAMS['end_t']], 'g_min': [-0.05, -0.01], 'g_max': [0.05],
+        'ts_start': [0.003, 0.008], 'ts_width': [0.002], 'sl_fix': [-0.004, -0.01], 'atr_mul': [1.5], 'atr_min': [0.005]}
+BASE = dict(DEFAULT_PARAMS, g_max=0.05, u_atr=False)
+PARAM_COLS = ['u_vwap', 'u_ema', 'u_rsi', 'u_macd', 'g_min', 'ts_start', 'sl_fix']
+
+
+@pytest.fixture(scope='module')
+def data():
+    return [(t, i, build_daily_stats_maps(d.copy())) for t, (i, d) in make_synthetic_universe(4, 20, seed=41).items()]
+
+
+@pytest.fixture(scope='module')
+def trades(data):
+    """組み合わせごとに全期間を直接シミュレーションしたトレード (エントリー日, 損益)。"""
+    out = []
+    for m, g_min, ts_s, sl in itertools.product(GRID['masks'], GRID['g_min'], GRID['ts_start'], GRID['sl_fix']):
+        params = dict(BASE, **mask_to_flags(m), g_min=g_min, ts_start=ts_s, sl_fix=sl)
+        df = pd.concat([run_ticker_simulation(t, i, *maps, params).to_frame() for t, i, maps in data])
+        out.append((params, df['Entry'].dt.strftime('%Y-%m-%d').to_numpy(), df['PnL'].to_numpy()))
+    return out
+
+
+def _window(entry_days, pnl, first, last):
+    return summarize_pnl(pnl[(entry_days >= first) & (entry_days <= last)])
+
+
+def test_make_folds_windows_do_not_overlap():
+    folds = make_folds(20, 8, 4)
+    assert folds == [(0, 8, 12), (4, 12, 16), (8, 16, 20)]
+    assert all(a < b < c for a, b, c in folds)
+    assert make_folds(20, 8, 4, step=2)[1] == (2, 10, 14) and make_folds(10, 8, 4) == []
+
+
+@pytest.mark.parametrize('min_trades', [1, 5])
+def test_oos_rows_use_params_chosen_on_training_window(data, trades, min_trades):
+    folds_df, summary = run_walk_forward(data, GRID, BASE, train_days=8, test_days=4, min_trades=min_trades)
+    dates = session_dates(data)
+    assert summary['folds'] == len(folds_df) == 3 and summary['sessions'] == len(dates) == 20
+    oos = []
+    for row in folds_df.to_dict('records'):
+        assert row['学習開始'] <= row['学習終了'] < row['検証開始'] <= row['検証終了']
+        assert dates.index(row['検証開始']) == dates.index(row['学習終了']) + 1
+        # 学習期間の期待値が最も高い組み合わせ (トレード数が min_trades 以上)
+        scored = [(s, p, e, pnl) for p, e, pnl in trades
+                  if (s := _window(e, pnl, row['学習開始'], row['学習終了']))['回数'] >= min_trades]
+        best = max(scored, key=lambda x: x[0]['期待値'])
+        params, entry_days, pnl = best[1:]
+        assert {c: row[c] for c in PARAM_COLS} == {c: params[c] for c in PARAM_COLS}
+        assert row['学習回数'] == best[0]['回数'] and np.isclose(row['学習期待値'], best[0]['期待値'])
+        test = _window(entry_days, pnl, row['検証開始'], row['検証終了'])
+        assert row['検証回数'] == test['回数']
+        if test['回数']: assert np.isclose(row['検証期待値'], test['期待値']) and np.isclose(row['検証勝率'], test['勝率'])
+        oos.append(pnl[(entry_days >= row['検証開始']) & (entry_days <= row['検証終了'])])
+    total = summarize_pnl(np.concatenate(oos))
+    assert summary['回数'] == total['回数'] and np.isclose(summary['期待値'], total['期待値'])
+
+
+def test_parallel_matches_serial(data):
+    serial = run_walk_forward(data, GRID, BASE, train_days=8, test_days=4, min_trades=1)
+    parallel = run_walk_forward(data, GRID, BASE, train_days=8, test_days=4, min_trades=1, workers=2)
+    pd.testing.assert_frame_equal(parallel[0], serial[0])
+    assert parallel[1] == serial[1]
+
+
+def test_too_few_days_raises(data):
+    with pytest.raises(ValueError): run_walk_forward(data, GRID, BASE, train_days=15, test_days=10)
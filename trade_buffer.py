@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+# --- トレード結果の列指向バッファ ---
+# 1トレード = 1 dict のリストではなく、列ごとの型付き配列に書き込む。
+# Ticker / Pattern / Reason はカテゴリーのコード、Entry / Exit は UTC の ns (int64) で持ち、
+# to_frame() で従来と同じ列の DataFrame (文字列列はカテゴリー型) に変換する。
+
+TZ = 'Asia/Tokyo'
+FLOAT_COLS = ['PnL', 'In', 'Out', 'Gap(%)', 'EntryVWAP', 'PrevClose', 'DayOpen', 'SL設定(%)']
+CAT_COLS = ['Ticker', 'Reason', 'Pattern']
+TIME_COLS = ['Entry', 'Exit']
+COLUMNS = ['Ticker', 'Entry', 'Exit', 'PnL', 'In', 'Out', 'Reason', 'Pattern', 'Gap(%)', 'EntryVWAP', 'PrevClose', 'DayOpen', 'SL設定(%)']
+# 既知のカテゴリー (コードを固定しておくと銘柄間で結合するときに付け替えが不要)
+KNOWN_CATEGORIES = {
+    'Reason': ["トレーリング", "損切り", "時間切れ"],
+    'Pattern': ["A：反転狙い", "B：押目上昇", "C：ブレイク", "D：上昇継続", "E：他タイプ"],
+}
+
+
+def summarize_pnl(pnl):
+    """損益の配列 → 回数・勝率・利益平均・損失平均・PF・期待値 (NaN は回数にだけ含める。pandas の集計と同じ値)。"""
+    pnl = np.asarray(pnl, dtype=np.float64)
+    wins = pnl[pnl > 0]; losses = pnl[pnl <= 0]
+    valid = pnl[~np.isnan(pnl)]
+    loss_sum = losses.sum()
+    return {
+        '回数': len(pnl), '勝率': len(wins)/len(pnl),
+        '利益平均': wins.mean() if wins.size else 0,
+        '損失平均': losses.mean() if losses.size else 0,
+        'PF': wins.sum()/abs(loss_sum) if losses.size and loss_sum != 0 else 9.99,
+        '期待値': valid.mean() if valid.size else np.nan
+    }
+
+
+class TradeBuffer:
+    """トレード結果を列ごとの配列に追記するバッファ。容量が足りなければ倍に広げる。"""
+
+    def __init__(self, capacity=16):
+        self.n = 0
+        self._alloc(max(int(capacity), 1))
+        self.categories = {c: list(KNOWN_CATEGORIES.get(c, [])) for c in CAT_COLS}
+        self._lookup = {c: {v: i for i, v in enumerate(cats)} for c, cats in self.categories.items()}
+
+    def _alloc(self, cap):
+        self.floats = np.full((len(FLOAT_COLS), cap), np.nan)
+        self.times = np.zeros((len(TIME_COLS), cap), dtype=np.int64)
+        self.codes = np.zeros((len(CAT_COLS), cap), dtype=np.int32)
+
+    def _grow(self, need):
+        cap = self.floats.shape[1]
+        if need <= cap: return
+        old = (self.floats, self.times, self.codes)
+        self._alloc(max(need, cap * 2))
+        for new, o in zip((self.floats, self.times, self.codes), old): new[:, :self.n] = o[:, :self.n]
+
+    def __len__(self):
+        return self.n
+
+    def _code(self, col, value):
+        lk = self._lookup[col]
+        if value not in lk: lk[value] = len(self.categories[col]); self.categories[col].append(value)
+        return lk[value]
+
+    def append(self, ticker, entry_ns, exit_ns, pnl, in_p, out_p, reason, pattern, gap_pct, entry_vwap, prev_close, day_open, sl_pct):
+        """1トレード分を追記する (Entry / Exit は UTC の ns)。"""
+        if self.n == self.floats.shape[1]: self._grow(self.n + 1)
+        i = self.n
+        self.floats[:, i] = (pnl, in_p, out_p, gap_pct, entry_vwap, prev_close, day_open, sl_pct)
+        self.times[0, i] = entry_ns; self.times[1, i] = exit_ns
+        self.codes[0, i] = self._code('Ticker', ticker); self.codes[1, i] = self._code('Reason', reason); self.codes[2, i] = self._code('Pattern', pattern)
+        self.n += 1
+
+    def append_columns(self, ticker, entry_ns, exit_ns, floats, reason_codes, pattern_codes):
+        """同じ銘柄の複数トレードを列の配列でまとめて追記する。floats は FLOAT_COLS 順の (8, 件数)、
+        reason_codes / pattern_codes は KNOWN_CATEGORIES の位置。"""
+        k = len(entry_ns)
+        if not k: return self
+        self._grow(self.n + k)
+        a, b = self.n, self.n + k
+        self.floats[:, a:b] = floats; self.times[0, a:b] = entry_ns; self.times[1, a:b] = exit_ns
+        self.codes[0, a:b] = self._code('Ticker', ticker); self.codes[1, a:b] = reason_codes; self.codes[2, a:b] = pattern_codes
+        self.n = b
+        return self
+
+    def extend(self, other):
+        """別のバッファの内容を末尾に追加する (カテゴリーのコードは付け替える)。"""
+        if not len(other): return self
+        self._grow(self.n + other.n)
+        a, b = self.n, self.n + other.n
+        self.floats[:, a:b] = other.floats[:, :other.n]; self.times[:, a:b] = other.times[:, :other.n]
+        for r, c in enumerate(CAT_COLS):
+            remap = np.array([self._code(c, v) for v in other.categories[c]], dtype=np.int32)
+            self.codes[r, a:b] = remap[other.codes[r, :other.n]] if remap.size else 0
+        self.n = b
+        return self
+
+    @classmethod
+    def concat(cls, buffers):
+        buffers = [b for b in buffers if b is not None]
+        out = cls(capacity=sum(len(b) for b in buffers))
+        for b in buffers: out.extend(b)
+        return out
+
+    def column(self, name):
+        """数値列 (FLOAT_COLS) のビュー。"""
+        return self.floats[FLOAT_COLS.index(name), :self.n]
+
+    def summary(self):
+        return summarize_pnl(self.column('PnL'))
+
+    def summary_by_ticker(self):
+        """銘柄ごとの summary を銘柄の登場順に [(銘柄, 集計)] で返す。"""
+        codes = self.codes[0, :self.n]; pnl = self.column('PnL')
+        _, first = np.unique(codes, return_index=True)
+        return [(self.categories['Ticker'][codes[i]], summarize_pnl(pnl[codes == codes[i]])) for i in np.sort(first)]
+
+    def to_frame(self):
+        """従来と同じ列順の DataFrame。数値列は floats の2次元のビューを1つのブロックとして使い (コピーしない)、
+        カテゴリー・時刻の列はその間に差し込む (型の違う列なので数値のブロックとはまとめられない)。"""
+        n = self.n; data = {}
+        for r, c in enumerate(CAT_COLS):
+            data[c] = pd.Categorical.from_codes(self.codes[r, :n], categories=self.categories[c])
+        for r, c in enumerate(TIME_COLS):
+            data[c] = pd.DatetimeIndex(self.times[r, :n].view('datetime64[ns]')).tz_localize('UTC').tz_convert(TZ)
+        df = pd.DataFrame(self.floats[:, :n].T, columns=FLOAT_COLS, copy=False)
+        for i, c in enumerate(COLUMNS):
+            if c in data: df.insert(i, c, data[c])
+        return df
+
+    # プロセス間で送るときは使用中の範囲だけを送る
+    def __getstate__(self):
+        st = dict(self.__dict__); n = self.n
+        st['floats'] = self.floats[:, :n].copy(); st['times'] = self.times[:, :n].copy(); st['codes'] = self.codes[:, :n].copy()
+        del st['_lookup']
+        return st
+
+    def __setstate__(self, st):
+        self.__dict__.update(st)
+        self._lookup = {c: {v: i for i, v in enumerate(cats)} for c, cats in self.categories.items()}
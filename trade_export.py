@@ -0,0 +1,63 @@
+import io
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from report import iter_trade_log, log_order
+
+# --- トレード一覧・詳細ログの書き出し (chunk_rows 行ずつ) ---
+# 全体を1つの文字列 / バイト列にしてから書くのではなく、行の区間ごとに CSV / Parquet (行グループ) / テキストを書き足す。
+# 書き出し先はファイルのパスかバイナリのファイルオブジェクト。spool() は一時ファイル (小さいうちはメモリ) に分割して書いたものを
+# bytes で返す (st.download_button が受け取れる型。関数で渡すと、押されたときだけ作られる)。downloads() はその関数の一覧。
+# CSV は従来の to_csv(index=False, encoding="utf-8-sig")、Parquet は to_parquet(index=False) と同じ内容になる。
+
+EXPORT_CHUNK_ROWS = 50_000
+
+
+def _open(dest, mode):
+    return open(dest, mode) if isinstance(dest, str) else _Unclosed(dest)
+
+
+class _Unclosed:
+    """渡されたファイルオブジェクトを with で閉じないための包み。"""
+    def __init__(self, f): self.f = f
+    def __enter__(self): return self.f
+    def __exit__(self, *exc): return False
+
+
+def write_frame(df, dest, fmt="csv", chunk_rows=EXPORT_CHUNK_ROWS):
+    """DataFrame を dest に CSV (utf-8-sig) / Parquet で chunk_rows 行ずつ書く。"""
+    with _open(dest, "wb") as f:
+        if fmt == "parquet":
+            schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+            with pq.ParquetWriter(f, schema) as w:
+                for a in range(0, max(len(df), 1), chunk_rows):
+                    w.write_table(pa.Table.from_pandas(df.iloc[a:a + chunk_rows], schema=schema, preserve_index=False))
+        else:
+            text = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+            for a in range(0, max(len(df), 1), chunk_rows): df.iloc[a:a + chunk_rows].to_csv(text, index=False, header=a == 0)
+            text.flush(); text.detach()
+    return dest
+
+
+def write_trade_log(res_df, ticker_names, dest, chunk_rows=EXPORT_CHUNK_ROWS):
+    """詳細ログ (build_trade_log と同じテキスト) を dest に UTF-8 で chunk_rows 行ずつ書く。"""
+    with _open(dest, "wb") as f:
+        for piece in iter_trade_log(res_df.iloc[log_order(res_df)], ticker_names, chunk_rows): f.write(piece.encode("utf-8"))
+    return dest
+
+
+def spool(write, *args, max_memory=16 * 1024**2, **kwargs):
+    """write(..., 書き出し先, ...) の出力を一時ファイルに書き、その中身 (bytes) を返す。"""
+    with tempfile.SpooledTemporaryFile(max_size=max_memory) as f:
+        write(*args, f, **kwargs); f.seek(0)
+        return f.read()
+
+
+def downloads(frame, ticker_names):
+    """
+    詳細ログ・トレード一覧のダウンロード [(キー, ラベル, データを作る関数, ファイル名, MIME)]。
+    frame() は書き出す行の DataFrame を返す関数 (ボタンが押されたときだけ呼ばれる)。
+    """
+    return [("txt", "📄 詳細ログ (テキスト)", lambda: spool(write_trade_log, frame(), ticker_names), "trade_log.txt", "text/plain"),
+            ("csv", "🧾 トレード (CSV)", lambda: spool(write_frame, frame(), fmt="csv"), "trades.csv", "text/csv"),
+            ("parquet", "🗃 トレード (Parquet)", lambda: spool(write_frame, frame(), fmt="parquet"), "trades.parquet", "application/octet-stream")]
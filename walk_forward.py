@@ -0,0 +1,81 @@
+from bisect import bisect_right
+import numpy as np
+import pandas as pd
+from sweep import ACC_KEYS, sweep_stats, sweep_combos, acc_metrics, combo_params
+from parallel_scan import parallel_chunks
+
+# --- ウォークフォワード検証 ---
+# 全銘柄の場中の日を古い順に並べ、学習 train_days 日 → 検証 test_days 日 の窓を step 日ずつずらした fold を作る。
+# 各 fold で学習期間の期待値が最も高いパラメータ (学習期間のトレード数が min_trades 以上) を選び、
+# 直後の検証期間 (サンプル外) での 回数・勝率・PF・期待値 を求める。
+# グリッドサーチの集計は足し合わせられるので、fold の境界で区切った区間ごとの集計を全銘柄について1回だけ求め、
+# 各 fold の学習/検証の値は区間の和で作る (銘柄ごとのインジケーター・場中配列の準備は全 fold で共有)。
+# 並列化は銘柄単位のプロセス並列で、各ワーカーが担当銘柄の区間集計を返し、親で合計する。
+
+TZ = 'Asia/Tokyo'
+
+
+def session_dates(data):
+    """data ([(銘柄, 5分足, 日足マップ)]) に含まれる日付 (東京時間、'YYYY-MM-DD') を古い順に。"""
+    dates = set()
+    for _, df, _ in data:
+        if df.empty: continue
+        idx = df.index.tz_localize('UTC') if df.index.tz is None else df.index
+        dates.update(idx.tz_convert(TZ).strftime('%Y-%m-%d'))
+    return sorted(dates)
+
+
+def make_folds(n_dates, train_days, test_days, step=None):
+    """日の位置で表した fold [(学習開始, 検証開始, 検証終了)] (終了は含まない)。"""
+    step = step or test_days
+    return [(i, i + train_days, i + train_days + test_days) for i in range(0, n_dates - train_days - test_days + 1, step)]
+
+
+# fold の境界で日を区間に分ける → ({日付: 区間番号}, 区間数, fold ごとの (学習の区間, 検証の区間))
+def _segments(dates, folds):
+    bounds = sorted({b for f in folds for b in f})
+    seg_of = lambda p: bisect_right(bounds, p) - 1
+    segments = {d: seg_of(p) for p, d in enumerate(dates) if bounds[0] <= p < bounds[-1]}
+    fold_segs = [(list(range(seg_of(a), seg_of(b - 1) + 1)), list(range(seg_of(b), seg_of(c - 1) + 1))) for a, b, c in folds]
+    return segments, len(bounds) - 1, fold_segs
+
+
+def run_walk_forward(data, grid, base_params, train_days, test_days, step=None, min_trades=10, workers=1):
+    """
+    data: [(銘柄, 5分足, (p_map, o_map, a_map))]、grid: sweep.run_sweep と同じ形式。
+    戻り値: (fold ごとの 期間・選んだパラメータ・学習/検証の成績 の DataFrame,
+             全 fold の検証期間を合わせた成績 {'folds', 'sessions', '回数', '勝率', 'PF', '期待値', '学習期待値' (各 fold の平均)})
+    """
+    dates = session_dates(data)
+    folds = make_folds(len(dates), train_days, test_days, step)
+    if not folds: raise ValueError(f"日数 ({len(dates)} 日) が 学習 + 検証 ({train_days + test_days} 日) より少ないため fold を作れません")
+    segments, n_seg, fold_segs = _segments(dates, folds)
+    args = (grid, base_params, segments, n_seg)
+    if workers > 1:
+        acc = None
+        for part in parallel_chunks(data, sweep_stats, args, workers):
+            acc = part if acc is None else {k: acc[k] + part[k] for k in ACC_KEYS}
+    else: acc = sweep_stats(data, *args)
+
+    entry_combos, X = sweep_combos(grid, base_params)
+    rows = []; oos = {k: 0.0 for k in ACC_KEYS}
+    for f, ((a, b, c), (tr_segs, te_segs)) in enumerate(zip(folds, fold_segs), 1):
+        row = {'Fold': f, '学習開始': dates[a], '学習終了': dates[b - 1], '検証開始': dates[b], '検証終了': dates[c - 1]}
+        tr = {k: acc[k][tr_segs].sum(axis=0) for k in ACC_KEYS}
+        _, pf_tr, exp_tr = acc_metrics(**tr)
+        score = np.where((tr['cnt'] >= max(min_trades, 1)) & ~np.isnan(exp_tr), exp_tr, -np.inf)
+        if not np.isfinite(score).any(): rows.append(row); continue
+        ei, xi = np.unravel_index(np.argmax(score), score.shape)
+        row.update({k: v[0] for k, v in combo_params(entry_combos, X, np.array([ei]), np.array([xi])).items()})
+        row.update({'学習回数': int(tr['cnt'][ei, xi]), '学習PF': pf_tr[ei, xi], '学習期待値': exp_tr[ei, xi]})
+        te = {k: acc[k][te_segs, ei, xi].sum() for k in ACC_KEYS}
+        wr, pf, exp = acc_metrics(**te)
+        row.update({'検証回数': int(te['cnt']), '検証勝率': float(wr), '検証PF': float(pf), '検証期待値': float(exp)})
+        for k in ACC_KEYS: oos[k] += te[k]
+        rows.append(row)
+
+    folds_df = pd.DataFrame(rows)
+    wr, pf, exp = acc_metrics(**{k: np.float64(v) for k, v in oos.items()})
+    summary = {'folds': len(folds), 'sessions': len(dates), '回数': int(oos['cnt']), '勝率': float(wr), 'PF': float(pf), '期待値': float(exp),
+               '学習期待値': float(folds_df['学習期待値'].mean()) if '学習期待値' in folds_df else float('nan')}
+    return folds_df, summary